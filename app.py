@@ -1,86 +1,736 @@
-APP_VERSION = "2025-08-15_1"  # atualize a cada mudança
-st.sidebar.caption(f"Versão do app: {APP_VERSION}")
+APP_VERSION = "2026-10-17_37"  # atualize a cada mudança
+
+import time
+_T_INICIO = time.perf_counter()  # início deste rerun (tempos na página Desempenho)
 
 import os
+import re
 import json
-from datetime import datetime, date
+import logging
+import threading
+import unicodedata
+from collections import deque
+from datetime import datetime, date, timedelta
 from io import BytesIO
 
 import pandas as pd
 import streamlit as st
-from supabase import create_client, Client
+
+from arquivo import ArquivoAuditoria
+from auditoria import AuditWriter
+from consultas import (ATIVACAO_CASA, ATIVACOES, AUDITORIA_FACETAS, CASAS, CASAS_CADASTRO, ESTADO_AJUSTE, ESTADO_CASA, ESTADO_RESUMO, ETAPAS, LANC_BUSCA, LANC_CASAS,
+                       LANC_CORRECAO, LANC_OBSERVACOES, OBRAS, SERVICOS, USUARIOS, MedidorBytes, ativacoes_obra, casas_com_lancamentos,
+                       lancamentos_servico, ler_paginado, paginar, sugestoes, tabela_observacoes)
+from desempenho import Rastreador, jsonl as traco_jsonl, por_rerun, por_tabela
+from fila import Adiar, FilaEscrita
+from fotos import caminhos, guardar_original, hash_da_url, hash_foto, original, reduzir, url_miniatura
+from backend import SqliteBackend, SupabaseBackend, radical
+from indices import IndiceAtivacoes, Rotulos
+from lotes import MAX_BYTES, WORKERS, erro_transitorio, upsert_em_lotes
+from relatorio import CORES, exportar_xlsx, previsto_executado
+from resumo import MARGEM_S, ResumoIncremental, agregar, ts_utc
+from snapshot import compactar, memoria
+from importacao import ESQUEMA_CASAS, ESQUEMA_SERVICOS, ler_planilha, preparar_casas, preparar_servicos, registros as registros_importacao
+_T_IMPORTS = time.perf_counter()
 
 # -------------------- CONFIG --------------------
 st.set_page_config(page_title="Acompanhamento de Obras", page_icon="🏗️", layout="wide")
+st.sidebar.caption(f"Versão do app: {APP_VERSION}")
 
-SUPABASE_URL = st.secrets.get("SUPABASE_URL", os.getenv("SUPABASE_URL"))
-SUPABASE_ANON_KEY = st.secrets.get("SUPABASE_ANON_KEY", os.getenv("SUPABASE_ANON_KEY"))
-SUPABASE_BUCKET = st.secrets.get("SUPABASE_BUCKET", os.getenv("SUPABASE_BUCKET", "obra-uploads"))
-
-if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+@st.cache_resource
+def _segredos():
+    # secrets.toml lido uma vez por processo (mudou? reinicie o app); sem o
+    # arquivo, valem só as variáveis de ambiente
+    return st.secrets.to_dict() if st.secrets.load_if_toml_exists() else {}
+
+def _cfg(nome, padrao=None):
+    # Secrets > variável de ambiente > padrão
+    return _segredos().get(nome, os.getenv(nome, padrao))
+
+@st.cache_resource
+def tempos_app():
+    # partida do processo (1º rerun) e, por rerun, o tempo até o menu
+    return {"partida": {}, "menu_ms": deque(maxlen=1000)}
+
+SUPABASE_URL = _cfg("SUPABASE_URL")
+SUPABASE_ANON_KEY = _cfg("SUPABASE_ANON_KEY")
+SUPABASE_BUCKET = _cfg("SUPABASE_BUCKET", "obra-uploads")
+# "supabase" (padrão) ou "sqlite" (obra sem internet / benchmarks)
+DB_BACKEND = str(_cfg("DB_BACKEND", "supabase")).lower()
+SQLITE_PATH = _cfg("SQLITE_PATH", "db.sqlite3")
+
+@st.cache_resource
+def _backend(nome):
+    # Um por processo, não a cada rerun: no SQLite, schema/índices criados uma
+    # vez e conexões por thread; no Supabase, o cliente (e o import do pacote,
+    # ~0,5 s, só quando for usado).
+    if nome == "sqlite":
+        return SqliteBackend(SQLITE_PATH)
+    from supabase import create_client
+    return SupabaseBackend(create_client(SUPABASE_URL, SUPABASE_ANON_KEY), bucket=SUPABASE_BUCKET)
+
+if DB_BACKEND != "sqlite" and (not SUPABASE_URL or not SUPABASE_ANON_KEY):
     st.error("Config do Supabase ausente. Preencha SUPABASE_URL e SUPABASE_ANON_KEY nos Secrets.")
     st.stop()
+db = _backend(DB_BACKEND)
+_T_BACKEND = time.perf_counter()
+
+# -------------------- Cache de dados de referência --------------------
+# obras/etapas/servicos/casas (e ativações) mudam pouco e são lidas em toda
+# reexecução; guardamos por processo (compartilhado entre sessões) com TTL.
+REF_TABLES = ("obras", "etapas", "servicos", "casas", "casa_ativacoes")
+REF_CACHE_TTL = float(_cfg("REF_CACHE_TTL", "60"))
+# exclusões em cascata (ON DELETE CASCADE) invalidam as tabelas filhas
+_REF_DEPENDENTES = {"obras": ("etapas", "servicos", "casas", "casa_ativacoes"), "casas": ("casa_ativacoes",)}
+
+# DataFrames do cache são compartilhados entre sessões: com copy-on-write,
+# alterar uma cópia rasa nunca escreve no original
+pd.set_option("mode.copy_on_write", True)
+
+@st.cache_resource
+def _ref_cache():
+    # geracoes: por tabela, quantas invalidações já houve (ver ref_cache_put)
+    return {"lock": threading.Lock(), "data": {}, "hits": 0, "misses": 0, "invalidacoes": 0, "versao": 0, "geracoes": {}}
+
+# referência direta: o cache também é invalidado por threads de fundo (feed,
+# fila), que não podem chamar o getter do st.cache_resource
+_ref = _ref_cache()
+
+def _ref_key(table, select, filters, order, limit):
+    return (table, select, json.dumps(filters, sort_keys=True, default=str), json.dumps(order, default=str), limit)
+
+def ref_cache_get(key):
+    # -> (linhas, versão da entrada) ou None
+    c = _ref
+    with c["lock"]:
+        item = c["data"].get(key)
+        if item is not None and time.monotonic() - item["ts"] < REF_CACHE_TTL:
+            c["hits"] += 1
+            return list(item["rows"]), item["versao"]
+        c["misses"] += 1
+        return None
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+def ref_cache_geracao(table):
+    # tirar antes de ler do banco e passar para ref_cache_put
+    c = _ref
+    with c["lock"]:
+        return c["geracoes"].get(table, 0)
+
+def ref_cache_put(key, rows, geracao):
+    # Uma escrita pode invalidar a tabela entre a leitura e o put: as linhas
+    # lidas antes dela não entram no cache (voltam sem versão, como fora de
+    # REF_TABLES), senão seriam servidas a todas as sessões até o TTL.
+    c = _ref
+    with c["lock"]:
+        if c["geracoes"].get(key[0], 0) != geracao:
+            return None
+        c["versao"] += 1
+        c["data"][key] = {"ts": time.monotonic(), "rows": list(rows), "derivados": {}, "versao": c["versao"]}
+        return c["versao"]
+
+def ref_cache_derivado(key, versao, nome, builder):
+    # objeto derivado (ex.: índice) das linhas lidas na versão `versao`: montado
+    # uma vez e guardado na entrada só se ela ainda for dessa versão
+    c = _ref
+    with c["lock"]:
+        item = c["data"].get(key)
+        if item is not None and item["versao"] == versao:
+            if nome not in item["derivados"]:
+                item["derivados"][nome] = builder()
+            return item["derivados"][nome]
+    # entrada invalidada ou substituída depois da leitura: o derivado destas
+    # linhas não pode ficar preso à versão nova, então não vai para o cache
+    return builder()
+
+def ref_df(q, filters=None, limit=None):
+    # DataFrame da tabela de referência (projeção q, ver consultas.py) montado
+    # uma vez por versão do cache (ids int32, textos repetitivos como category)
+    # e compartilhado entre as sessões; cada chamada recebe só uma cópia rasa.
+    rows, versao = sb_consulta_versao(q, filters=filters, limit=limit)
+    key = _ref_key(q.tabela, q.select, filters, q.ordem, limit)
+    df = ref_cache_derivado(key, versao, "df", lambda: compactar(rows, list(q.colunas)))
+    return df.copy(deep=False)
+
+def ref_rotulos(q, coluna="nome", filters=None):
+    # format_func dos selectbox (id -> texto), por versão do cache
+    rows, versao = sb_consulta_versao(q, filters=filters)
+    key = _ref_key(q.tabela, q.select, filters, q.ordem, None)
+    return ref_cache_derivado(key, versao, ("rotulos", coluna), lambda: Rotulos(rows, coluna))
+
+def ref_cache_invalidate(table=None):
+    if table is not None and table not in REF_TABLES:
+        return
+    tables = set(REF_TABLES) if table is None else {table, *_REF_DEPENDENTES.get(table, ())}
+    c = _ref
+    with c["lock"]:
+        for k in [k for k in c["data"] if k[0] in tables]:
+            del c["data"][k]
+        for t in tables:
+            c["geracoes"][t] = c["geracoes"].get(t, 0) + 1
+        c["invalidacoes"] += 1
+
+def ref_cache_stats():
+    c = _ref
+    with c["lock"]:
+        total = c["hits"] + c["misses"]
+        return {
+            "hits": c["hits"],
+            "misses": c["misses"],
+            "hit_rate": (c["hits"] / total) if total else 0.0,
+            "invalidacoes": c["invalidacoes"],
+            "entradas": len(c["data"]),
+            "versao": c["versao"],
+        }
+
+def ref_cache_memoria():
+    # por tabela: versões em cache, linhas e bytes dos DataFrames compartilhados
+    c = _ref
+    with c["lock"]:
+        itens = [(k[0], item) for k, item in c["data"].items()]
+    out = {}
+    for table, item in itens:
+        t = out.setdefault(table, {"entradas": 0, "linhas": 0, "bytes": 0})
+        t["entradas"] += 1
+        t["linhas"] += len(item["rows"])
+        t["bytes"] += sum(memoria(d) for d in list(item["derivados"].values()) if isinstance(d, pd.DataFrame))
+    return out
 
 # -------------------- Helpers / DB --------------------
-def sb_select(table, select="*", filters=None, order=None, limit=None):
-    q = sb.table(table).select(select)
-    if filters:
-        for k, v in filters.items():
-            if isinstance(v, tuple) and len(v) == 2 and v[0] == "in":
-                q = q.in_(k, v[1])
-            else:
-                q = q.eq(k, v)
-    if order:
-        if isinstance(order, (list, tuple)):
-            for o in order:
-                q = q.order(o)
-        else:
-            q = q.order(order)
-    if limit:
-        q = q.limit(limit)
-    res = q.execute()
-    return res.data or []
+SB_PAGE_SIZE = 1000  # max-rows padrão do PostgREST
+# upserts em lote: requisições simultâneas e tamanho máximo de cada bloco
+UPSERT_WORKERS = int(_cfg("UPSERT_WORKERS", str(WORKERS)))
+UPSERT_MAX_BYTES = MAX_BYTES
+# modo de medição: registra os bytes lidos em cada sb_select (log + painel do admin)
+SB_MEDIR_BYTES = str(_cfg("SB_MEDIR_BYTES", "0")).lower() in ("1", "true", "sim")
+_log = logging.getLogger("obra_app")
+if SB_MEDIR_BYTES and not _log.handlers:
+    _log.addHandler(logging.StreamHandler())
+    _log.setLevel(logging.INFO)
+
+@st.cache_resource
+def medidor_bytes():
+    return MedidorBytes()
+
+@st.cache_resource
+def rastreador():
+    # traço de todas as chamadas sb_* do processo (página Desempenho)
+    return Rastreador()
+
+# Referências do processo em globais do script: as threads de fundo (fila,
+# auditoria, feed, pool de upserts) usam estas, sem chamar os getters do
+# st.cache_resource (fora da thread do script eles avisam "missing
+# ScriptRunContext" a cada chamada).
+_traco = rastreador()
+_medidor = medidor_bytes()
+_traco.novo_rerun()
+
+def _linhas(rows):
+    return len(rows) if isinstance(rows, list) else 0
+
+def _db_select(table, select, **kw):
+    with _traco.medir("select", table, kw.get("filters")) as ev:
+        rows = db.select(table, select=select, **kw)
+        ev["linhas"] = len(rows)
+    if SB_MEDIR_BYTES:
+        n = ev["bytes"] = _medidor.registrar(table, select, rows)
+        _log.info("sb_select %s [%s] %s: %d linhas, %d bytes", table, select, kw.get("filters") or {}, len(rows), n)
+    return rows
+
+def _sb_select_versao(table, select="*", filters=None, order=None, limit=None, desc=False):
+    # -> (linhas, versão do cache em que foram lidas/guardadas; None fora de REF_TABLES)
+    key = None
+    if table in REF_TABLES:
+        key = _ref_key(table, select, filters, (order, desc) if desc else order, limit)
+        cached = ref_cache_get(key)
+        if cached is not None:
+            return cached
+        geracao = ref_cache_geracao(table)
+        if limit is None:
+            # casas e ativações crescem com a obra: em páginas por id, para não
+            # parar no max-rows do PostgREST; o cache guarda a lista inteira
+            rows = ler_paginado(_db_select, table, select, filters=filters, order=order, desc=desc, chunk=SB_PAGE_SIZE)
+            return rows, ref_cache_put(key, rows, geracao)
+    rows = _db_select(table, select, filters=filters, order=order, limit=limit, desc=desc)
+    return rows, (ref_cache_put(key, rows, geracao) if key is not None else None)
+
+def sb_select(table, select="*", filters=None, order=None, limit=None, desc=False):
+    return _sb_select_versao(table, select, filters, order, limit, desc)[0]
+
+def sb_select_iter(table, select="*", filters=None, key="id", desc=False, chunk=SB_PAGE_SIZE, max_rows=None):
+    # páginas por chave (consultas.paginar), cada uma no traço e no medidor
+    return paginar(_db_select, table, select, filters=filters, key=key, desc=desc, chunk=chunk, max_rows=max_rows)
+
+def sb_select_df(table, select="*", filters=None, key="id", desc=False, chunk=SB_PAGE_SIZE, max_rows=None, columns=None):
+    # consome sb_select_iter página a página: só uma página de dicts fica em memória
+    partes = []
+    for rows in sb_select_iter(table, select=select, filters=filters, key=key, desc=desc, chunk=chunk, max_rows=max_rows):
+        df = pd.DataFrame(rows)
+        partes.append(df[[c for c in columns if c in df.columns]] if columns else df)
+    if not partes:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(partes, ignore_index=True)
+
+def sb_consulta(q, filters=None, limit=None):
+    return sb_select(q.tabela, select=q.select, filters=filters, order=q.ordem, limit=limit)
+
+def sb_consulta_versao(q, filters=None, limit=None):
+    # linhas + versão do cache, para derivados (ref_df, ref_rotulos, índices)
+    return _sb_select_versao(q.tabela, select=q.select, filters=filters, order=q.ordem, limit=limit)
+
+def sb_consulta_df(q, filters=None, limit=None):
+    # sempre com as colunas da projeção, mesmo sem linhas
+    return pd.DataFrame(sb_consulta(q, filters=filters, limit=limit), columns=list(q.colunas))
 
 def sb_insert(table, data):
-    res = sb.table(table).insert(data).execute()
-    return res.data or []
+    with _traco.medir("insert", table) as ev:
+        rows = db.insert(table, data)
+        ev["linhas"] = _linhas(rows)
+    ref_cache_invalidate(table)
+    return rows
 
 def sb_upsert(table, data, on_conflict=None):
-    q = sb.table(table).upsert(data)
-    if on_conflict:
-        q = q.on_conflict(on_conflict)
-    res = q.execute()
-    return res.data or []
+    with _traco.medir("upsert", table) as ev:
+        rows = db.upsert(table, data, on_conflict=on_conflict)
+        ev["linhas"] = _linhas(rows)
+    ref_cache_invalidate(table)
+    return rows
+
+def sb_upsert_lotes(table, registros, on_conflict=None, chunk=500, progresso=None, workers=None, max_bytes=UPSERT_MAX_BYTES):
+    # blocos por tamanho num pool de threads, com retry (lotes.py); as workers
+    # herdam a tela/rerun do script no traço de desempenho
+    return upsert_em_lotes(lambda bloco: sb_upsert(table, bloco, on_conflict=on_conflict), registros, chunk=chunk, progresso=progresso,
+                           workers=workers or UPSERT_WORKERS, max_bytes=max_bytes, initializer=_traco.usar, initargs=(_traco.contexto(),))
 
 def sb_update(table, data, filters):
-    q = sb.table(table).update(data)
-    for k, v in filters.items():
-        q = q.eq(k, v)
-    res = q.execute()
-    return res.data or []
+    with _traco.medir("update", table, filters) as ev:
+        rows = db.update(table, data, filters)
+        ev["linhas"] = _linhas(rows)
+    ref_cache_invalidate(table)
+    return rows
 
 def sb_delete(table, filters):
-    q = sb.table(table).delete()
-    for k, v in filters.items():
-        q = q.eq(k, v)
-    res = q.execute()
-    return res.data or []
+    # aceita ("in", [...]) como sb_select, para exclusões em conjunto
+    with _traco.medir("delete", table, filters) as ev:
+        rows = db.delete(table, filters)
+        ev["linhas"] = _linhas(rows)
+    ref_cache_invalidate(table)
+    return rows
+
+def sb_upload(path, data, content_type=None):
+    with _traco.medir("upload", "storage") as ev:
+        url = db.upload(path, data, content_type=content_type)
+        ev["linhas"] = 1
+    return url
+
+def sb_rpc(fn, params):
+    with _traco.medir("rpc", fn) as ev:
+        rows = db.rpc(fn, params)
+        ev["linhas"] = _linhas(rows)
+    return rows
+
+def _rpc_ausente(e):
+    # função não instalada no banco (PostgREST / Postgres)
+    return getattr(e, "code", None) in ("PGRST202", "42883")
+
+def _por_colunas(registros):
+    # PostgREST grava em lote com as colunas da união: quem não tem a coluna
+    # receberia null. Agrupa por conjunto de colunas para não apagar nada.
+    grupos = {}
+    for r in registros:
+        grupos.setdefault(tuple(sorted(r)), []).append(r)
+    return list(grupos.values())
+
+def gravar_lancamentos(estados, lancamentos):
+    # Grava os estados (upsert) e os lançamentos (insert) em lote; levanta
+    # exceção em falha. Com sql/registrar_lancamentos.sql instalado é uma
+    # transação só; sem ela, upsert + insert (se o insert falhar, os estados
+    # já estão gravados — reenviar só duplica o histórico, não o estado).
+    try:
+        return sb_rpc("registrar_lancamentos", {"p_estados": estados, "p_lancamentos": lancamentos})
+    except Exception as e:
+        if not _rpc_ausente(e):
+            raise
+    for grupo in _por_colunas(estados):
+        sb_upsert("estado_servicos", grupo, on_conflict="casa_id,servico_id")
+    gravados = []
+    try:
+        for grupo in _por_colunas(lancamentos):
+            gravados += [{"servico_id": l["servico_id"], "lancamento_id": l["id"]} for l in sb_insert("lancamentos", grupo)]
+    except Exception as e:
+        raise RuntimeError(f"estado gravado, lançamento não: {e}") from e
+    return gravados
+
+def _sincronizar_lancamentos(itens):
+    # Envia um lote da fila offline. Por (casa_id, servico_id) vale o estado
+    # com updated_at mais recente: entre os itens da fila e contra o banco
+    # (se alguém gravou depois no servidor, o estado da fila é descartado).
+    # Os lançamentos são histórico e sempre entram, mas não antes da foto
+    # deles: enquanto ela estiver na fila o lote espera (Adiar); se o upload
+    # falhou de vez, o lançamento entra sem a foto, não com um link quebrado.
+    estados, lancamentos = {}, []
+    fotos_na_fila = None
+    for it in itens:
+        for l in it.get("lancamentos", []):
+            h = hash_da_url(l.get("foto_path"))
+            # sem original no spool: a foto já subiu (ou nunca precisou subir)
+            if h is not None and h not in _fotos_subidas and os.path.exists(original(FOTOS_SPOOL, h)):
+                if fotos_na_fila is None:
+                    fotos_na_fila = {f["hash"] for f in _fila.pendentes("fotos")}
+                if h in fotos_na_fila:
+                    raise Adiar(f"foto {h[:12]} ainda não subiu")
+                l = {**l, "foto_path": None}
+            lancamentos.append(l)
+        for e in it.get("estados", []):
+            k = (int(e["casa_id"]), int(e["servico_id"]))
+            atual = estados.get(k)
+            if atual is None or ts_utc(e["updated_at"]) >= ts_utc(atual["updated_at"]):
+                estados[k] = {**(atual or {}), **e}
+    if estados:
+        casas = sorted({c for c, _ in estados})
+        no_banco = sb_select("estado_servicos", select="casa_id,servico_id,updated_at", filters={"casa_id": ("in", casas)})
+        for r in no_banco:
+            k = (int(r["casa_id"]), int(r["servico_id"]))
+            if k in estados and r.get("updated_at") and ts_utc(r["updated_at"]) > ts_utc(estados[k]["updated_at"]):
+                del estados[k]
+    if estados or lancamentos:
+        gravar_lancamentos(list(estados.values()), lancamentos)
+
+def ativar_frentes(obra_id, casa_ids, etapa, usuario, progresso=None):
+    # Ativa a etapa em várias casas: 1 upsert em casa_ativacoes e o estado
+    # "Não iniciado" de cada (casa, serviço) semeado em blocos.
+    now = datetime.utcnow().isoformat()
+    casa_ids = [int(c) for c in casa_ids]
+    sb_upsert("casa_ativacoes", [{"casa_id": cid, "etapa": etapa, "ativa": True, "ativa_em": now, "ativa_por": usuario} for cid in casa_ids], on_conflict="casa_id,etapa")
+    servs = sb_consulta(SERVICOS, filters={"obra_id": obra_id, "etapa": etapa})
+    estados = [{"casa_id": cid, "servico_id": s["id"], "status": "Não iniciado", "executor": "", "data_inicio": None, "data_fim": None, "updated_at": now}
+               for cid in casa_ids for s in servs]
+    return sb_upsert_lotes("estado_servicos", estados, on_conflict="casa_id,servico_id", progresso=progresso)
+
+def excluir_etapa(obra_id, etapa, progresso=None, chunk=200):
+    # Remove serviços, ativações e a etapa em poucas requisições. Com
+    # sql/excluir_etapa.sql instalado é uma transação só (tudo ou nada).
+    # Sem ela, a etapa é apagada por último: se algo falhar no meio, a etapa
+    # continua listada e basta repetir a exclusão.
+    def _passo(feitos, total, texto):
+        if progresso:
+            progresso(feitos, total, texto)
+    try:
+        _passo(0, 1, "Excluindo etapa no banco...")
+        res = sb_rpc("excluir_etapa", {"p_obra_id": obra_id, "p_etapa": etapa})
+        ref_cache_invalidate("servicos")
+        ref_cache_invalidate("casa_ativacoes")
+        ref_cache_invalidate("etapas")
+        _passo(1, 1, "Etapa excluída.")
+        return (res or [{}])[0]
+    except Exception as e:
+        if not _rpc_ausente(e):
+            raise
+    casa_ids = [c["id"] for c in sb_consulta(CASAS, filters={"obra_id": obra_id})]
+    blocos = [casa_ids[i:i+chunk] for i in range(0, len(casa_ids), chunk)]
+    total = len(blocos) + 2
+    _passo(0, total, "Excluindo serviços...")
+    n_serv = len(sb_delete("servicos", {"obra_id": obra_id, "etapa": etapa}))
+    n_ativ = 0
+    for i, bloco in enumerate(blocos, start=1):
+        _passo(i, total, f"Excluindo ativações... {i}/{len(blocos)}")
+        n_ativ += len(sb_delete("casa_ativacoes", {"etapa": etapa, "casa_id": ("in", bloco)}))
+    _passo(total - 1, total, "Excluindo etapa...")
+    n_etap = len(sb_delete("etapas", {"obra_id": obra_id, "nome": etapa}))
+    _passo(total, total, "Etapa excluída.")
+    return {"servicos": n_serv, "ativacoes": n_ativ, "etapas": n_etap}
+
+def lotes_por_prefixo(lotes, prefixo):
+    # "QD 3" pega "QD 3 LT 15" mas não "QD 30 LT 1"
+    prefixo = (prefixo or "").strip().upper()
+    if not prefixo:
+        return []
+    rx = re.compile(rf"^{re.escape(prefixo)}(?:\b|$)")
+    return [l for l in lotes if rx.match(str(l).strip().upper())]
+
+def _sem_acento(texto):
+    return unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii").lower()
+
+OBS_POR_PAGINA = 50
+
+def buscar_observacoes(obra_id, termos, limite=OBS_POR_PAGINA, offset=0):
+    # Busca nas observações de todas as casas da obra, por relevância ->
+    # (linhas da página, total). Com sql/busca_observacoes.sql é uma consulta
+    # no índice textual; sem ela, filtra em memória (o radical de cada termo,
+    # sem acento/maiúscula; relevância = nº de ocorrências).
+    try:
+        rows = sb_rpc("buscar_observacoes", {"p_obra_id": obra_id, "p_termos": termos, "p_limite": limite, "p_offset": offset})
+        return rows, (rows[0]["total"] if rows else 0)
+    except Exception as e:
+        if not _rpc_ausente(e):
+            raise
+    palavras = [radical(p) for p in re.findall(r"\w+", termos)]
+    # a obra inteira passa do max-rows do PostgREST: paginado por id
+    df = sb_select_df(LANC_BUSCA.tabela, select=LANC_BUSCA.select, filters={"obra_id": obra_id, "anulado": False, "observacoes": ("neq", "")},
+                      columns=list(LANC_BUSCA.colunas))
+    if not palavras or df.empty:
+        return [], 0
+    texto = df["observacoes"].fillna("").map(_sem_acento)
+    achou = pd.Series(True, index=df.index)
+    relevancia = pd.Series(0, index=df.index)
+    for p in palavras:
+        achou &= texto.str.contains(p, regex=False)
+        relevancia += texto.str.count(re.escape(p))
+    df = df[achou].assign(relevancia=relevancia[achou]).sort_values(["relevancia", "created_at"], ascending=False)
+    total = len(df)
+    df = df.iloc[offset:offset + limite].rename(columns={"id": "lancamento_id"})
+    casas = ref_df(CASAS, filters={"obra_id": obra_id})[["id", "lote"]]
+    servs = ref_df(SERVICOS, filters={"obra_id": obra_id}).rename(columns={"nome": "servico"})
+    df = (df.merge(casas.rename(columns={"id": "casa_id"}), on="casa_id", how="left")
+            .merge(servs.rename(columns={"id": "servico_id"}), on="servico_id", how="left"))
+    return df.assign(trecho=df["observacoes"], total=total).to_dict("records"), total
+
+FILA_PATH = _cfg("FILA_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fila_lancamentos.sqlite3"))
+# fotos: originais aguardando upload e tamanho final (maior lado, px)
+FOTOS_SPOOL = _cfg("FOTOS_SPOOL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fotos_pendentes"))
+FOTO_MAX_LADO = int(_cfg("FOTO_MAX_LADO", "1600"))
+FOTO_QUALIDADE = int(_cfg("FOTO_QUALIDADE", "80"))
+FOTO_MINIATURA = 320
+
+@st.cache_resource
+def fotos_enviadas():
+    # hashes já no bucket (neste processo): a mesma foto não volta para a fila
+    return set()
+
+_fotos_subidas = fotos_enviadas()  # atualizado pela thread da fila
+
+def enfileirar_foto(dados):
+    # Só grava o original no spool e entra na fila: redução, miniatura e
+    # upload acontecem em segundo plano. Devolve a URL final (nome pelo hash
+    # do conteúdo), já conhecida antes do upload.
+    h = hash_foto(dados)
+    if h not in _fotos_subidas:
+        # já no spool sem item na fila: o upload anterior falhou de vez, tenta de novo
+        if guardar_original(FOTOS_SPOOL, h, dados) or h not in {f["hash"] for f in _fila.pendentes("fotos")}:
+            _fila.enfileirar("fotos", {"hash": h})
+    return db.url(caminhos(h)[0])
+
+def _sincronizar_fotos(itens):
+    for it in itens:
+        h = it["hash"]
+        arq = original(FOTOS_SPOOL, h)
+        if os.path.exists(arq):
+            with open(arq, "rb") as f:
+                foto, mini = reduzir(f.read(), FOTO_MAX_LADO, FOTO_QUALIDADE, FOTO_MINIATURA)
+            cam_foto, cam_mini = caminhos(h)
+            sb_upload(cam_mini, mini, content_type="image/jpeg")
+            sb_upload(cam_foto, foto, content_type="image/jpeg")
+            os.remove(arq)
+        _fotos_subidas.add(h)
+
+@st.cache_resource
+def fila_escrita():
+    # lançamentos e fotos do campo: confirma na hora e sobe em segundo plano
+    # (as fotos entram antes do lançamento que as usa)
+    return FilaEscrita(FILA_PATH, {"lancamentos": _sincronizar_lancamentos, "fotos": _sincronizar_fotos}, transitorio=erro_transitorio)
+
+_fila = fila_escrita()  # usada também pelos sincronizadores (thread da fila)
+
+def estado_casa(casa_id):
+    # estado_servicos da casa com os estados ainda na fila por cima
+    # (coluna "pendente" = aguardando sincronização)
+    estado = sb_consulta_df(ESTADO_CASA, filters={"casa_id": casa_id})
+    pend = [e for it in fila_escrita().pendentes("lancamentos") for e in it.get("estados", []) if int(e["casa_id"]) == casa_id]
+    if not pend:
+        return estado.assign(pendente=False)
+    pend = pd.DataFrame(pend).drop_duplicates("servico_id", keep="last").assign(pendente=True)
+    if estado.empty:
+        return pend
+    base = estado.set_index("servico_id").assign(pendente=False)
+    base = pend.set_index("servico_id").combine_first(base)
+    return base.reset_index()
+
+AUDIT_SPOOL = _cfg("AUDIT_SPOOL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "auditoria_spool.jsonl"))
+
+@st.cache_resource
+def auditoria_writer():
+    # uma thread de escrita por processo; eventos que não subirem ficam no spool local
+    return AuditWriter(lambda eventos: sb_insert("auditoria", eventos), spool_path=AUDIT_SPOOL)
 
 def log_event(usuario, acao, obra_id=None, casa_id=None, servico_id=None, detalhes=None):
+    # só enfileira: o clique não espera o insert na auditoria
+    auditoria_writer().registrar({
+        "timestamp": datetime.utcnow().isoformat(),
+        "usuario": usuario,
+        "acao": acao,
+        "obra_id": obra_id,
+        "casa_id": casa_id,
+        "servico_id": servico_id,
+        "detalhes": detalhes if isinstance(detalhes, dict) else json.dumps(detalhes) if detalhes else None
+    })
+
+ARQUIVO_DIAS = int(_cfg("ARQUIVO_DIAS", "90"))
+ARQUIVO_CACHE = _cfg("ARQUIVO_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "arquivo_cache"))
+ARQUIVO_LOTE = 20000
+
+@st.cache_resource
+def arquivo_auditoria():
+    # partições Parquet no storage (bucket ou uploads/ no SQLite), cache local por processo
+    return ArquivoAuditoria(db, ARQUIVO_CACHE)
+
+def arquivar_auditoria(dias=ARQUIVO_DIAS):
+    # Move para o arquivo os registros com mais de `dias` dias, em blocos de
+    # ARQUIVO_LOTE. Cada bloco só é apagado do banco depois que as partições
+    # dele subiram; se parar no meio, rodar de novo retoma (ids repetidos não
+    # duplicam no arquivo). -> registros arquivados
+    auditoria_writer().flush(timeout=3)
+    corte = (datetime.utcnow() - timedelta(days=dias)).isoformat()
+    filtro = {"timestamp": ("lt", corte)}
+    total, bloco = 0, []
+
+    def _descarregar():
+        nonlocal total, bloco
+        arquivo_auditoria().gravar(bloco)
+        ids = [int(r["id"]) for r in bloco]
+        # ids novos são sempre maiores: o intervalo só pega o que foi lido
+        sb_delete("auditoria", {**filtro, "id": ("entre", (min(ids), max(ids) + 1))})
+        total += len(bloco)
+        bloco = []
+
+    for rows in sb_select_iter("auditoria", filters=filtro):
+        bloco += rows
+        if len(bloco) >= ARQUIVO_LOTE:
+            _descarregar()
+    if bloco:
+        _descarregar()
+    return total
+
+def _tabela_ausente(e):
+    # tabela não criada no banco (PostgREST / Postgres)
+    return getattr(e, "code", None) in ("PGRST205", "42P01")
+
+def facetas_auditoria():
+    # {"usuario": {valor: n}, "acao": {valor: n}}. Com sql/auditoria_facetas.sql
+    # é uma leitura de dezenas de linhas; sem ela, lê as duas colunas inteiras.
     try:
-        sb_insert("auditoria", {
-            "timestamp": datetime.utcnow().isoformat(),
-            "usuario": usuario,
-            "acao": acao,
-            "obra_id": obra_id,
-            "casa_id": casa_id,
-            "servico_id": servico_id,
-            "detalhes": detalhes if isinstance(detalhes, dict) else json.dumps(detalhes) if detalhes else None
-        })
-    except Exception:
-        pass
+        rows = sb_consulta(AUDITORIA_FACETAS)
+    except Exception as e:
+        if not _tabela_ausente(e):
+            raise
+        rows = []
+        for campo in ("usuario", "acao"):
+            df = sb_select_df("auditoria", select=campo, columns=[campo])
+            cont = df[campo].dropna().value_counts().sort_index()
+            rows += [{"campo": campo, "valor": v, "n": int(n)} for v, n in cont.items()]
+    out = {"usuario": {}, "acao": {}}
+    for r in rows:
+        out[r["campo"]][r["valor"]] = r["n"]
+    return out
+
+def indice_ativacoes(obra_id, etapa=None):
+    # Ativações das casas da obra (etapa=None: todas as etapas), lidas em
+    # páginas por faixas de casa_id (consultas.ativacoes_obra) e guardadas no
+    # cache de referência como uma entrada de casa_ativacoes: escritas nela ou
+    # em casas invalidam o índice.
+    key = _ref_key(ATIVACOES.tabela, ATIVACOES.select, {"obra_id": obra_id, "etapa": etapa}, ATIVACOES.ordem, None)
+    cached = ref_cache_get(key)
+    if cached is None:
+        geracao = ref_cache_geracao(ATIVACOES.tabela)  # antes de ler as casas também
+        casas = ref_df(CASAS, filters={"obra_id": obra_id})
+        rows = ativacoes_obra(_db_select, casas["id"], etapa, chunk=SB_PAGE_SIZE)
+        cached = rows, ref_cache_put(key, rows, geracao)
+    rows, versao = cached
+    return ref_cache_derivado(key, versao, "indice", lambda: IndiceAtivacoes(rows))
+
+# -------------------- Dashboard (agregação) --------------------
+DASH_REBUILD_S = 600  # recarga completa periódica: pega exclusões e gravações sincronizadas com atraso
+DASH_MARGEM_S = MARGEM_S  # sobreposição da marca d'água (relógios e gravações fora de ordem)
+# feed de alterações (Supabase Realtime ou tabela `alteracoes` no SQLite): no
+# Supabase exige sql/realtime.sql, por isso só liga quando configurado
+DASH_TEMPO_REAL = str(_cfg("DASH_TEMPO_REAL", "1" if DB_BACKEND == "sqlite" else "0")).lower() in ("1", "true", "sim")
+DASH_AO_VIVO_S = 5  # intervalo de redesenho do Dashboard em modo ao vivo
+
+@st.cache_resource
+def _resumos():
+    return {"lock": threading.Lock(), "obras": {}}
+
+_cache_resumos = _resumos()  # usado também pelo callback do feed (thread de fundo)
+
+@st.cache_resource
+def feed_alteracoes():
+    # uma assinatura por processo; as alterações corrigem os resumos em memória
+    return db.assinar(("estado_servicos", "casa_ativacoes"), _aplicar_alteracao)
+
+def _aplicar_alteracao(tabela, tipo, registro):
+    if tabela == "casa_ativacoes":
+        ref_cache_invalidate("casa_ativacoes")
+        return
+    c = _cache_resumos
+    with c["lock"]:
+        resumos = list(c["obras"].values())
+    for r in resumos:
+        with r.lock:
+            if "casa_id" not in registro:
+                r.obsoleto = True  # DELETE sem a linha antiga (replica identity default)
+            elif registro.get("servico_id") is None or int(registro["servico_id"]) in r.etapa_de:
+                r.marcar(registro["casa_id"])
+
+def _rpc_dashboard_resumo(params, etapa_de):
+    # dashboard_resumo, ou a mesma página de casas agregada no app quando
+    # sql/dashboard_resumo.sql não está instalado
+    try:
+        return sb_rpc("dashboard_resumo", params)
+    except Exception as e:
+        if not _rpc_ausente(e):
+            raise
+    ids = set(ref_df(CASAS, filters={"obra_id": params["p_obra_id"]})["id"].astype(int).tolist())
+    if params["p_casas"] is not None:
+        ids &= {int(c) for c in params["p_casas"]}
+    pagina = sorted(c for c in ids if c > params["p_depois"])[:params["p_limite"]]
+    if not pagina:
+        return []
+    # faixa de casa_id em vez de um IN com as casas (URL do PostgREST)
+    filtros = {"casa_id": ("entre", (pagina[0], pagina[-1] + 1)), "servico_id": ("in", sorted(etapa_de))}
+    estados = [e for rows in sb_select_iter(ESTADO_RESUMO.tabela, select=ESTADO_RESUMO.select, filters=filtros) for e in rows]
+    return agregar(estados, etapa_de, pagina)
+
+def resumo_obra(obra_id):
+    # Resumo da obra em memória: agregado no banco por casa na primeira vez (ou
+    # quando os serviços mudam / a cada DASH_REBUILD_S); depois só as casas
+    # com linhas de estado_servicos acima da marca d'água são reagregadas.
+    # Com o feed conectado nem a consulta do delta: ele avisa quais casas mudaram.
+    feed = feed_alteracoes() if DASH_TEMPO_REAL else None
+    servicos = sb_consulta(SERVICOS, filters={"obra_id": obra_id})
+    c = _cache_resumos
+    with c["lock"]:
+        r = c["obras"].get(obra_id)
+        if r is None or r.obsoleto or not r.mesmos_servicos(servicos) or time.time() - r.criado_em > DASH_REBUILD_S:
+            r = c["obras"][obra_id] = ResumoIncremental(obra_id, servicos)
+    with r.lock:
+        if not r.etapa_de:
+            return r
+        # consultado depois que o feed conectou: não há buraco entre os dois
+        pelo_feed = feed is not None and feed.conectado and r.consultado_em and r.consultado_em > feed.conectado_em
+        if not pelo_feed:
+            r.consultado_em = time.time()
+        r.ultimo_delta = r.atualizar(lambda p: _rpc_dashboard_resumo(p, r.etapa_de), _db_select, DASH_MARGEM_S,
+                                     delta=not pelo_feed, chunk=SB_PAGE_SIZE)
+    return r
+
+def dashboard_resumo(obra_id, etapa=None):
+    # Uma linha por casa: casas e ativações vêm do cache de referência e as
+    # contagens do resumo da obra (agregado no banco, reagregado por casa).
+    casas = ref_df(CASAS, filters={"obra_id": obra_id})
+    if casas.empty:
+        return []
+    # índice da obra por etapa (o mesmo de Lançamentos), sem IN com os ids
+    ativa = indice_ativacoes(obra_id, etapa).mascara(casas["id"], etapa)
+    return resumo_obra(obra_id).resumo(casas, ativa, etapa)
+
+def matrizes_previsto_executado(obra_id):
+    # {etapa: matriz lote × serviço}, com o status de cada (casa, serviço) da
+    # obra lido em páginas
+    casas = ref_df(CASAS, filters={"obra_id": obra_id})
+    servicos = ref_df(SERVICOS, filters={"obra_id": obra_id})
+    estados = pd.DataFrame(columns=list(ESTADO_RESUMO.colunas))
+    if not servicos.empty:
+        estados = sb_select_df(ESTADO_RESUMO.tabela, select=ESTADO_RESUMO.select, filters={"servico_id": ("in", servicos["id"].astype(int).tolist())},
+                               columns=list(ESTADO_RESUMO.colunas))
+    return previsto_executado(casas, servicos, estados)
 
 # -------------------- Auth --------------------
 def _default_permissoes(role="user"):
@@ -111,7 +761,7 @@ def _merge_permissoes(user_dict):
     return p
 
 def ensure_admin_seed():
-    users = sb_select("usuarios", limit=1)
+    users = sb_select("usuarios", select="id", limit=1)
     if not users:
         sb_insert("usuarios", {
             "username": "admin",
@@ -122,10 +772,22 @@ def ensure_admin_seed():
             "permissoes": {}
         })
 
-ensure_admin_seed()
+@st.cache_resource
+def _semear_admin():
+    # uma consulta a usuarios por processo, não a cada clique
+    ensure_admin_seed()
+    return True
+
+_semear_admin()
+_partida = tempos_app()["partida"]
+if not _partida:
+    _fim = time.perf_counter()
+    _partida.update(imports_ms=round((_T_IMPORTS - _T_INICIO) * 1000, 1), backend_ms=round((_T_BACKEND - _T_IMPORTS) * 1000, 1),
+                    total_ms=round((_fim - _T_INICIO) * 1000, 1), em=datetime.now().isoformat(timespec="seconds"))
+    _log.info("partida do processo: %s", _partida)
 
 def check_login(username, password):
-    rows = sb_select("usuarios", filters={"username": username, "password": password, "ativo": True}, limit=1)
+    rows = sb_consulta(USUARIOS, filters={"username": username, "password": password, "ativo": True}, limit=1)
     if rows:
         u = rows[0]
         return {"username": u["username"], "nome": u.get("nome", u["username"]), "role": u.get("role", "user"), "permissoes": u.get("permissoes", {})}
@@ -138,11 +800,13 @@ def can_view(page_name):
         "Ativar Casa": "ver_ativar_casa",
         "Lançamentos": "ver_lancamentos",
         "Dashboard": "ver_dashboard",
+        "Previsto × Executado": "ver_dashboard",
         "Observações": True,
         "Base de Dados": "ver_servicos",
         "Logs": "ver_logs",
         "Correções": "corrigir_registros",
         "Admin": "ver_admin",
+        "Desempenho": "ver_admin",
         "Minha Conta": True,
     }
     key = mapping.get(page_name, True)
@@ -153,19 +817,6 @@ def can_edit(action_key):
     p = _merge_permissoes(user)
     return bool(p.get(action_key, False))
 
-# -------------------- Storage: upload foto --------------------
-def upload_foto(file_bytes, filename):
-    try:
-        path = f"{filename}"
-        res = sb.storage.from_(SUPABASE_BUCKET).upload(path, file_bytes)
-        if isinstance(res, dict) and res.get("error"):
-            st.error(f"Erro ao enviar imagem: {res['error']['message']}")
-            return None
-        return sb.storage.from_(SUPABASE_BUCKET).get_public_url(path)
-    except Exception as e:
-        st.error(f"Falha no upload: {e}")
-        return None
-
 # -------------------- Sidebar / Login --------------------
 st.sidebar.title("🏗️ Acompanhamento de Obras — Login")
 
@@ -187,13 +838,40 @@ if "user" not in st.session_state or not st.session_state["user"]:
 
 user = st.session_state["user"]
 st.sidebar.write(f"**Usuário:** {user['nome']}  \n**Perfil:** {user['role']}")
+if user.get("role") == "admin":
+    _rc = ref_cache_stats()
+    st.sidebar.caption(f"Cache ref.: {_rc['hits']} hits / {_rc['misses']} misses ({_rc['hit_rate']:.0%}) · {_rc['entradas']} entradas · versão {_rc['versao']}")
+    _rm = ref_cache_memoria()
+    if _rm:
+        st.sidebar.caption("Snapshot compartilhado: " + " · ".join(f"{t} {m['bytes'] / 1024:.0f} KB ({m['linhas']} linhas)" for t, m in sorted(_rm.items())))
+    if SB_MEDIR_BYTES:
+        _mb = _medidor.stats()
+        with st.sidebar.expander(f"Bytes lidos: {sum(r['bytes'] for r in _mb) / 1024:.0f} KB em {sum(r['chamadas'] for r in _mb)} consultas"):
+            st.dataframe(pd.DataFrame(_mb), hide_index=True)
+    _aw = auditoria_writer().stats()
+    st.sidebar.caption(f"Auditoria: {_aw['pendentes']} na fila · {_aw['spool']} no spool local" + (f" · último erro: {_aw['ultimo_erro']}" if _aw["spool"] else ""))
+_fe = fila_escrita().stats()
+if _fe["profundidade"] or _fe["erros"]:
+    st.sidebar.caption(f"Lançamentos offline: {_fe['profundidade']} na fila · atraso {_fe['atraso_s']:.0f}s" + (f" · {_fe['erros']} com erro" if _fe["erros"] else ""))
+    if user.get("role") == "admin" and _fe["ultimo_erro"]:
+        st.sidebar.caption(f"Fila — último erro: {_fe['ultimo_erro']}")
+    if st.sidebar.button("Sincronizar agora"):
+        fila_escrita().sincronizar_agora()
+else:
+    st.sidebar.caption("Lançamentos sincronizados.")
 if st.sidebar.button("Sair"):
     st.session_state.pop("user", None)
     st.rerun()
 
-pages_all = ["Ativar Casa", "Lançamentos", "Dashboard", "Observações", "Base de Dados", "Logs", "Correções", "Admin", "Minha Conta"]
+pages_all = ["Ativar Casa", "Lançamentos", "Dashboard", "Previsto × Executado", "Observações", "Base de Dados", "Logs", "Correções", "Admin", "Desempenho", "Minha Conta"]
 pages = [p for p in pages_all if can_view(p)]
 page = st.sidebar.radio("Navegação", pages)
+# primeira execução da página desde que o usuário entrou nela (e não um rerun
+# de widget dentro dela)
+pagina_aberta = st.session_state.get("pagina_ant") != page
+st.session_state["pagina_ant"] = page
+_traco.pagina(page)
+tempos_app()["menu_ms"].append((time.perf_counter() - _T_INICIO) * 1000)
 
 # -------------------- Minha Conta --------------------
 if page == "Minha Conta":
@@ -216,7 +894,7 @@ if page == "Minha Conta":
             elif len(new_pw) < 4:
                 st.error("A nova senha deve ter pelo menos 4 caracteres.")
             else:
-                rows = sb_select("usuarios", filters={"username": user["username"], "password": current_pw, "ativo": True}, limit=1)
+                rows = sb_select("usuarios", select="id", filters={"username": user["username"], "password": current_pw, "ativo": True}, limit=1)
                 if not rows:
                     st.error("Senha atual incorreta.")
                 else:
@@ -242,13 +920,14 @@ if page == "Base de Dados" and can_view("Base de Dados"):
                     log_event(user["nome"], "criar_obra", detalhes={"obra": nome_obra.strip()})
                 except Exception as e:
                     st.error(f"Não foi possível criar a obra: {e}")
-        obras = pd.DataFrame(sb_select("obras", order="nome"))
+        obras = ref_df(OBRAS)
         st.dataframe(obras[["id","nome"]] if not obras.empty else obras, use_container_width=True, hide_index=True)
 
         st.markdown("#### Excluir obra")
         if not obras.empty:
-            ob_del_nome = st.selectbox("Selecione a obra para excluir", obras["nome"].tolist(), key="obra_del_nome")
-            ob_id = int(obras.loc[obras["nome"]==ob_del_nome, "id"].iloc[0])
+            rot_obras = ref_rotulos(OBRAS)
+            ob_id = st.selectbox("Selecione a obra para excluir", rot_obras.ids, format_func=rot_obras, key="obra_del_nome")
+            ob_del_nome = rot_obras(ob_id)
             col_a, col_b = st.columns([1,2])
             st.caption("A exclusão remove casas, etapas, serviços, lançamentos e estados vinculados (via ON DELETE CASCADE).")
             conf_txt = col_b.text_input('Digite "EXCLUIR" para confirmar', key="obra_del_conf")
@@ -265,12 +944,13 @@ if page == "Base de Dados" and can_view("Base de Dados"):
     # --- Etapas ---
     with tabs[1]:
         st.subheader("Etapas por Obra")
-        obras = pd.DataFrame(sb_select("obras", order="nome"))
+        obras = ref_df(OBRAS)
         if obras.empty:
             st.info("Crie uma obra primeiro.")
         else:
-            obra_sel = st.selectbox("Obra", obras["nome"].tolist(), key="bd_et_ob")
-            obra_id = int(obras.loc[obras["nome"] == obra_sel, "id"].iloc[0])
+            rot_obras = ref_rotulos(OBRAS)
+            obra_id = st.selectbox("Obra", rot_obras.ids, format_func=rot_obras, key="bd_et_ob")
+            obra_sel = rot_obras(obra_id)
             with st.form("nova_etapa"):
                 etapa_nome = st.text_input("Nova Etapa", placeholder="Ex.: Reboco")
                 ok_e = st.form_submit_button("Adicionar Etapa")
@@ -281,7 +961,7 @@ if page == "Base de Dados" and can_view("Base de Dados"):
                         log_event(user["nome"], "criar_etapa", obra_id=obra_id, detalhes={"etapa": etapa_nome.strip()})
                     except Exception as e:
                         st.error(f"Não foi possível criar a etapa: {e}")
-            etapas = pd.DataFrame(sb_select("etapas", filters={"obra_id": obra_id}, order="nome"))
+            etapas = ref_df(ETAPAS, filters={"obra_id": obra_id})
             st.dataframe(etapas[["id","nome"]] if not etapas.empty else etapas, use_container_width=True, hide_index=True)
 
             st.markdown("#### Excluir etapa")
@@ -290,18 +970,11 @@ if page == "Base de Dados" and can_view("Base de Dados"):
                 btn_del = st.button("🗑️ Excluir etapa", type="primary")
                 if btn_del:
                     try:
-                        # Remove serviços da etapa (e dependências via FK)
-                        servs = sb_select("servicos", filters={"obra_id": obra_id, "etapa": et_del_nome})
-                        for s in servs:
-                            sb_delete("servicos", {"id": s["id"]})
-                        # Remove ativações dessa etapa
-                        casas = sb_select("casas", filters={"obra_id": obra_id})
-                        for c in casas:
-                            sb_delete("casa_ativacoes", {"casa_id": c["id"], "etapa": et_del_nome})
-                        # Remove a etapa
-                        sb_delete("etapas", {"obra_id": obra_id, "nome": et_del_nome})
+                        # serviços (e dependências via FK), ativações e a etapa, em conjunto
+                        barra = st.progress(0.0, text="Excluindo etapa...")
+                        qtd = excluir_etapa(obra_id, et_del_nome, progresso=lambda f, t, txt: barra.progress(f / t, text=txt))
                         st.success(f"Etapa '{et_del_nome}' excluída.")
-                        log_event(user["nome"], "excluir_etapa", obra_id=obra_id, detalhes={"etapa": et_del_nome})
+                        log_event(user["nome"], "excluir_etapa", obra_id=obra_id, detalhes={"etapa": et_del_nome, **qtd})
                         st.rerun()
                     except Exception as e:
                         st.error(f"Falha ao excluir etapa: {e}")
@@ -309,13 +982,14 @@ if page == "Base de Dados" and can_view("Base de Dados"):
     # --- Serviços por Etapa (manual + importação) ---
     with tabs[2]:
         st.subheader("Serviços por Etapa")
-        obras = pd.DataFrame(sb_select("obras", order="nome"))
+        obras = ref_df(OBRAS)
         if obras.empty:
             st.info("Crie uma obra primeiro.")
         else:
-            obra_sel = st.selectbox("Obra", obras["nome"].tolist(), key="bd_sv_ob")
-            obra_id = int(obras.loc[obras["nome"] == obra_sel, "id"].iloc[0])
-            etapas = pd.DataFrame(sb_select("etapas", filters={"obra_id": obra_id}, order="nome"))
+            rot_obras = ref_rotulos(OBRAS)
+            obra_id = st.selectbox("Obra", rot_obras.ids, format_func=rot_obras, key="bd_sv_ob")
+            obra_sel = rot_obras(obra_id)
+            etapas = ref_df(ETAPAS, filters={"obra_id": obra_id})
             if etapas.empty:
                 st.info("Cadastre uma etapa para esta obra.")
             else:
@@ -334,7 +1008,7 @@ if page == "Base de Dados" and can_view("Base de Dados"):
                             st.error(f"Não foi possível adicionar o serviço: {e}")
 
                 # Lista
-                servs = pd.DataFrame(sb_select("servicos", filters={"obra_id": obra_id, "etapa": etapa_sel}, order="nome"))
+                servs = ref_df(SERVICOS, filters={"obra_id": obra_id, "etapa": etapa_sel})
                 st.dataframe(servs[["id","nome"]] if not servs.empty else servs, use_container_width=True, hide_index=True)
 
                 # Importação em massa
@@ -345,51 +1019,35 @@ if page == "Base de Dados" and can_view("Base de Dados"):
                     st.write("Observação: duplicados são ignorados/atualizados automaticamente (upsert).")
 
                 fserv = st.file_uploader("Escolher arquivo de serviços", type=["xlsx","csv"], key="file_serv")
-                if fserv is not None:
+                # o arquivo continua no uploader após o st.rerun: não reimportar o mesmo
+                if fserv is not None and st.session_state.get("file_serv_importado") != fserv.file_id:
                     try:
-                        if fserv.name.lower().endswith(".csv"):
-                            df_import = pd.read_csv(fserv)
-                        else:
-                            df_import = pd.read_excel(fserv)
-                        # normalizar colunas
-                        cols = [c.strip().lower() for c in df_import.columns]
-                        df_import.columns = cols
-
-                        registros = []
-                        if "servico" in df_import.columns and "etapa" in df_import.columns:
-                            for _, r in df_import.iterrows():
-                                nome = str(r.get("servico", "")).strip()
-                                etp = str(r.get("etapa", "")).strip() or etapa_sel
-                                if nome:
-                                    registros.append({"nome": nome, "etapa": etp, "obra_id": obra_id})
-                        elif "servico" in df_import.columns:
-                            for _, r in df_import.iterrows():
-                                nome = str(r.get("servico", "")).strip()
-                                if nome:
-                                    registros.append({"nome": nome, "etapa": etapa_sel, "obra_id": obra_id})
+                        df_import = ler_planilha(fserv, fserv.name, ESQUEMA_SERVICOS, obrigatorios=["servico"])
+                        validos, invalidos = preparar_servicos(df_import, obra_id, etapa_sel)
+                        if not invalidos.empty:
+                            st.warning(f"{len(invalidos)} linha(s) ignorada(s):")
+                            st.dataframe(invalidos, use_container_width=True, hide_index=True)
+                        if validos.empty:
+                            st.error("Não foram encontrados serviços válidos na planilha.")
                         else:
-                            st.error("A planilha precisa ter a coluna 'servico' (e opcionalmente 'etapa').")
-                            registros = []
-
-                        if registros:
-                            chunk = 500
-                            total_ok = 0
-                            for i in range(0, len(registros), chunk):
-                                sb_upsert("servicos", registros[i:i+chunk], on_conflict="nome,etapa,obra_id")
-                                total_ok += len(registros[i:i+chunk])
+                            barra = st.progress(0.0, text="Enviando serviços...")
+                            total_ok = sb_upsert_lotes("servicos", registros_importacao(validos), on_conflict="nome,etapa,obra_id", progresso=lambda f, t: barra.progress(f / t, text=f"Enviando serviços... {f}/{t}"))
+                            st.session_state["file_serv_importado"] = fserv.file_id
                             st.success(f"Importação concluída. Serviços processados: {total_ok}.")
-                            log_event(user["nome"], "importar_servicos", obra_id=obra_id, detalhes={"total": total_ok})
-                            st.rerun()
+                            log_event(user["nome"], "importar_servicos", obra_id=obra_id, detalhes={"total": total_ok, "ignoradas": len(invalidos)})
+                            if invalidos.empty:
+                                st.rerun()
                     except Exception as e:
                         st.error(f"Falha ao importar serviços: {e}")
 
                 # Excluir serviço
                 st.markdown("#### Excluir serviço")
                 if not servs.empty:
-                    srv_del_nome = st.selectbox("Serviço para excluir", servs["nome"].tolist(), key="srv_del_nome")
+                    rot_servs = ref_rotulos(SERVICOS, filters={"obra_id": obra_id, "etapa": etapa_sel})
+                    srv_id = st.selectbox("Serviço para excluir", rot_servs.ids, format_func=rot_servs, key="srv_del_nome")
+                    srv_del_nome = rot_servs(srv_id)
                     if st.button("🗑️ Excluir serviço", type="primary"):
                         try:
-                            srv_id = int(servs.loc[servs["nome"]==srv_del_nome, "id"].iloc[0])
                             sb_delete("servicos", {"id": srv_id})
                             st.success(f"Serviço '{srv_del_nome}' excluído.")
                             log_event(user["nome"], "excluir_servico", obra_id=obra_id, servico_id=srv_id, detalhes={"etapa": etapa_sel, "servico": srv_del_nome})
@@ -400,12 +1058,12 @@ if page == "Base de Dados" and can_view("Base de Dados"):
     # --- Casas (manual + importação) ---
     with tabs[3]:
         st.subheader("Casas")
-        obras = pd.DataFrame(sb_select("obras", order="nome"))
+        obras = ref_df(OBRAS)
         if obras.empty:
             st.info("Crie uma obra primeiro.")
         else:
-            obra_sel = st.selectbox("Obra", obras["nome"].tolist(), key="bd_casa_ob")
-            obra_id = int(obras.loc[obras["nome"] == obra_sel, "id"].iloc[0])
+            rot_obras = ref_rotulos(OBRAS)
+            obra_id = st.selectbox("Obra", rot_obras.ids, format_func=rot_obras, key="bd_casa_ob")
 
             # Cadastro manual
             with st.form("nova_casa"):
@@ -421,93 +1079,46 @@ if page == "Base de Dados" and can_view("Base de Dados"):
                     except Exception as e:
                         st.error(f"Não foi possível criar a casa: {e}")
 
-            casas = pd.DataFrame(sb_select("casas", filters={"obra_id": obra_id}, order="lote"))
-            st.dataframe(casas[["id","lote","tipologia","ativa","ativa_em","ativa_por"]] if not casas.empty else casas, use_container_width=True, hide_index=True)
+            casas = ref_df(CASAS_CADASTRO, filters={"obra_id": obra_id})
+            st.dataframe(casas, use_container_width=True, hide_index=True)
 
-            # Importação em massa de casas (corrigido para aceitar QUADRA+LOTE ou LOTE)
+            # Importação em massa de casas (QUADRA+LOTE, LOTE ou sinônimos qd/lt)
             st.markdown("### Importar casas por planilha (.xlsx ou .csv)")
             with st.expander("Modelo de planilha e instruções", expanded=False):
                 st.write("- **Opção A (1 coluna):** `lote` (ex.: `QD 3 LT 15`).")
-                st.write("- **Opção B (2 colunas):** `quadra`, `lote` → o sistema gera `QD {quadra} LT {lote}`.")
+                st.write("- **Opção B (2 colunas):** `quadra`, `lote` (ou `qd`, `lt`) → o sistema gera `QD {quadra} LT {lote}`.")
                 st.write("Colunas extras (ex.: `cod_tipologia`, `tipologia`) são opcionais e, se existirem, serão importadas.")
-                st.write("Duplicados são ignorados/atualizados automaticamente (upsert).")
+                st.write("Duplicados são ignorados/atualizados automaticamente (upsert). Linhas inválidas são listadas e não são enviadas.")
 
             fcasas = st.file_uploader("Escolher arquivo de casas", type=["xlsx","csv"], key="file_casas")
-            if fcasas is not None:
+            if fcasas is not None and st.session_state.get("file_casas_importado") != fcasas.file_id:
                 try:
-                    if fcasas.name.lower().endswith(".csv"):
-                        dfc = pd.read_csv(fcasas)
-                    else:
-                        dfc = pd.read_excel(fcasas)
-                    cols = [c.strip().lower() for c in dfc.columns]
-                    dfc.columns = cols
-
-                    registros = []
-                    # 1) Se vierem as duas colunas 'quadra' e 'lote' → monta "QD {quadra} LT {lote}"
-                    if ("quadra" in dfc.columns) and ("lote" in dfc.columns):
-                        for _, r in dfc.iterrows():
-                            qv = str(r.get("quadra", "")).strip()
-                            lv = str(r.get("lote", "")).strip()
-                            if not qv or not lv:
-                                continue
-                            lote_val = f"QD {qv} LT {lv}"
-                            registros.append({
-                                "obra_id": obra_id,
-                                "lote": lote_val,
-                                "cod_tipologia": str(r.get("cod_tipologia", "") or "").strip() if "cod_tipologia" in dfc.columns else None,
-                                "tipologia": str(r.get("tipologia", "") or "").strip() if "tipologia" in dfc.columns else None,
-                            })
-                    # 2) Se vier só 'lote' já pronto
-                    elif "lote" in dfc.columns:
-                        for _, r in dfc.iterrows():
-                            lote_val = str(r.get("lote", "")).strip()
-                            if not lote_val:
-                                continue
-                            registros.append({
-                                "obra_id": obra_id,
-                                "lote": lote_val,
-                                "cod_tipologia": str(r.get("cod_tipologia", "") or "").strip() if "cod_tipologia" in dfc.columns else None,
-                                "tipologia": str(r.get("tipologia", "") or "").strip() if "tipologia" in dfc.columns else None,
-                            })
-                    # 3) Caso venham sinônimos (qd/lt, q/l)
-                    else:
-                        q_col = next((c for c in dfc.columns if c in ["quadra", "qd", "q"]), None)
-                        l_col = next((c for c in dfc.columns if c in ["lote", "lt", "l"]), None)
-                        if q_col and l_col:
-                            for _, r in dfc.iterrows():
-                                qv = str(r.get(q_col, "")).strip()
-                                lv = str(r.get(l_col, "")).strip()
-                                if not qv or not lv:
-                                    continue
-                                lote_val = f"QD {qv} LT {lv}"
-                                registros.append({
-                                    "obra_id": obra_id,
-                                    "lote": lote_val,
-                                    "cod_tipologia": str(r.get("cod_tipologia", "") or "").strip() if "cod_tipologia" in dfc.columns else None,
-                                    "tipologia": str(r.get("tipologia", "") or "").strip() if "tipologia" in dfc.columns else None,
-                                })
-
-                    if not registros:
+                    dfc = ler_planilha(fcasas, fcasas.name, ESQUEMA_CASAS, obrigatorios=["lote"])
+                    validos, invalidos = preparar_casas(dfc, obra_id)
+                    if not invalidos.empty:
+                        st.warning(f"{len(invalidos)} linha(s) ignorada(s):")
+                        st.dataframe(invalidos, use_container_width=True, hide_index=True)
+                    if validos.empty:
                         st.error("Não foram encontrados dados válidos. Use 'quadra'+'lote' ou 'lote'.")
                     else:
-                        chunk = 500
-                        total_ok = 0
-                        for i in range(0, len(registros), chunk):
-                            sb_upsert("casas", registros[i:i+chunk], on_conflict="obra_id,lote")
-                            total_ok += len(registros[i:i+chunk])
+                        barra = st.progress(0.0, text="Enviando casas...")
+                        total_ok = sb_upsert_lotes("casas", registros_importacao(validos), on_conflict="obra_id,lote", progresso=lambda f, t: barra.progress(f / t, text=f"Enviando casas... {f}/{t}"))
+                        st.session_state["file_casas_importado"] = fcasas.file_id
                         st.success(f"Importação concluída. Casas processadas: {total_ok}.")
-                        log_event(user["nome"], "importar_casas", obra_id=obra_id, detalhes={"total": total_ok})
-                        st.rerun()
+                        log_event(user["nome"], "importar_casas", obra_id=obra_id, detalhes={"total": total_ok, "ignoradas": len(invalidos)})
+                        if invalidos.empty:
+                            st.rerun()
                 except Exception as e:
                     st.error(f"Falha ao importar casas: {e}")
 
             # Excluir casa
             st.markdown("#### Excluir casa")
             if not casas.empty:
-                casa_del_lote = st.selectbox("Casa (lote) para excluir", casas["lote"].tolist(), key="casa_del")
+                rot_casas = ref_rotulos(CASAS, "lote", filters={"obra_id": obra_id})
+                cid = st.selectbox("Casa (lote) para excluir", rot_casas.ids, format_func=rot_casas, key="casa_del")
+                casa_del_lote = rot_casas(cid)
                 if st.button("🗑️ Excluir casa", type="primary"):
                     try:
-                        cid = int(casas.loc[casas["lote"]==casa_del_lote, "id"].iloc[0])
                         sb_delete("casas", {"id": cid})
                         st.success(f"Casa '{casa_del_lote}' excluída.")
                         log_event(user["nome"], "excluir_casa", obra_id=obra_id, casa_id=cid, detalhes={"lote": casa_del_lote})
@@ -519,35 +1130,72 @@ if page == "Base de Dados" and can_view("Base de Dados"):
 if page == "Logs" and can_view("Logs"):
     st.header("Logs do Sistema")
     st.caption("Registro de tudo que foi feito: quem, quando e o que.")
+    # eventos ainda na fila: esperados só ao abrir a página ou em "Atualizar",
+    # não a cada mudança de filtro
+    if st.button("Atualizar") or pagina_aberta:
+        auditoria_writer().flush(timeout=3)
 
-    usuarios = pd.DataFrame(sb_select("auditoria", select="usuario", order="usuario"))
-    usuarios_list = sorted(set([u["usuario"] for u in usuarios])) if not usuarios.empty else []
+    facetas = facetas_auditoria()
     col1, col2, col3 = st.columns(3)
-    usuario_sel = col1.selectbox("Usuário", ["Todos"] + usuarios_list)
-    acoes = pd.DataFrame(sb_select("auditoria", select="acao", order="acao"))
-    acoes_list = sorted(set([a["acao"] for a in acoes])) if not acoes.empty else []
-    acao_sel = col2.selectbox("Ação", ["Todas"] + acoes_list)
-    limite = col3.number_input("Mostrar últimos (registros)", min_value=50, max_value=100000, value=200, step=50)
-
-    rows = sb_select("auditoria", order="id")
-    df_logs = pd.DataFrame(rows)
-    if not df_logs.empty:
-        if usuario_sel != "Todos":
-            df_logs = df_logs[df_logs["usuario"] == usuario_sel]
-        if acao_sel != "Todas":
-            df_logs = df_logs[df_logs["acao"] == acao_sel]
-        df_logs = df_logs.sort_values("id", ascending=False).head(int(limite))
+    # sem a contagem no rótulo: o rótulo entra na identidade do widget e a
+    # seleção se perderia a cada novo evento
+    usuario_sel = col1.selectbox("Usuário", [None] + list(facetas["usuario"]), format_func=lambda v: "Todos" if v is None else v)
+    acao_sel = col2.selectbox("Ação", [None] + list(facetas["acao"]), format_func=lambda v: "Todas" if v is None else v)
+    rot_obras = ref_rotulos(OBRAS)
+    obra_sel = col3.selectbox("Obra", [None] + rot_obras.ids, format_func=lambda i: "Todas" if i is None else rot_obras(i))
+    col4, col5, col6 = st.columns(3)
+    de = col4.date_input("De", value=None, format="DD/MM/YYYY")
+    ate = col5.date_input("Até", value=None, format="DD/MM/YYYY")
+    limite = col6.number_input("Mostrar últimos (registros)", min_value=50, max_value=100000, value=200, step=50)
+
+    # filtro, ordem e limite no servidor: busca só os N registros mostrados
+    log_filters = {}
+    if usuario_sel is not None:
+        log_filters["usuario"] = usuario_sel
+    if acao_sel is not None:
+        log_filters["acao"] = acao_sel
+    if obra_sel is not None:
+        log_filters["obra_id"] = int(obra_sel)
+    fim = (ate + timedelta(days=1)).isoformat() if ate else None
+    if de and fim:
+        log_filters["timestamp"] = ("entre", (de.isoformat(), fim))
+    elif de:
+        log_filters["timestamp"] = ("gte", de.isoformat())
+    elif fim:
+        log_filters["timestamp"] = ("lt", fim)
+    df_logs = sb_select_df("auditoria", filters=log_filters or None, desc=True, max_rows=int(limite))
+    # o que faltar para o limite vem do arquivo (registros mais antigos)
+    if len(df_logs) < limite:
+        antigos = arquivo_auditoria().consultar(log_filters, limite=int(limite) - len(df_logs))
+        if not antigos.empty:
+            st.caption(f"{len(antigos)} registro(s) do arquivo (mais de {ARQUIVO_DIAS} dias).")
+            cols = df_logs.columns if not df_logs.empty else antigos.columns
+            df_logs = pd.concat([d.dropna(axis=1, how="all") for d in (df_logs, antigos) if not d.empty], ignore_index=True).reindex(columns=cols)
     st.dataframe(df_logs if not df_logs.empty else pd.DataFrame(), use_container_width=True)
 
     if not df_logs.empty and st.button("Exportar CSV"):
         csv_bytes = df_logs.to_csv(index=False).encode("utf-8-sig")
         st.download_button("Baixar CSV", data=csv_bytes, file_name="logs.csv", mime="text/csv")
 
+    if can_edit("ver_admin"):
+        with st.expander("Arquivo da auditoria"):
+            parts = arquivo_auditoria().particoes()
+            st.caption(f"Partições mensais: {', '.join(sorted(parts)) if parts else 'nenhuma'}.")
+            dias = st.number_input("Arquivar registros com mais de (dias)", min_value=1, value=ARQUIVO_DIAS, step=30)
+            if st.button("Arquivar agora"):
+                try:
+                    with st.spinner("Arquivando..."):
+                        n = arquivar_auditoria(int(dias))
+                    log_event(user["nome"], "arquivar_auditoria", detalhes={"dias": int(dias), "registros": n})
+                    st.success(f"{n} registro(s) arquivado(s).")
+                except Exception as e:
+                    st.error(f"Falha ao arquivar: {e}")
+
 # -------------------- Admin (Usuários) --------------------
 if page == "Admin" and can_view("Admin") and can_edit("editar_usuarios"):
     st.header("Administração de Usuários")
 
-    users = pd.DataFrame(sb_select("usuarios", order="username"))
+    users = sb_consulta_df(USUARIOS)
     if users.empty:
         st.info("Nenhum usuário na base.")
     else:
@@ -603,7 +1251,7 @@ if page == "Admin" and can_view("Admin") and can_edit("editar_usuarios"):
 
     st.divider()
     st.subheader("Editar usuário existente")
-    users = pd.DataFrame(sb_select("usuarios", order="username"))
+    users = sb_consulta_df(USUARIOS)
     if not users.empty:
         opts = {f"{r['nome']} ({r['username']})": r["username"] for _, r in users.iterrows()}
         sel = st.selectbox("Selecione um usuário", list(opts.keys()))
@@ -648,48 +1296,92 @@ if page == "Admin" and can_view("Admin") and can_edit("editar_usuarios"):
                 st.success("Alterações salvas.")
                 log_event(user["nome"], "alterar_usuario", detalhes={"username": uname, "role": eu_role, "ativo": update["ativo"]})
 
+# -------------------- Desempenho --------------------
+if page == "Desempenho" and can_view("Desempenho"):
+    st.header("Desempenho")
+    st.caption("Tempo de cada chamada ao banco (sb_*) neste processo, de todas as sessões. Inclui só o que foi ao banco: leituras servidas pelo cache não aparecem.")
+
+    eventos = _traco.eventos()
+    telas = sorted({e["pagina"] for e in eventos if e["pagina"]})
+    tela_sel = st.selectbox("Tela", ["Todas"] + telas, key="desemp_tela")
+    if tela_sel != "Todas":
+        eventos = [e for e in eventos if e["pagina"] == tela_sel]
+
+    reruns = por_rerun(eventos)
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Chamadas", len(eventos))
+    c2.metric("Reruns", len(reruns))
+    c3.metric("Chamadas por rerun", f"{reruns['chamadas'].mean():.1f}" if len(reruns) else "—")
+    c4.metric("Banco por rerun (p95)", f"{reruns['banco_ms'].quantile(0.95):.0f} ms" if len(reruns) else "—")
+
+    st.subheader("Inicialização")
+    _tempos = tempos_app()
+    _menu = pd.Series(list(_tempos["menu_ms"]), dtype=float)
+    _p = _tempos["partida"]
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Partida do processo", f"{_p['total_ms']:.0f} ms" if _p else "—", help="1º rerun até o login: imports, backend e verificação do admin")
+    c2.metric("Imports na partida", f"{_p['imports_ms']:.0f} ms" if _p else "—")
+    c3.metric("Rerun até o menu (p50)", f"{_menu.quantile(0.5):.0f} ms" if len(_menu) else "—")
+    c4.metric("Rerun até o menu (p95)", f"{_menu.quantile(0.95):.0f} ms" if len(_menu) else "—")
+    if _p:
+        st.caption(f"Processo iniciado em {_p['em']}; criação do backend: {_p['backend_ms']:.0f} ms.")
+
+    st.subheader("Por tabela")
+    st.dataframe(por_tabela(eventos), use_container_width=True, hide_index=True)
+    st.subheader("Últimos reruns")
+    st.dataframe(reruns.head(100), use_container_width=True, hide_index=True)
+
+    col_a, col_b = st.columns(2)
+    col_a.download_button("Exportar traço (JSON lines)", data=traco_jsonl(eventos), file_name=f"traco_{datetime.now():%Y%m%d_%H%M}.jsonl", mime="application/x-ndjson", disabled=not eventos)
+    if col_b.button("Limpar traço"):
+        _traco.limpar()
+        st.rerun()
+
 # -------------------- Correções (simplificado) --------------------
 if page == "Correções" and can_view("Correções") and can_edit("corrigir_registros"):
     st.header("Correções")
     st.caption("Anule lançamentos e ajuste estado de serviço; tudo vai para auditoria.")
 
-    obras = pd.DataFrame(sb_select("obras", order="nome"))
+    obras = ref_df(OBRAS)
     if obras.empty:
         st.info("Não há obras cadastradas.")
     else:
-        obra_nome = st.selectbox("Obra", obras["nome"].tolist(), key="cor_ob")
-        obra_id = int(obras.loc[obras["nome"]==obra_nome, "id"].iloc[0])
+        rot_obras = ref_rotulos(OBRAS)
+        obra_id = st.selectbox("Obra", rot_obras.ids, format_func=rot_obras, key="cor_ob")
+        obra_nome = rot_obras(obra_id)
 
-        casas = pd.DataFrame(sb_select("casas", filters={"obra_id": obra_id}, order="lote"))
-        lanc = pd.DataFrame(sb_select("lancamentos", filters={"obra_id": obra_id}))
+        casas = ref_df(CASAS, filters={"obra_id": obra_id})
+        # só casa_id dos lançamentos ativos; o detalhe vem depois, só da casa escolhida
+        lanc = sb_consulta_df(LANC_CASAS, filters={"obra_id": obra_id, "anulado": False})
         if casas.empty or lanc.empty:
             st.info("Não há casas/lançamentos nesta obra.")
         else:
             st.subheader("Casas com lançamentos")
-            casas_lanc = lanc[~lanc["anulado"]].merge(casas[["id","lote"]], left_on="casa_id", right_on="id", how="inner")
+            casas_lanc = casas_com_lancamentos(lanc, casas)
             if casas_lanc.empty:
                 st.info("Não há lançamentos ativos.")
             else:
-                lotes = sorted(casas_lanc["lote"].unique().tolist())
-                lote_sel = st.selectbox("Casa (lote)", lotes)
-                casa_id = int(casas.loc[casas["lote"]==lote_sel, "id"].iloc[0])
+                rot_casas = ref_rotulos(CASAS, "lote", filters={"obra_id": obra_id})
+                casa_ids = casas_lanc["casa_id"].astype(int).tolist()
+                casa_id = st.selectbox("Casa (lote)", casa_ids, format_func=rot_casas)
 
-                servs = pd.DataFrame(sb_select("servicos", filters={"obra_id": obra_id}))
+                servs = ref_df(SERVICOS, filters={"obra_id": obra_id})
                 if servs.empty:
                     st.info("Sem serviços.")
                 else:
-                    lan_casa = lanc[(lanc["casa_id"]==casa_id) & (~lanc["anulado"])].copy()
-                    lan_casa = lan_casa.merge(servs[["id","nome","etapa"]], left_on="servico_id", right_on="id", how="left", suffixes=("","_srv"))
+                    lan_casa = sb_consulta_df(LANC_CORRECAO, filters={"obra_id": obra_id, "casa_id": casa_id, "anulado": False})
+                    lan_casa = lancamentos_servico(lan_casa, servs)
                     etapa_opts = ["Todas"] + sorted([e for e in lan_casa["etapa"].dropna().unique().tolist()])
                     etapa_sel = st.selectbox("Etapa", etapa_opts)
                     if etapa_sel != "Todas":
                         lan_casa = lan_casa[lan_casa["etapa"] == etapa_sel]
-                    serv_opts = sorted(lan_casa["nome"].dropna().unique().tolist())
-                    if not serv_opts:
+                    serv_ids = lan_casa.dropna(subset=["nome"]).drop_duplicates("servico_id").sort_values("nome")["servico_id"].astype(int).tolist()
+                    if not serv_ids:
                         st.info("Sem lançamentos nesta seleção.")
                     else:
-                        serv_nome = st.selectbox("Serviço", serv_opts)
-                        sid = int(servs.loc[servs["nome"]==serv_nome, "id"].iloc[0])
+                        # com "Todas", o mesmo nome pode existir em etapas diferentes
+                        rot_servs = ref_rotulos(SERVICOS, ("nome", "etapa") if etapa_sel == "Todas" else "nome", filters={"obra_id": obra_id})
+                        sid = st.selectbox("Serviço", serv_ids, format_func=rot_servs)
 
                         st.subheader("Últimos lançamentos (ativos)")
                         ults = lan_casa[lan_casa["servico_id"]==sid].sort_values("created_at", ascending=False).head(5)
@@ -715,7 +1407,7 @@ if page == "Correções" and can_view("Correções") and can_edit("corrigir_regi
                                         st.rerun()
                         with cb:
                             st.markdown("### Ajustar estado do serviço")
-                            estado = pd.DataFrame(sb_select("estado_servicos", filters={"casa_id": casa_id, "servico_id": sid}, limit=1))
+                            estado = sb_consulta_df(ESTADO_AJUSTE, filters={"casa_id": casa_id, "servico_id": sid}, limit=1)
                             cur_status = estado["status"].iloc[0] if not estado.empty else "Não iniciado"
                             cur_exec = estado["executor"].iloc[0] if not estado.empty else ""
                             cur_ini = estado["data_inicio"].iloc[0] if not estado.empty else None
@@ -740,21 +1432,44 @@ if page == "Correções" and can_view("Correções") and can_edit("corrigir_regi
 # -------------------- Ativar Casa --------------------
 if page == "Ativar Casa":
     st.header("Ativar Casa (por frente de serviço)")
-    obras = pd.DataFrame(sb_select("obras", order="nome"))
+    obras = ref_df(OBRAS)
     if obras.empty:
         st.warning("Não há obras cadastradas.")
     else:
-        obra_nome = st.selectbox("Obra", obras["nome"].tolist())
-        obra_id = int(obras.loc[obras["nome"]==obra_nome, "id"].iloc[0])
-        casas = pd.DataFrame(sb_select("casas", filters={"obra_id": obra_id}, order="lote"))
+        rot_obras = ref_rotulos(OBRAS)
+        obra_id = st.selectbox("Obra", rot_obras.ids, format_func=rot_obras)
+        obra_nome = rot_obras(obra_id)
+        casas = ref_df(CASAS, filters={"obra_id": obra_id})
         if casas.empty:
             st.info("Cadastre casas na aba Base de Dados → Casas.")
             st.stop()
-        lote = st.selectbox("Lote (Identificador)", casas["lote"].tolist())
-        casa_id = int(casas.loc[casas["lote"]==lote, "id"].iloc[0])
+
+        modo = st.radio("Modo", ["Uma casa", "Várias casas (quadra / seleção)"], horizontal=True, key="ativ_modo")
+        if modo != "Uma casa":
+            etapa = st.selectbox("Frente de serviço (etapa)", ["Reboco","Pintura","Revestimento"], index=0, key="ativ_massa_et")
+            casas["ativa_etapa"] = indice_ativacoes(obra_id, etapa).mascara(casas["id"], etapa)
+            inativas = casas[~casas["ativa_etapa"]]
+            st.caption(f"{len(casas) - len(inativas)} de {len(casas)} casas já estão ativas em {etapa}.")
+            if inativas.empty:
+                st.info("Todas as casas desta obra já estão ativas nesta etapa.")
+                st.stop()
+            prefixo = st.text_input("Selecionar por prefixo do lote (ex.: QD 3)", key="ativ_massa_pref")
+            lotes_sel = st.multiselect("Lotes a ativar", inativas["lote"].tolist(), default=lotes_por_prefixo(inativas["lote"].tolist(), prefixo), key=f"ativ_massa_lotes_{prefixo}")
+            if st.button(f"Ativar {len(lotes_sel)} casa(s) em {etapa}", disabled=not lotes_sel):
+                ids_por_lote = dict(zip(inativas["lote"], inativas["id"].astype(int)))
+                barra = st.progress(0.0, text="Semeando serviços...")
+                total = ativar_frentes(obra_id, [ids_por_lote[l] for l in lotes_sel], etapa, user["nome"], progresso=lambda f, t: barra.progress(f / t, text=f"Semeando serviços... {f}/{t}"))
+                log_event(user["nome"], "ativar_frente_massa", obra_id=obra_id, detalhes={"etapa": etapa, "lotes": lotes_sel, "estados": total})
+                st.success(f"{len(lotes_sel)} casa(s) ativadas em {etapa} ({total} serviços semeados).")
+                st.rerun()
+            st.stop()
+
+        rot_casas = ref_rotulos(CASAS, "lote", filters={"obra_id": obra_id})
+        casa_id = st.selectbox("Lote (Identificador)", rot_casas.ids, format_func=rot_casas)
+        lote = rot_casas(casa_id)
         etapa = st.selectbox("Frente de serviço (etapa)", ["Reboco","Pintura","Revestimento"], index=0)
 
-        ativ = pd.DataFrame(sb_select("casa_ativacoes", filters={"casa_id": casa_id, "etapa": etapa}, limit=1))
+        ativ = ref_df(ATIVACAO_CASA, filters={"casa_id": casa_id, "etapa": etapa}, limit=1)
         ativa_flag = bool(ativ["ativa"].iloc[0]) if not ativ.empty else False
         ativa_em = ativ["ativa_em"].iloc[0] if not ativ.empty else None
         ativa_por = ativ["ativa_por"].iloc[0] if not ativ.empty else None
@@ -768,23 +1483,19 @@ if page == "Ativar Casa":
         else:
             st.info(f"Casa {lote} — {etapa} está INATIVA.")
             if st.button("Ativar esta frente (etapa)"):
-                now = datetime.utcnow().isoformat()
-                sb_upsert("casa_ativacoes", {"casa_id": casa_id, "etapa": etapa, "ativa": True, "ativa_em": now, "ativa_por": user["nome"]}, on_conflict="casa_id,etapa")
-                # Semear estado_servicos para serviços desta etapa
-                servs = sb_select("servicos", filters={"obra_id": obra_id, "etapa": etapa})
-                for s in servs:
-                    sb_upsert("estado_servicos", {"casa_id": casa_id, "servico_id": s["id"], "status": "Não iniciado", "executor": "", "data_inicio": None, "data_fim": None, "updated_at": now}, on_conflict="casa_id,servico_id")
+                # ativa e semeia estado_servicos para os serviços desta etapa
+                ativar_frentes(obra_id, [casa_id], etapa, user["nome"])
                 log_event(user["nome"], "ativar_frente", obra_id=obra_id, casa_id=casa_id, detalhes={"lote": lote, "etapa": etapa})
                 st.success(f"Casa {lote} — {etapa} ativada com sucesso!")
                 st.rerun()
 
         st.divider()
         st.subheader("Status de serviços (somente leitura)")
-        servs = pd.DataFrame(sb_select("servicos", filters={"obra_id": obra_id, "etapa": etapa}, order="nome"))
+        servs = ref_df(SERVICOS, filters={"obra_id": obra_id, "etapa": etapa})
         if servs.empty:
             st.info("Ainda não há serviços cadastrados para esta etapa.")
         else:
-            estado = pd.DataFrame(sb_select("estado_servicos", filters={"casa_id": casa_id}))
+            estado = estado_casa(casa_id)
             estado = estado.merge(servs[["id","nome"]], left_on="servico_id", right_on="id", how="right")
             estado = estado.rename(columns={"nome": "servico"})[["servico","status","executor","data_inicio","data_fim","updated_at"]]
             st.dataframe(estado, use_container_width=True)
@@ -792,46 +1503,46 @@ if page == "Ativar Casa":
 # -------------------- Lançamentos --------------------
 if page == "Lançamentos" and can_view("Lançamentos"):
     st.header("Iniciar/Finalizar Serviços")
-    obras = pd.DataFrame(sb_select("obras", order="nome"))
+    obras = ref_df(OBRAS)
     if obras.empty:
         st.warning("Não há obras cadastradas.")
     else:
-        obra_nome = st.selectbox("Obra", obras["nome"].tolist())
-        obra_id = int(obras.loc[obras["nome"]==obra_nome, "id"].iloc[0])
+        rot_obras = ref_rotulos(OBRAS)
+        obra_id = st.selectbox("Obra", rot_obras.ids, format_func=rot_obras)
+        obra_nome = rot_obras(obra_id)
 
-        etapas = pd.DataFrame(sb_select("etapas", filters={"obra_id": obra_id}, order="nome"))
+        etapas = ref_df(ETAPAS, filters={"obra_id": obra_id})
         if etapas.empty:
             st.info("Cadastre etapas na Base de Dados.")
             st.stop()
         etapa = st.selectbox("Etapa", etapas["nome"].tolist(), index=0)
 
         # Casas ativas para a etapa
-        casas = pd.DataFrame(sb_select("casas", filters={"obra_id": obra_id}, order="lote"))
-        ativacoes = pd.DataFrame(sb_select("casa_ativacoes", filters={"etapa": etapa}))
+        casas = ref_df(CASAS, filters={"obra_id": obra_id})
         if casas.empty:
             st.info("Cadastre casas na Base de Dados.")
             st.stop()
-        casas["ativa_etapa"] = casas["id"].apply(lambda cid: bool((ativacoes[ativacoes["casa_id"]==cid]["ativa"]==True).any()))
+        casas["ativa_etapa"] = indice_ativacoes(obra_id, etapa).mascara(casas["id"], etapa)
         casas_ativas = casas[casas["ativa_etapa"]]
         if casas_ativas.empty:
             st.info("Não há casas ativas para esta etapa nesta obra.")
             st.stop()
-        lote = st.selectbox("Lote (Identificador)", casas_ativas["lote"].tolist())
-        casa_id = int(casas_ativas.loc[casas_ativas["lote"]==lote, "id"].iloc[0])
+        rot_casas = ref_rotulos(CASAS, "lote", filters={"obra_id": obra_id})
+        casa_id = st.selectbox("Lote (Identificador)", casas_ativas["id"].astype(int).tolist(), format_func=rot_casas)
 
         # Serviços da etapa
-        servs = pd.DataFrame(sb_select("servicos", filters={"obra_id": obra_id, "etapa": etapa}, order="nome"))
+        servs = ref_df(SERVICOS, filters={"obra_id": obra_id, "etapa": etapa})
         if servs.empty:
             st.info("Cadastre serviços para esta etapa.")
             st.stop()
 
         # Sugerir não concluídos
-        estado = pd.DataFrame(sb_select("estado_servicos", filters={"casa_id": casa_id}))
-        sugest = servs[["id","nome"]].merge(estado[["servico_id","status"]], left_on="id", right_on="servico_id", how="left")
-        sugest["status"] = sugest["status"].fillna("Não iniciado")
+        estado = estado_casa(casa_id)
+        sugest = sugestoes(servs, estado)
         nao_conc = sugest[sugest["status"] != "Concluído"]
 
-        mult_sel = st.multiselect("Selecione os serviços para INICIAR (em execução)", nao_conc["nome"].tolist())
+        rot_servs = ref_rotulos(SERVICOS, filters={"obra_id": obra_id, "etapa": etapa})
+        mult_sel = st.multiselect("Selecione os serviços para INICIAR (em execução)", nao_conc["id"].astype(int).tolist(), format_func=rot_servs)
         col_m1, col_m2, col_m3 = st.columns(3)
         executor_multi = col_m1.text_input("Executor (para todos)", value="")
         data_inicio_multi = col_m2.date_input("Data de início (para todos)", value=date.today())
@@ -844,12 +1555,13 @@ if page == "Lançamentos" and can_view("Lançamentos"):
                 st.warning("Selecione pelo menos um serviço.")
             else:
                 now = datetime.utcnow().isoformat()
-                for nome in mult_sel:
-                    sid = int(servs.loc[servs["nome"]==nome, "id"].iloc[0])
-                    sb_upsert("estado_servicos", {"casa_id": casa_id, "servico_id": sid, "status": "Em execução", "executor": executor_multi or "", "data_inicio": data_inicio_multi.isoformat(), "updated_at": now}, on_conflict="casa_id,servico_id")
-                    sb_insert("lancamentos", {"obra_id": obra_id, "casa_id": casa_id, "servico_id": sid, "responsavel": user["nome"], "executor": executor_multi or "", "status": "Em execução", "data_inicio": data_inicio_multi.isoformat(), "observacoes": obs_multi, "created_at": now})
+                sids = [int(sid) for sid in mult_sel]
+                # vai para a fila local: confirma na hora, mesmo sem sinal
+                estados = [{"casa_id": casa_id, "servico_id": sid, "status": "Em execução", "executor": executor_multi or "", "data_inicio": data_inicio_multi.isoformat(), "updated_at": now} for sid in sids]
+                lancs = [{"obra_id": obra_id, "casa_id": casa_id, "servico_id": sid, "responsavel": user["nome"], "executor": executor_multi or "", "status": "Em execução", "data_inicio": data_inicio_multi.isoformat(), "observacoes": obs_multi, "created_at": now} for sid in sids]
+                fila_escrita().enfileirar("lancamentos", {"estados": estados, "lancamentos": lancs})
+                log_event(user["nome"], "iniciar_servicos_multiplos", obra_id=obra_id, casa_id=casa_id, detalhes={"servicos": [rot_servs(sid) for sid in sids], "executor": executor_multi, "data_inicio": data_inicio_multi.isoformat(), "obs": obs_multi})
                 st.success(f"Iniciado(s): {len(mult_sel)} serviço(s).")
-                log_event(user["nome"], "iniciar_servicos_multiplos", obra_id=obra_id, casa_id=casa_id, detalhes={"servicos": mult_sel, "executor": executor_multi, "data_inicio": data_inicio_multi.isoformat(), "obs": obs_multi})
                 st.rerun()
 
         st.divider()
@@ -858,137 +1570,185 @@ if page == "Lançamentos" and can_view("Lançamentos"):
         if em_exec.empty:
             st.info("Não há serviços em execução para finalizar.")
         else:
-            servico_nome = st.selectbox("Serviço em execução", em_exec["nome"].tolist())
-            servico_id = int(servs.loc[servs["nome"]==servico_nome, "id"].iloc[0])
+            servico_id = st.selectbox("Serviço em execução", em_exec["id"].astype(int).tolist(), format_func=rot_servs)
+            servico_nome = rot_servs(servico_id)
             data_fim = st.date_input("Data de conclusão", value=date.today())
             obs = st.text_area("Observações (opcional)")
             foto = st.camera_input("Foto da conclusão (opcional)")
-            foto_url = None
-            if foto:
-                foto_url = upload_foto(foto.getvalue(), f"{obra_id}_{casa_id}_{servico_id}_{int(datetime.utcnow().timestamp())}.jpg")
 
             if st.button("✅ Finalizar serviço selecionado"):
                 if not can_edit("editar_lancamentos"):
                     st.error("Sem permissão para editar lançamentos.")
                 else:
                     now = datetime.utcnow().isoformat()
-                    sb_update("estado_servicos", {"status":"Concluído", "data_fim": data_fim.isoformat(), "updated_at": now}, {"casa_id": casa_id, "servico_id": servico_id})
-                    sb_insert("lancamentos", {"obra_id": obra_id, "casa_id": casa_id, "servico_id": servico_id, "responsavel": user["nome"], "executor": "", "status": "Concluído", "data_conclusao": data_fim.isoformat(), "observacoes": obs, "foto_path": foto_url, "created_at": now})
+                    foto_url = enfileirar_foto(foto.getvalue()) if foto else None
+                    executor_atual = estado.loc[estado["servico_id"] == servico_id, "executor"].iloc[0]
+                    fila_escrita().enfileirar("lancamentos", {
+                        "estados": [{"casa_id": casa_id, "servico_id": servico_id, "status": "Concluído", "executor": executor_atual if pd.notna(executor_atual) else "", "data_fim": data_fim.isoformat(), "updated_at": now}],
+                        "lancamentos": [{"obra_id": obra_id, "casa_id": casa_id, "servico_id": servico_id, "responsavel": user["nome"], "executor": "", "status": "Concluído", "data_conclusao": data_fim.isoformat(), "observacoes": obs, "foto_path": foto_url, "created_at": now}],
+                    })
                     st.success(f"Serviço '{servico_nome}' finalizado.")
                     log_event(user["nome"], "finalizar_servico", obra_id=obra_id, casa_id=casa_id, servico_id=servico_id, detalhes={"servico": servico_nome, "data_fim": data_fim.isoformat(), "obs": obs})
                     st.rerun()
 
         st.divider()
         st.subheader("Estado atual dos serviços desta casa/etapa")
-        estado = pd.DataFrame(sb_select("estado_servicos", filters={"casa_id": casa_id}))
+        estado = estado_casa(casa_id)
         estado = estado.merge(servs[["id","nome"]], left_on="servico_id", right_on="id", how="right")
-        estado = estado.rename(columns={"nome":"servico"})[["servico","status","executor","data_inicio","data_fim","updated_at"]]
+        estado["sincronizado"] = ~estado["pendente"].eq(True)
+        estado = estado.rename(columns={"nome":"servico"})[["servico","status","executor","data_inicio","data_fim","updated_at","sincronizado"]]
         st.dataframe(estado, use_container_width=True)
 
 # -------------------- Dashboard --------------------
 if page == "Dashboard":
     st.header("Dashboard (visão por CASA)")
-    obras = pd.DataFrame(sb_select("obras", order="nome"))
+    obras = ref_df(OBRAS)
     if obras.empty:
         st.info("Nenhuma obra cadastrada.")
         st.stop()
     col_f1, col_f2 = st.columns(2)
-    obra_sel = col_f1.selectbox("Obra", obras["nome"].tolist())
-    obra_id = int(obras.loc[obras["nome"]==obra_sel, "id"].iloc[0])
-    etapas = pd.DataFrame(sb_select("etapas", filters={"obra_id": obra_id}, order="nome"))
+    rot_obras = ref_rotulos(OBRAS)
+    obra_id = col_f1.selectbox("Obra", rot_obras.ids, format_func=rot_obras)
+    etapas = ref_df(ETAPAS, filters={"obra_id": obra_id})
     etapa_opts = ["Todas"] + (etapas["nome"].tolist() if not etapas.empty else [])
     etapa_sel = col_f2.selectbox("Etapa", etapa_opts, index=0)
 
-    casas = pd.DataFrame(sb_select("casas", filters={"obra_id": obra_id}, order="lote"))
-    if casas.empty:
-        st.info("Não há casas para esta obra.")
-        st.stop()
-    casa_ids = casas["id"].tolist()
+    ao_vivo = DASH_TEMPO_REAL and st.toggle("Ao vivo", value=True, help="Atualiza sozinho a cada poucos segundos com as alterações do banco, sem recarregar tudo.")
+
+    no_script = True  # False depois do rerun completo: aí painel() roda sozinho, pelo timer
+
+    @st.fragment(run_every=DASH_AO_VIVO_S if ao_vivo else None)
+    def painel():
+        if not no_script:
+            # rerun só do fragmento: id próprio no traço, senão as chamadas
+            # dele somariam no rerun completo anterior
+            _traco.novo_rerun(f"{page} (ao vivo)")
+        # resumo incremental: a cada atualização só as linhas alteradas trafegam
+        resumo = pd.DataFrame(dashboard_resumo(obra_id, None if etapa_sel == "Todas" else etapa_sel))
+        if resumo.empty:
+            st.info("Não há casas para esta obra.")
+            return
+        total_count = int(resumo["total_serv"].iloc[0])
+
+        def classifica(row):
+            if not row["ativa_etapa"]:
+                return "Não iniciado"
+            if total_count > 0 and row["concluidos"] == total_count:
+                return "Concluído"
+            return "Em execução"
+
+        resumo["status_casa"] = resumo.apply(classifica, axis=1)
+        resumo["progresso_%"] = ((resumo["concluidos"] + resumo["em_exec"]) / total_count * 100 if total_count > 0 else 0)
+        resumo["progresso_%"] = resumo["progresso_%"].fillna(0).round(1)
+        resumo = resumo.rename(columns={"lote":"Lote"})
 
-    ativacoes = pd.DataFrame(sb_select("casa_ativacoes"))
-    if etapa_sel == "Todas":
-        casas["ativa_etapa"] = casas["id"].apply(lambda cid: bool((ativacoes[ativacoes["casa_id"]==cid]["ativa"]==True).any()))
-    else:
-        casas["ativa_etapa"] = casas["id"].apply(lambda cid: bool((ativacoes[(ativacoes["casa_id"]==cid) & (ativacoes["etapa"]==etapa_sel)]["ativa"]==True).any()))
-
-    estado = pd.DataFrame(sb_select("estado_servicos", filters=None))
-    servs = pd.DataFrame(sb_select("servicos", filters={"obra_id": obra_id}))
-    if etapa_sel != "Todas":
-        servs = servs[servs["etapa"] == etapa_sel]
-    total_count = len(servs)
-
-    if not estado.empty:
-        estado = estado.merge(servs[["id","etapa"]], left_on="servico_id", right_on="id", how="inner")
-        if etapa_sel != "Todas":
-            estado = estado[estado["etapa"] == etapa_sel]
-
-    exec_por_casa = estado[estado["status"] == "Em execução"].groupby("casa_id")["servico_id"].nunique().rename("em_exec") if not estado.empty else pd.Series(dtype=int)
-    concl_por_casa = estado[estado["status"] == "Concluído"].groupby("casa_id")["servico_id"].nunique().rename("concluidos") if not estado.empty else pd.Series(dtype=int)
-
-    resumo = casas.copy()
-    resumo["total_serv"] = total_count
-    resumo = resumo.merge(concl_por_casa, left_on="id", right_index=True, how="left")
-    resumo = resumo.merge(exec_por_casa, left_on="id", right_index=True, how="left")
-    resumo["concluidos"] = resumo["concluidos"].fillna(0).astype(int)
-    resumo["em_exec"] = resumo["em_exec"].fillna(0).astype(int)
-
-    def classifica(row):
-        if not row["ativa_etapa"]:
-            return "Não iniciado"
-        if total_count > 0 and row["concluidos"] == total_count:
-            return "Concluído"
-        return "Em execução"
-
-    resumo["status_casa"] = resumo.apply(classifica, axis=1)
-    resumo["progresso_%"] = ((resumo["concluidos"] + resumo["em_exec"]) / total_count * 100 if total_count > 0 else 0)
-    resumo["progresso_%"] = resumo["progresso_%"].fillna(0).round(1)
-    resumo = resumo.rename(columns={"lote":"Lote"})
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Casas — Não iniciado", int((resumo["status_casa"] == "Não iniciado").sum()))
+        c2.metric("Casas — Em execução", int((resumo["status_casa"] == "Em execução").sum()))
+        c3.metric("Casas — Concluídas (100%)", int((resumo["status_casa"] == "Concluído").sum()))
 
+        st.divider()
+        st.dataframe(resumo[["Lote","status_casa","progresso_%"]], use_container_width=True, hide_index=True)
+        if ao_vivo:
+            f = feed_alteracoes().stats()
+            st.caption(("🟢 Ao vivo" if f["conectado"] else "🟡 Feed desconectado, usando consulta incremental") + f" · {f['eventos']} alterações recebidas")
+
+    painel()
+    no_script = False
+
+# -------------------- Previsto × Executado --------------------
+if page == "Previsto × Executado" and can_view("Previsto × Executado"):
+    st.header("Previsto × Executado (lote × serviço)")
+    obras = ref_df(OBRAS)
+    if obras.empty:
+        st.info("Nenhuma obra cadastrada.")
+        st.stop()
+    rot_obras = ref_rotulos(OBRAS)
+    obra_id = st.selectbox("Obra", rot_obras.ids, format_func=rot_obras, key="pe_obra")
+    obra_sel = rot_obras(obra_id)
+    matrizes = matrizes_previsto_executado(obra_id)
+    if not matrizes:
+        st.info("Cadastre casas e serviços na Base de Dados.")
+        st.stop()
+    etapa_sel = st.selectbox("Etapa", list(matrizes), key="pe_etapa")
+    m = matrizes[etapa_sel]
+    servs_cols = [c for c in m.columns if c not in ("Concluídos", "% executado")]
+    previsto = m.shape[0] * len(servs_cols)
+    concl = int(m["Concluídos"].sum())
     c1, c2, c3 = st.columns(3)
-    c1.metric("Casas — Não iniciado", int((resumo["status_casa"] == "Não iniciado").sum()))
-    c2.metric("Casas — Em execução", int((resumo["status_casa"] == "Em execução").sum()))
-    c3.metric("Casas — Concluídas (100%)", int((resumo["status_casa"] == "Concluído").sum()))
-
-    st.divider()
-    st.dataframe(resumo[["Lote","status_casa","progresso_%"]], use_container_width=True, hide_index=True)
+    c1.metric("Previsto (casa × serviço)", previsto)
+    c2.metric("Concluído", concl)
+    c3.metric("% executado", f"{(concl / previsto * 100 if previsto else 0):.1f}%")
+    st.dataframe(m.style.map(lambda v: f"background-color: #{CORES[v]}" if v in CORES else "", subset=servs_cols), use_container_width=True)
+
+    if st.button("Gerar Excel da obra (todas as etapas)"):
+        t0 = time.perf_counter()
+        st.session_state["pe_xlsx"] = (obra_id, exportar_xlsx(matrizes, titulo=f"Previsto × Executado — {obra_sel} — {datetime.now():%d/%m/%Y %H:%M}"))
+        st.caption(f"Planilha gerada em {time.perf_counter() - t0:.1f}s.")
+    xlsx = st.session_state.get("pe_xlsx")
+    if xlsx and xlsx[0] == obra_id:
+        st.download_button("Baixar Excel", data=xlsx[1], file_name=f"previsto_executado_{obra_sel}.xlsx",
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
 # -------------------- Observações --------------------
 if page == "Observações":
     st.header("Observações por Casa")
     st.caption("Veja (e exporte) todas as observações lançadas em Início e Finalização.")
 
-    obras = pd.DataFrame(sb_select("obras", order="nome"))
+    obras = ref_df(OBRAS)
     if obras.empty:
         st.info("Não há obras cadastradas.")
         st.stop()
-    obra_sel = st.selectbox("Obra", obras["nome"].tolist(), key="obs_ob")
-    obra_id = int(obras.loc[obras["nome"]==obra_sel, "id"].iloc[0])
+    rot_obras = ref_rotulos(OBRAS)
+    obra_id = st.selectbox("Obra", rot_obras.ids, format_func=rot_obras, key="obs_ob")
+    obra_sel = rot_obras(obra_id)
+
+    termos = st.text_input("Buscar em todas as casas da obra", key="obs_busca", placeholder="ex.: infiltração, retrabalho").strip()
+    if termos:
+        if st.session_state.get("obs_busca_ant") != (obra_id, termos):
+            st.session_state["obs_busca_ant"] = (obra_id, termos)
+            st.session_state["obs_pag"] = 1
+        pagina = int(st.session_state.get("obs_pag", 1))
+        rows, total = buscar_observacoes(obra_id, termos, limite=OBS_POR_PAGINA, offset=(pagina - 1) * OBS_POR_PAGINA)
+        paginas = max(1, -(-total // OBS_POR_PAGINA))
+        st.write(f"Observações encontradas: **{total}**")
+        colunas = ["lote", "etapa", "servico", "status", "created_at", "trecho", "responsavel", "executor", "foto_path"]
+        res = pd.DataFrame(rows, columns=colunas).rename(columns={"created_at": "data", "foto_path": "foto"})
+        st.dataframe(res.assign(foto=res["foto"].map(url_miniatura)), use_container_width=True, hide_index=True,
+                     column_config={"foto": st.column_config.ImageColumn("foto"), "trecho": st.column_config.TextColumn("observação", width="large")})
+        if paginas > 1:
+            st.number_input("Página", min_value=1, max_value=paginas, step=1, key="obs_pag")
+            st.caption(f"Página {pagina} de {paginas}.")
+        if total and st.button("Exportar CSV de todos os resultados"):
+            todos, _ = buscar_observacoes(obra_id, termos, limite=total)
+            csv = pd.DataFrame(todos).reindex(columns=["lote", "etapa", "servico", "status", "created_at", "executor", "responsavel", "observacoes", "foto_path"])
+            st.download_button("Baixar CSV", data=csv.to_csv(index=False).encode("utf-8-sig"), file_name=f"busca_observacoes_{obra_sel}.csv", mime="text/csv")
+    else:
 
-    casas = pd.DataFrame(sb_select("casas", filters={"obra_id": obra_id}, order="lote"))
-    if casas.empty:
-        st.info("Não há casas nesta obra.")
-        st.stop()
-    lote_sel = st.selectbox("Casa (lote)", casas["lote"].tolist(), key="obs_lote")
-    casa_id = int(casas.loc[casas["lote"]==lote_sel, "id"].iloc[0])
-
-    etapas = pd.DataFrame(sb_select("servicos", filters={"obra_id": obra_id}, select="etapa")).dropna()
-    etapa_opts = ["Todas"] + sorted(set([e["etapa"] for e in etapas.to_dict(orient="records")])) if not etapas.empty else ["Todas"]
-    etapa_sel = st.selectbox("Etapa (opcional)", etapa_opts, key="obs_et")
-
-    sql_rows = sb_select("lancamentos", filters={"obra_id": obra_id, "casa_id": casa_id})
-    df = pd.DataFrame(sql_rows)
-    if not df.empty:
-        df = df[df["anulado"] == False]
-        df = df[df["observacoes"].fillna("").str.strip() != ""]
-        servs = pd.DataFrame(sb_select("servicos", filters={"obra_id": obra_id}))
-        df = df.merge(servs[["id","nome","etapa"]], left_on="servico_id", right_on="id", how="left")
-        df = df.rename(columns={"created_at":"data","nome":"servico"})[["data","etapa","servico","status","executor","data_inicio","data_conclusao","observacoes","responsavel"]]
-        if etapa_sel != "Todas":
-            df = df[df["etapa"] == etapa_sel]
-
-    st.write(f"Observações encontradas: **{0 if df.empty else len(df)}**")
-    st.dataframe(df if not df.empty else pd.DataFrame(), use_container_width=True, hide_index=True)
-
-    if not df.empty:
-        csv_bytes = df.to_csv(index=False).encode("utf-8-sig")
-        st.download_button("Baixar CSV das observações", data=csv_bytes, file_name=f"observacoes_{obra_sel}_{lote_sel}.csv", mime="text/csv")
+        casas = ref_df(CASAS, filters={"obra_id": obra_id})
+        if casas.empty:
+            st.info("Não há casas nesta obra.")
+            st.stop()
+        rot_casas = ref_rotulos(CASAS, "lote", filters={"obra_id": obra_id})
+        casa_id = st.selectbox("Casa (lote)", rot_casas.ids, format_func=rot_casas, key="obs_lote")
+        lote_sel = rot_casas(casa_id)
+
+        etapas = ref_df(SERVICOS, filters={"obra_id": obra_id})["etapa"].dropna()
+        etapa_opts = ["Todas"] + sorted(set(etapas.tolist()))
+        etapa_sel = st.selectbox("Etapa (opcional)", etapa_opts, key="obs_et")
+
+        # sem anulados e sem observação vazia já no servidor
+        df = sb_consulta_df(LANC_OBSERVACOES, filters={"obra_id": obra_id, "casa_id": casa_id, "anulado": False, "observacoes": ("neq", "")})
+        if not df.empty:
+            df = tabela_observacoes(df, ref_df(SERVICOS, filters={"obra_id": obra_id}))
+            if etapa_sel != "Todas":
+                df = df[df["etapa"] == etapa_sel]
+
+        st.write(f"Observações encontradas: **{0 if df.empty else len(df)}**")
+        # na tela vai a miniatura; o CSV leva o link da foto inteira
+        tela = df.assign(foto=df["foto"].map(url_miniatura)) if not df.empty else pd.DataFrame()
+        st.dataframe(tela, use_container_width=True, hide_index=True, column_config={"foto": st.column_config.ImageColumn("foto")})
+
+        if not df.empty:
+            csv_bytes = df.to_csv(index=False).encode("utf-8-sig")
+            st.download_button("Baixar CSV das observações", data=csv_bytes, file_name=f"observacoes_{obra_sel}_{lote_sel}.csv", mime="text/csv")
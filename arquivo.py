@@ -0,0 +1,133 @@
+import io
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PASTA = "auditoria"
+ESQUEMA = pa.schema([
+    ("id", pa.int64()),
+    ("timestamp", pa.string()),
+    ("usuario", pa.string()),
+    ("acao", pa.string()),
+    ("obra_id", pa.int64()),
+    ("casa_id", pa.int64()),
+    ("servico_id", pa.int64()),
+    ("detalhes", pa.string()),
+])
+_PARQUET_OPS = {"eq": "==", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "in": "in"}
+
+
+def _caminho(mes):
+    return f"{PASTA}/{mes}.parquet"
+
+
+def _mes(caminho):
+    return os.path.basename(caminho).removesuffix(".parquet")
+
+
+def _condicoes(filters):
+    # filtros no formato dos sb_* -> lista de (coluna, op, valor) do pyarrow
+    out = []
+    for k, v in (filters or {}).items():
+        op, val = v if isinstance(v, tuple) and len(v) == 2 else ("eq", v)
+        if op == "entre":
+            out += [(k, ">=", val[0]), (k, "<", val[1])]
+        else:
+            out.append((k, _PARQUET_OPS[op], list(val) if op == "in" else val))
+    return out
+
+
+def _mes_no_intervalo(mes, conds):
+    # poda de partição: o mês AAAA-MM tem timestamps de AAAA-MM-01 até o mês seguinte
+    for col, op, val in conds:
+        if col != "timestamp":
+            continue
+        val = str(val)
+        if op in (">", ">=") and mes < val[:7] or op == "<" and f"{mes}-01" >= val or op == "<=" and f"{mes}-01" > val:
+            return False
+    return True
+
+
+def _tabela(df):
+    df = df.reindex(columns=ESQUEMA.names)
+    df["detalhes"] = [d if d is None or isinstance(d, str) else json.dumps(d, ensure_ascii=False, default=str)
+                      for d in df["detalhes"]]
+    return pa.Table.from_pandas(df, schema=ESQUEMA, preserve_index=False)
+
+
+class ArquivoAuditoria:
+    # Registros antigos da auditoria em partições mensais (auditoria/AAAA-MM.parquet,
+    # zstd, ordenadas por timestamp) no storage do backend. Nas consultas, só
+    # as partições do período são lidas, e os filtros descem para o Parquet
+    # (estatísticas por grupo de linhas). Partições de storage remoto são
+    # baixadas uma vez para `cache_dir` e rebaixadas quando mudam.
+
+    def __init__(self, db, cache_dir, linhas_por_grupo=10000):
+        self.db = db
+        self.cache_dir = cache_dir
+        self.linhas_por_grupo = linhas_por_grupo
+        self._lock = threading.Lock()
+        self._versoes = {}
+
+    def particoes(self):
+        # {mês: versão}, do mais recente para o mais antigo
+        return dict(sorted(((_mes(c), v) for c, v in self.db.listar(PASTA).items() if c.endswith(".parquet")), reverse=True))
+
+    def _local(self, mes, versao):
+        caminho = _caminho(mes)
+        if os.path.isfile(self.db.url(caminho)):
+            return self.db.url(caminho)
+        destino = os.path.join(self.cache_dir, f"{mes}.parquet")
+        with self._lock:
+            if self._versoes.get(mes) != versao or not os.path.exists(destino):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp = f"{destino}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(self.db.baixar(caminho))
+                os.replace(tmp, destino)
+                self._versoes[mes] = versao
+        return destino
+
+    def gravar(self, rows):
+        # Junta os registros às partições dos seus meses (regrava o mês inteiro;
+        # id repetido, de um arquivamento interrompido, entra uma vez só).
+        # -> {mês: linhas na partição}
+        novos = pd.DataFrame(rows, columns=ESQUEMA.names)
+        existentes = self.particoes()
+        out = {}
+        for mes, g in novos.groupby(novos["timestamp"].astype(str).str[:7], sort=True):
+            partes = [_tabela(g)]
+            if mes in existentes:
+                partes.insert(0, pq.read_table(self._local(mes, existentes[mes])))
+            t = pa.concat_tables(partes).to_pandas()
+            t = t.drop_duplicates("id", keep="last").sort_values(["timestamp", "id"], ignore_index=True)
+            buf = io.BytesIO()
+            pq.write_table(_tabela(t), buf, compression="zstd", row_group_size=self.linhas_por_grupo)
+            self.db.upload(_caminho(mes), buf.getvalue(), "application/vnd.apache.parquet")
+            out[mes] = len(t)
+        return out
+
+    def consultar(self, filters=None, limite=None):
+        # registros do arquivo com os filtros, do mais novo para o mais antigo
+        conds = _condicoes(filters)
+        partes, n = [], 0
+        for mes, versao in self.particoes().items():
+            if limite is not None and n >= limite:
+                break
+            if not _mes_no_intervalo(mes, conds):
+                continue
+            t = pq.read_table(self._local(mes, versao), filters=conds or None)
+            if t.num_rows:
+                partes.append(t.to_pandas().sort_values("id", ascending=False))
+                n += t.num_rows
+        if not partes:
+            return pd.DataFrame(columns=ESQUEMA.names)
+        df = pd.concat(partes, ignore_index=True)
+        df = df.head(limite) if limite is not None else df
+        # como vem do banco: detalhes em dict
+        df["detalhes"] = [json.loads(d) if isinstance(d, str) else d for d in df["detalhes"]]
+        return df
@@ -0,0 +1,133 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+
+class AuditWriter:
+    # Fila de eventos de auditoria em memória, gravada em lotes por uma thread
+    # de fundo (a cada `lote` eventos ou `intervalo` segundos). Se o banco não
+    # responder, o lote vai para um spool local (JSON lines, com fsync) e é
+    # reenviado, na ordem, assim que o envio voltar a funcionar.
+
+    def __init__(self, enviar, spool_path, lote=50, intervalo=2.0, espera_max=60.0):
+        self._enviar = enviar  # enviar(lista_de_eventos); deve levantar exceção em falha
+        self.spool_path = spool_path
+        self.lote = lote
+        self.intervalo = intervalo
+        self.espera_max = espera_max
+        self._fila = queue.Queue()
+        self._lock = threading.Lock()
+        self._espera = 0.0
+        self._proxima_tentativa = 0.0
+        self.enviados = 0
+        self.falhas = 0
+        self.ultimo_erro = None
+        self._thread = threading.Thread(target=self._loop, name="auditoria-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush, 5.0)
+
+    def registrar(self, evento):
+        self._fila.put(evento)
+
+    def flush(self, timeout=None):
+        # envia (ou manda para o spool) tudo que já foi registrado
+        feito = threading.Event()
+        self._fila.put(feito)
+        return feito.wait(timeout)
+
+    def stats(self):
+        return {
+            "pendentes": self._fila.qsize(),
+            "spool": self._spool_linhas(),
+            "enviados": self.enviados,
+            "falhas": self.falhas,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+    # ---- thread de fundo ----
+    def _loop(self):
+        while True:
+            lote, avisos = [], []
+            limite = time.monotonic() + self.intervalo
+            while len(lote) < self.lote:
+                try:
+                    item = self._fila.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    avisos.append(item)
+                    break
+                lote.append(item)
+            self._processar(lote, forcar=bool(avisos))
+            for a in avisos:
+                a.set()
+
+    def _processar(self, lote, forcar=False):
+        if not forcar and time.monotonic() < self._proxima_tentativa:
+            # banco fora: não insiste a cada lote, só guarda
+            if lote:
+                self._gravar_spool(lote)
+            return
+        try:
+            self._reenviar_spool()
+            if lote:
+                self._enviar(lote)
+                self.enviados += len(lote)
+            self._espera = 0.0
+            self._proxima_tentativa = 0.0
+        except Exception as e:
+            self.falhas += 1
+            self.ultimo_erro = f"{type(e).__name__}: {e}"
+            if lote:
+                self._gravar_spool(lote)
+            self._espera = min(self.espera_max, max(1.0, self._espera * 2))
+            self._proxima_tentativa = time.monotonic() + self._espera
+
+    # ---- spool local ----
+    def _gravar_spool(self, eventos):
+        with self._lock, open(self.spool_path, "a", encoding="utf-8") as f:
+            for ev in eventos:
+                f.write(json.dumps(ev, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _spool_linhas(self):
+        try:
+            with self._lock, open(self.spool_path, encoding="utf-8") as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def _reenviar_spool(self):
+        with self._lock:
+            try:
+                with open(self.spool_path, encoding="utf-8") as f:
+                    linhas = [l for l in f if l.strip()]
+            except FileNotFoundError:
+                return
+        enviadas = 0
+        try:
+            for i in range(0, len(linhas), self.lote):
+                bloco = [json.loads(l) for l in linhas[i:i + self.lote]]
+                self._enviar(bloco)
+                enviadas += len(bloco)
+                self.enviados += len(bloco)
+        finally:
+            if enviadas:
+                self._reescrever_spool(linhas[enviadas:])
+
+    def _reescrever_spool(self, restantes):
+        # troca atômica: o spool nunca fica pela metade
+        with self._lock:
+            if not restantes:
+                os.remove(self.spool_path)
+                return
+            tmp = self.spool_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(restantes)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.spool_path)
@@ -0,0 +1,655 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Backends de dados usados pelos helpers sb_* de app.py. Os dois expõem a
+# mesma interface (select/insert/upsert/update/delete/rpc/upload/url/listar/
+# baixar) e a mesma semântica de filtros:
+#   {"col": valor}            -> col = valor
+#   {"col": ("in", [...])}    -> col IN (...)
+#   {"col": ("gt", v)}        -> col > v   (também "gte", "lt", "lte", "neq")
+#   {"col": ("entre", (a, b))} -> a <= col < b (intervalo de datas)
+# assinar(tabelas, callback) entrega as alterações dessas tabelas numa thread
+# de fundo: callback(tabela, tipo, registro), tipo INSERT/UPDATE/DELETE (no
+# DELETE, registro é a linha apagada).
+
+
+class BackendError(Exception):
+    # erro com código no estilo PostgREST ("PGRST202" = função inexistente)
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+_OPS = {"in": "in_", "gt": "gt", "gte": "gte", "lt": "lt", "lte": "lte", "neq": "neq", "entre": None}
+
+
+def _op(v):
+    if isinstance(v, tuple) and len(v) == 2 and v[0] in _OPS:
+        return v
+    return ("eq", v)
+
+
+class Assinatura:
+    # estado de um feed de alterações (para a barra lateral / diagnóstico)
+    def __init__(self, modo):
+        self.modo = modo
+        self.conectado = False
+        self.conectado_em = None
+        self.eventos = 0
+        self.ultimo_evento = None
+        self.ultimo_erro = None
+
+    def ligar(self, ok):
+        if ok and not self.conectado:
+            self.conectado_em = time.time()
+        self.conectado = ok
+
+    def entregar(self, callback, tabela, tipo, registro):
+        try:
+            callback(tabela, tipo, registro)
+        except Exception as e:  # um callback com erro não derruba o feed
+            self.ultimo_erro = f"{type(e).__name__}: {e}"
+        self.eventos += 1
+        self.ultimo_evento = time.time()
+
+    def stats(self):
+        return {"modo": self.modo, "conectado": self.conectado, "conectado_em": self.conectado_em, "eventos": self.eventos,
+                "ultimo_evento": self.ultimo_evento, "ultimo_erro": self.ultimo_erro}
+
+
+def _orders(order):
+    if not order:
+        return []
+    return list(order) if isinstance(order, (list, tuple)) else [order]
+
+
+# -------------------- Supabase (PostgREST) --------------------
+class SupabaseBackend:
+    nome = "supabase"
+
+    def __init__(self, client, bucket=None):
+        self.client = client
+        self.bucket = bucket
+
+    def _filtros(self, q, filters):
+        for k, v in (filters or {}).items():
+            op, val = _op(v)
+            if op == "entre":
+                q = q.gte(k, val[0]).lt(k, val[1])
+                continue
+            q = getattr(q, _OPS.get(op, op))(k, val)
+        return q
+
+    def select(self, table, select="*", filters=None, order=None, limit=None, desc=False):
+        q = self._filtros(self.client.table(table).select(select), filters)
+        for o in _orders(order):
+            q = q.order(o, desc=desc)
+        if limit:
+            q = q.limit(limit)
+        return q.execute().data or []
+
+    def insert(self, table, data):
+        return self.client.table(table).insert(data).execute().data or []
+
+    def upsert(self, table, data, on_conflict=None):
+        return self.client.table(table).upsert(data, on_conflict=on_conflict or "").execute().data or []
+
+    def update(self, table, data, filters):
+        return self._filtros(self.client.table(table).update(data), filters).execute().data or []
+
+    def delete(self, table, filters):
+        return self._filtros(self.client.table(table).delete(), filters).execute().data or []
+
+    def rpc(self, fn, params):
+        return self.client.rpc(fn, params).execute().data or []
+
+    def upload(self, path, data, content_type=None):
+        # upsert: reenviar o mesmo caminho sobrescreve em vez de falhar
+        opcoes = {"upsert": "true", **({"content-type": content_type} if content_type else {})}
+        res = self.client.storage.from_(self.bucket).upload(path, data, file_options=opcoes)
+        if isinstance(res, dict) and res.get("error"):
+            raise BackendError(res["error"]["message"])
+        return self.url(path)
+
+    def url(self, path):
+        # URL pública, conhecida antes do upload
+        return self.client.storage.from_(self.bucket).get_public_url(path)
+
+    def listar(self, pasta):
+        # arquivos (sem subpastas) -> {caminho: versão}; a versão muda quando o arquivo é regravado
+        objs = self.client.storage.from_(self.bucket).list(pasta, {"limit": 1000})
+        return {f"{pasta}/{o['name']}": o.get("updated_at") for o in objs if o.get("id")}
+
+    def baixar(self, path):
+        return self.client.storage.from_(self.bucket).download(path)
+
+    def assinar(self, tabelas, callback, reconectar_s=10.0):
+        # Supabase Realtime (postgres_changes; ver sql/realtime.sql). O cliente
+        # realtime do Python é assíncrono: roda num event loop próprio.
+        import asyncio
+        from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+
+        a = Assinatura("realtime")
+        url = str(self.client.supabase_url).rstrip("/") + "/realtime/v1"
+        key = self.client.supabase_key
+
+        def on_change(payload):
+            d = payload["data"]
+            a.entregar(callback, d["table"], d["type"], d.get("record") or d.get("old_record") or {})
+
+        def on_status(estado, erro=None):
+            a.ligar(estado == RealtimeSubscribeStates.SUBSCRIBED)
+            if erro is not None:
+                a.ultimo_erro = f"{type(erro).__name__}: {erro}"
+
+        async def rodar():
+            while True:
+                rt = AsyncRealtimeClient(url, key)
+                try:
+                    canal = rt.channel("obra-app-alteracoes")
+                    for t in tabelas:
+                        canal.on_postgres_changes("*", schema="public", table=t, callback=on_change)
+                    await canal.subscribe(on_status)
+                    while rt.is_connected:
+                        await asyncio.sleep(1.0)
+                except Exception as e:
+                    a.ultimo_erro = f"{type(e).__name__}: {e}"
+                a.ligar(False)
+                try:
+                    await rt.close()
+                except Exception:
+                    pass
+                await asyncio.sleep(reconectar_s)
+
+        threading.Thread(target=lambda: asyncio.run(rodar()), name="feed-realtime", daemon=True).start()
+        return a
+
+
+# -------------------- SQLite local --------------------
+SCHEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS obras (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS etapas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+    nome TEXT NOT NULL,
+    UNIQUE(obra_id, nome)
+);
+CREATE TABLE IF NOT EXISTS servicos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT NOT NULL,
+    etapa TEXT NOT NULL,
+    obra_id INTEGER REFERENCES obras(id) ON DELETE CASCADE,
+    UNIQUE(nome, etapa, obra_id)
+);
+CREATE TABLE IF NOT EXISTS casas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+    lote TEXT NOT NULL,
+    cod_tipologia TEXT,
+    tipologia TEXT,
+    ativa INTEGER NOT NULL DEFAULT 0,
+    ativa_em TEXT,
+    ativa_por TEXT,
+    UNIQUE(obra_id, lote)
+);
+CREATE TABLE IF NOT EXISTS casa_ativacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    casa_id INTEGER NOT NULL REFERENCES casas(id) ON DELETE CASCADE,
+    etapa TEXT NOT NULL,
+    ativa INTEGER NOT NULL DEFAULT 0,
+    ativa_em TEXT,
+    ativa_por TEXT,
+    UNIQUE(casa_id, etapa)
+);
+CREATE TABLE IF NOT EXISTS estado_servicos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    casa_id INTEGER NOT NULL REFERENCES casas(id) ON DELETE CASCADE,
+    servico_id INTEGER NOT NULL REFERENCES servicos(id) ON DELETE CASCADE,
+    status TEXT DEFAULT 'Não iniciado',
+    executor TEXT,
+    data_inicio TEXT,
+    data_fim TEXT,
+    updated_at TEXT,
+    UNIQUE(casa_id, servico_id)
+);
+CREATE TABLE IF NOT EXISTS lancamentos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+    casa_id INTEGER NOT NULL REFERENCES casas(id) ON DELETE CASCADE,
+    servico_id INTEGER NOT NULL REFERENCES servicos(id) ON DELETE CASCADE,
+    responsavel TEXT,
+    status TEXT,
+    data_inicio TEXT,
+    data_conclusao TEXT,
+    observacoes TEXT,
+    foto_path TEXT,
+    created_at TEXT NOT NULL,
+    executor TEXT,
+    anulado INTEGER NOT NULL DEFAULT 0,
+    anulado_por TEXT,
+    anulado_em TEXT,
+    anulacao_motivo TEXT
+);
+CREATE TABLE IF NOT EXISTS auditoria (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    usuario TEXT,
+    acao TEXT NOT NULL,
+    obra_id INTEGER,
+    casa_id INTEGER,
+    servico_id INTEGER,
+    detalhes TEXT
+);
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    nome TEXT,
+    password TEXT,
+    role TEXT NOT NULL DEFAULT 'user',
+    ativo INTEGER NOT NULL DEFAULT 1,
+    permissoes TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_servicos_obra_nome_etapa ON servicos(obra_id, nome, etapa);
+CREATE INDEX IF NOT EXISTS ix_etapas_obra ON etapas(obra_id);
+CREATE INDEX IF NOT EXISTS ix_servicos_obra_etapa ON servicos(obra_id, etapa);
+CREATE INDEX IF NOT EXISTS ix_casas_obra ON casas(obra_id);
+-- (casa_id, etapa) já tem o índice do UNIQUE; bancos antigos ainda têm o duplicado
+DROP INDEX IF EXISTS ix_casa_ativacoes_casa_etapa;
+CREATE INDEX IF NOT EXISTS ix_casa_ativacoes_etapa ON casa_ativacoes(etapa);
+CREATE INDEX IF NOT EXISTS ix_estado_servicos_casa ON estado_servicos(casa_id);
+CREATE INDEX IF NOT EXISTS ix_estado_servicos_servico ON estado_servicos(servico_id);
+CREATE INDEX IF NOT EXISTS ix_estado_servicos_servico_updated ON estado_servicos(servico_id, updated_at);
+CREATE INDEX IF NOT EXISTS ix_lancamentos_obra ON lancamentos(obra_id);
+CREATE INDEX IF NOT EXISTS ix_lancamentos_casa ON lancamentos(casa_id);
+CREATE INDEX IF NOT EXISTS ix_lancamentos_servico ON lancamentos(servico_id);
+CREATE INDEX IF NOT EXISTS ix_auditoria_usuario ON auditoria(usuario);
+CREATE INDEX IF NOT EXISTS ix_auditoria_acao ON auditoria(acao);
+CREATE INDEX IF NOT EXISTS ix_auditoria_timestamp ON auditoria(timestamp);
+CREATE INDEX IF NOT EXISTS ix_auditoria_obra ON auditoria(obra_id);
+CREATE TABLE IF NOT EXISTS auditoria_facetas (
+    campo TEXT NOT NULL,
+    valor TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (campo, valor)
+);
+INSERT INTO auditoria_facetas (campo, valor, n)
+    SELECT 'usuario', usuario, COUNT(*) FROM auditoria
+    WHERE usuario IS NOT NULL AND NOT EXISTS (SELECT 1 FROM auditoria_facetas) GROUP BY usuario
+    UNION ALL
+    SELECT 'acao', acao, COUNT(*) FROM auditoria
+    WHERE NOT EXISTS (SELECT 1 FROM auditoria_facetas) GROUP BY acao;
+CREATE TRIGGER IF NOT EXISTS tr_auditoria_facetas AFTER INSERT ON auditoria BEGIN
+    INSERT INTO auditoria_facetas (campo, valor, n) SELECT 'usuario', NEW.usuario, 1 WHERE NEW.usuario IS NOT NULL
+        ON CONFLICT (campo, valor) DO UPDATE SET n = n + 1;
+    INSERT INTO auditoria_facetas (campo, valor, n) VALUES ('acao', NEW.acao, 1)
+        ON CONFLICT (campo, valor) DO UPDATE SET n = n + 1;
+END;
+CREATE TABLE IF NOT EXISTS alteracoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tabela TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    registro TEXT NOT NULL,
+    em REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0)
+);
+CREATE TRIGGER IF NOT EXISTS tr_estado_servicos_ins AFTER INSERT ON estado_servicos BEGIN
+    INSERT INTO alteracoes (tabela, tipo, registro) VALUES ('estado_servicos', 'INSERT',
+        json_object('casa_id', NEW.casa_id, 'servico_id', NEW.servico_id, 'status', NEW.status, 'updated_at', NEW.updated_at));
+END;
+CREATE TRIGGER IF NOT EXISTS tr_estado_servicos_upd AFTER UPDATE ON estado_servicos BEGIN
+    INSERT INTO alteracoes (tabela, tipo, registro) VALUES ('estado_servicos', 'UPDATE',
+        json_object('casa_id', NEW.casa_id, 'servico_id', NEW.servico_id, 'status', NEW.status, 'updated_at', NEW.updated_at));
+END;
+CREATE TRIGGER IF NOT EXISTS tr_estado_servicos_del AFTER DELETE ON estado_servicos BEGIN
+    INSERT INTO alteracoes (tabela, tipo, registro) VALUES ('estado_servicos', 'DELETE',
+        json_object('casa_id', OLD.casa_id, 'servico_id', OLD.servico_id, 'status', OLD.status, 'updated_at', OLD.updated_at));
+END;
+CREATE TRIGGER IF NOT EXISTS tr_casa_ativacoes_ins AFTER INSERT ON casa_ativacoes BEGIN
+    INSERT INTO alteracoes (tabela, tipo, registro) VALUES ('casa_ativacoes', 'INSERT',
+        json_object('casa_id', NEW.casa_id, 'etapa', NEW.etapa, 'ativa', NEW.ativa));
+END;
+CREATE TRIGGER IF NOT EXISTS tr_casa_ativacoes_upd AFTER UPDATE ON casa_ativacoes BEGIN
+    INSERT INTO alteracoes (tabela, tipo, registro) VALUES ('casa_ativacoes', 'UPDATE',
+        json_object('casa_id', NEW.casa_id, 'etapa', NEW.etapa, 'ativa', NEW.ativa));
+END;
+CREATE TRIGGER IF NOT EXISTS tr_casa_ativacoes_del AFTER DELETE ON casa_ativacoes BEGIN
+    INSERT INTO alteracoes (tabela, tipo, registro) VALUES ('casa_ativacoes', 'DELETE',
+        json_object('casa_id', OLD.casa_id, 'etapa', OLD.etapa, 'ativa', OLD.ativa));
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS lancamentos_fts USING fts5(
+    observacoes, content='lancamentos', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS tr_lancamentos_fts_ins AFTER INSERT ON lancamentos BEGIN
+    INSERT INTO lancamentos_fts (rowid, observacoes) VALUES (NEW.id, NEW.observacoes);
+END;
+CREATE TRIGGER IF NOT EXISTS tr_lancamentos_fts_del AFTER DELETE ON lancamentos BEGIN
+    INSERT INTO lancamentos_fts (lancamentos_fts, rowid, observacoes) VALUES ('delete', OLD.id, OLD.observacoes);
+END;
+CREATE TRIGGER IF NOT EXISTS tr_lancamentos_fts_upd AFTER UPDATE OF observacoes ON lancamentos BEGIN
+    INSERT INTO lancamentos_fts (lancamentos_fts, rowid, observacoes) VALUES ('delete', OLD.id, OLD.observacoes);
+    INSERT INTO lancamentos_fts (rowid, observacoes) VALUES (NEW.id, NEW.observacoes);
+END;
+"""
+
+# colunas boolean/json no Postgres que o SQLite guarda como INTEGER/TEXT
+_BOOL_COLS = {
+    "casas": {"ativa"},
+    "casa_ativacoes": {"ativa"},
+    "lancamentos": {"anulado"},
+    "usuarios": {"ativo"},
+}
+_JSON_COLS = {"usuarios": {"permissoes"}, "auditoria": {"detalhes"}}
+_IDENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_MAX_VARS = 32000  # SQLITE_MAX_VARIABLE_NUMBER (3.32+) com folga
+
+# Busca nas observações (FTS5, sem radicais em português: cada termo vale
+# como prefixo, "infiltra" acha "infiltração"); mesmas colunas da função
+# buscar_observacoes de sql/busca_observacoes.sql
+_SQL_BUSCA_OBSERVACOES = """
+WITH achados AS (
+    SELECT rowid AS id, -bm25(lancamentos_fts) AS relevancia,
+           snippet(lancamentos_fts, 0, '«', '»', '…', 25) AS trecho
+    FROM lancamentos_fts
+    WHERE lancamentos_fts MATCH :termos
+)
+SELECT l.id AS lancamento_id, l.casa_id, c.lote, l.servico_id, s.nome AS servico, s.etapa,
+       l.status, l.executor, l.responsavel, l.created_at, l.observacoes, l.foto_path,
+       a.trecho, a.relevancia, COUNT(*) OVER () AS total
+FROM achados a
+JOIN lancamentos l ON l.id = a.id
+LEFT JOIN casas c ON c.id = l.casa_id
+LEFT JOIN servicos s ON s.id = l.servico_id
+WHERE l.obra_id = :obra AND l.anulado = 0
+ORDER BY a.relevancia DESC, l.created_at DESC
+LIMIT :limite OFFSET :offset
+"""
+# dashboard_resumo de sql/dashboard_resumo.sql
+_SQL_DASHBOARD_RESUMO = """
+WITH cs AS (
+    SELECT id FROM casas
+    WHERE obra_id = :obra AND id > :depois
+      AND (:casas IS NULL OR id IN (SELECT value FROM json_each(:casas)))
+    ORDER BY id
+    LIMIT :limite
+),
+por_etapa AS (
+    -- CROSS JOIN fixa a ordem: das casas da página para estado_servicos (ix por casa)
+    SELECT e.casa_id, s.etapa,
+           SUM(e.status = 'Concluído') AS concluidos,
+           SUM(e.status = 'Em execução') AS em_exec,
+           MAX(e.updated_at) AS atualizado
+    FROM cs
+    CROSS JOIN estado_servicos e ON e.casa_id = cs.id
+    CROSS JOIN servicos s ON s.id = e.servico_id AND s.obra_id = :obra
+    GROUP BY e.casa_id, s.etapa
+)
+SELECT casa_id, json_group_object(etapa, json_array(concluidos, em_exec)) AS contagens, MAX(atualizado) AS atualizado
+FROM por_etapa
+GROUP BY casa_id
+UNION ALL
+SELECT id, '{}', NULL FROM cs
+WHERE NOT EXISTS (SELECT 1 FROM estado_servicos e JOIN servicos s ON s.id = e.servico_id AND s.obra_id = :obra WHERE e.casa_id = cs.id)
+ORDER BY 1
+"""
+_TERMO = re.compile(r"\w+")
+_SUFIXOS = ("coes", "cao", "oes", "aes", "ais", "eis", "ao", "es", "as", "os", "a", "o", "e", "s")
+
+
+def radical(termo):
+    # radical grosseiro para a busca por prefixo: "Infiltração" e
+    # "infiltrações" -> "infiltrac" (o Postgres usa o stemmer do português)
+    termo = unicodedata.normalize("NFKD", termo).encode("ascii", "ignore").decode("ascii").lower()
+    if len(termo) > 5:
+        for suf in _SUFIXOS:
+            if termo.endswith(suf) and len(termo) - len(suf) >= 4:
+                return termo[:-len(suf)]
+    return termo
+
+
+def _q(nome):
+    if not _IDENT.match(str(nome)):
+        raise BackendError(f"identificador inválido: {nome!r}")
+    return f'"{nome}"'
+
+
+class SqliteBackend:
+    # Mesmo contrato do SupabaseBackend sobre um arquivo SQLite (WAL, uma
+    # conexão por thread). Útil em obra sem internet e para medir consultas
+    # sem a rede no caminho.
+    nome = "sqlite"
+
+    def __init__(self, path, uploads_dir="uploads"):
+        self.path = path
+        self.uploads_dir = uploads_dir
+        self._local = threading.local()
+        con = self._con()
+        con.execute("PRAGMA journal_mode=WAL")
+        novo_fts = con.execute("SELECT 1 FROM sqlite_master WHERE name = 'lancamentos_fts'").fetchone() is None
+        con.executescript(SCHEMA_SQLITE)
+        if novo_fts:
+            # índice criado agora: indexa os lançamentos que já existiam
+            con.execute("INSERT INTO lancamentos_fts (lancamentos_fts) VALUES ('rebuild')")
+        con.commit()
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA foreign_keys=ON")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=30000")
+            self._local.con = con
+        return con
+
+    # ---- conversões ----
+    def _entrada(self, table, row):
+        return {k: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v for k, v in row.items()}
+
+    def _saida(self, table, rows):
+        bcols = _BOOL_COLS.get(table, ())
+        jcols = _JSON_COLS.get(table, ())
+        out = []
+        for r in rows:
+            d = dict(r)
+            for c in bcols:
+                if c in d and d[c] is not None:
+                    d[c] = bool(d[c])
+            for c in jcols:
+                v = d.get(c)
+                if isinstance(v, str) and v[:1] in "{[":
+                    try:
+                        d[c] = json.loads(v)
+                    except ValueError:
+                        pass
+            out.append(d)
+        return out
+
+    def _where(self, filters):
+        partes, args = [], []
+        for k, v in (filters or {}).items():
+            op, val = _op(v)
+            col = _q(k)
+            if op == "in":
+                val = list(val)
+                if not val:
+                    partes.append("0")
+                    continue
+                partes.append(f"{col} IN ({','.join('?' * len(val))})")
+                args.extend(val)
+            elif op == "entre":
+                partes.append(f"{col} >= ? AND {col} < ?")
+                args.extend(val)
+            elif val is None and op == "eq":
+                partes.append(f"{col} IS NULL")
+            else:
+                sql_op = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}[op]
+                partes.append(f"{col} {sql_op} ?")
+                args.append(val)
+        return (" WHERE " + " AND ".join(partes)) if partes else "", args
+
+    def _colunas(self, select):
+        if not select or select.strip() == "*":
+            return "*"
+        return ", ".join(_q(c.strip()) for c in select.split(","))
+
+    # ---- operações ----
+    def select(self, table, select="*", filters=None, order=None, limit=None, desc=False):
+        where, args = self._where(filters)
+        sql = f"SELECT {self._colunas(select)} FROM {_q(table)}{where}"
+        ords = _orders(order)
+        if ords:
+            sql += " ORDER BY " + ", ".join(f"{_q(o)} {'DESC' if desc else 'ASC'}" for o in ords)
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._saida(table, self._con().execute(sql, args).fetchall())
+
+    def _inserir(self, con, table, data, on_conflict=None, upsert=False, manter=()):
+        rows = [self._entrada(table, r) for r in (data if isinstance(data, list) else [data])]
+        if not rows:
+            return []
+        cols = list(dict.fromkeys(k for r in rows for k in r))  # ausentes viram NULL, como no PostgREST
+        alvo = [c.strip() for c in (on_conflict or "id").split(",")]
+        sql_base = f"INSERT INTO {_q(table)} ({', '.join(_q(c) for c in cols)}) VALUES "
+        faltam = [c for c in alvo if c not in cols]
+        if upsert and on_conflict and faltam:
+            # o PostgREST também recusa: sem as colunas não há conflito a resolver
+            raise ValueError(f"on_conflict {on_conflict!r}: colunas ausentes nos registros: {', '.join(faltam)}")
+        sufixo = ""
+        if upsert and not faltam:
+            sets = [f"{_q(c)} = COALESCE(excluded.{_q(c)}, {_q(c)})" if c in manter else f"{_q(c)} = excluded.{_q(c)}"
+                    for c in cols if c not in alvo]
+            acao = f"DO UPDATE SET {', '.join(sets)}" if sets else "DO NOTHING"
+            sufixo = f" ON CONFLICT ({', '.join(_q(c) for c in alvo)}) {acao}"
+        sufixo += " RETURNING *"
+        por_bloco = max(1, _MAX_VARS // len(cols))
+        out = []
+        for i in range(0, len(rows), por_bloco):
+            bloco = rows[i:i + por_bloco]
+            valores = ", ".join("(" + ", ".join("?" * len(cols)) + ")" for _ in bloco)
+            args = [r.get(c) for r in bloco for c in cols]
+            out.extend(con.execute(sql_base + valores + sufixo, args).fetchall())
+        return self._saida(table, out)
+
+    def insert(self, table, data):
+        con = self._con()
+        with con:
+            return self._inserir(con, table, data)
+
+    def upsert(self, table, data, on_conflict=None):
+        con = self._con()
+        with con:
+            return self._inserir(con, table, data, on_conflict=on_conflict, upsert=True)
+
+    def update(self, table, data, filters):
+        data = self._entrada(table, data)
+        where, args = self._where(filters)
+        sets = ", ".join(f"{_q(c)} = ?" for c in data)
+        con = self._con()
+        with con:
+            rows = con.execute(f"UPDATE {_q(table)} SET {sets}{where} RETURNING *", list(data.values()) + args).fetchall()
+        return self._saida(table, rows)
+
+    def delete(self, table, filters):
+        where, args = self._where(filters)
+        con = self._con()
+        with con:
+            rows = con.execute(f"DELETE FROM {_q(table)}{where} RETURNING *", args).fetchall()
+        return self._saida(table, rows)
+
+    def rpc(self, fn, params):
+        impl = getattr(self, f"_rpc_{fn}", None)
+        if impl is None:
+            raise BackendError(f"função {fn} não existe no backend SQLite", code="PGRST202")
+        return impl(**params)
+
+    def upload(self, path, data, content_type=None):
+        destino = self.url(path)
+        os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+        with open(destino, "wb") as f:
+            f.write(data)
+        return destino
+
+    def url(self, path):
+        return os.path.join(self.uploads_dir, path)
+
+    def listar(self, pasta):
+        base = self.url(pasta)
+        try:
+            nomes = os.listdir(base)
+        except FileNotFoundError:
+            return {}
+        return {f"{pasta}/{n}": os.path.getmtime(os.path.join(base, n)) for n in nomes if os.path.isfile(os.path.join(base, n))}
+
+    def baixar(self, path):
+        with open(self.url(path), "rb") as f:
+            return f.read()
+
+    def assinar(self, tabelas, callback, intervalo=1.0, retencao_s=86400):
+        # Feed local: triggers registram as alterações em `alteracoes` e uma
+        # thread lê só o que entrou depois do último id visto (consulta pela PK).
+        a = Assinatura("polling")
+        (ultimo,) = self._con().execute("SELECT COALESCE(MAX(id), 0) FROM alteracoes").fetchone()
+
+        def loop():
+            nonlocal ultimo
+            limpeza = 0.0
+            while True:
+                n = 0
+                try:
+                    con = self._con()
+                    rows = con.execute(
+                        "SELECT id, tabela, tipo, registro FROM alteracoes WHERE id > ? ORDER BY id LIMIT 1000", (ultimo,)
+                    ).fetchall()
+                    a.ligar(True)
+                    n = len(rows)
+                    for r in rows:
+                        ultimo = r["id"]
+                        if r["tabela"] in tabelas:
+                            a.entregar(callback, r["tabela"], r["tipo"], json.loads(r["registro"]))
+                    if time.time() > limpeza:
+                        with con:
+                            con.execute("DELETE FROM alteracoes WHERE em < ?", (time.time() - retencao_s,))
+                        limpeza = time.time() + 600
+                except Exception as e:
+                    a.ligar(False)
+                    a.ultimo_erro = f"{type(e).__name__}: {e}"
+                if n < 1000:
+                    time.sleep(intervalo)
+
+        threading.Thread(target=loop, name="feed-sqlite", daemon=True).start()
+        return a
+
+    # ---- equivalentes locais das funções em sql/ ----
+    def _rpc_dashboard_resumo(self, p_obra_id, p_casas=None, p_depois=0, p_limite=1000):
+        params = {"obra": p_obra_id, "casas": None if p_casas is None else json.dumps([int(c) for c in p_casas]), "depois": p_depois, "limite": p_limite}
+        return [dict(r) for r in self._con().execute(_SQL_DASHBOARD_RESUMO, params).fetchall()]
+
+    def _rpc_buscar_observacoes(self, p_obra_id, p_termos, p_limite=50, p_offset=0):
+        termos = " ".join(f'"{radical(t)}"*' for t in _TERMO.findall(p_termos or ""))
+        if not termos:
+            return []
+        rows = self._con().execute(_SQL_BUSCA_OBSERVACOES, {"obra": p_obra_id, "termos": termos, "limite": p_limite, "offset": p_offset}).fetchall()
+        return [dict(r) for r in rows]
+
+    def _rpc_registrar_lancamentos(self, p_estados, p_lancamentos):
+        con = self._con()
+        with con:
+            self._inserir(con, "estado_servicos", p_estados, on_conflict="casa_id,servico_id", upsert=True, manter=("data_inicio", "data_fim"))
+            rows = self._inserir(con, "lancamentos", p_lancamentos)
+        return [{"servico_id": r["servico_id"], "lancamento_id": r["id"]} for r in rows]
+
+    def _rpc_excluir_etapa(self, p_obra_id, p_etapa):
+        con = self._con()
+        with con:
+            n_serv = con.execute("DELETE FROM servicos WHERE obra_id = ? AND etapa = ?", (p_obra_id, p_etapa)).rowcount
+            n_ativ = con.execute(
+                "DELETE FROM casa_ativacoes WHERE etapa = ? AND casa_id IN (SELECT id FROM casas WHERE obra_id = ?)",
+                (p_etapa, p_obra_id),
+            ).rowcount
+            n_etap = con.execute("DELETE FROM etapas WHERE obra_id = ? AND nome = ?", (p_obra_id, p_etapa)).rowcount
+        return [{"servicos": n_serv, "ativacoes": n_ativ, "etapas": n_etap}]
@@ -0,0 +1,335 @@
+"""Benchmark dos caminhos quentes do app sobre uma obra sintética (SqliteBackend).
+
+Gera obras na escala da obra Berlin (599 lotes × 15 serviços) multiplicada
+por --escalas e mede a partida (imports do app num processo novo), Dashboard
+(carga e delta), Lançamentos, Correções, exportação de Observações,
+Previsto × Executado (Excel) e as importações de casas/serviços. Cada rodada
+é gravada em --historico (JSON lines) e comparada com a mediana das rodadas
+anteriores com os mesmos parâmetros.
+
+Uso: python bench/bench_app.py [--escalas 1,10,100] [--repeticoes 3] [--etapas 1]
+         [--servicos 15] [--dados DIR] [--historico bench/historico.jsonl]
+         [--tolerancia 0.25] [--minimo 0.01] [--falhar]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RAIZ = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(RAIZ))
+from backend import SqliteBackend  # noqa: E402
+from consultas import (CASAS, ESTADO_CASA, ESTADO_RESUMO, LANC_CASAS, LANC_CORRECAO, LANC_OBSERVACOES,  # noqa: E402
+                       SERVICOS, ativacoes_obra, casas_com_lancamentos, lancamentos_servico, ler_paginado, paginar, sugestoes,
+                       tabela_observacoes)
+from importacao import ESQUEMA_CASAS, ESQUEMA_SERVICOS, ler_planilha, preparar_casas, preparar_servicos, registros  # noqa: E402
+from indices import IndiceAtivacoes  # noqa: E402
+from lotes import upsert_em_lotes  # noqa: E402
+from relatorio import exportar_xlsx, previsto_executado  # noqa: E402
+from resumo import ResumoIncremental  # noqa: E402
+from snapshot import compactar  # noqa: E402
+
+BERLIN_CASAS = 599
+BERLIN_SERVICOS = 15
+ETAPAS = ["Reboco", "Pintura", "Revestimento", "Forro", "Cerâmica"]
+TIPOLOGIAS = [("T1", "Casa 2Q"), ("T2", "Casa 3Q"), ("T3", "Sobrado")]
+
+
+# -------------------- gerador --------------------
+def gerar_obra(db, nome, n_casas, n_etapas=1, servicos_por_etapa=BERLIN_SERVICOS, frac_ativas=0.8,
+               frac_obs=0.15, frac_anulados=0.03, seed=42, bloco=20000):
+    # Obra com casas por quadra/lote, etapas × serviços, ativações, estado de
+    # cada (casa, serviço) ativo e o histórico de lançamentos que o produziu.
+    rng = np.random.default_rng(seed)
+    obra_id = db.insert("obras", [{"nome": nome}])[0]["id"]
+    etapas = ETAPAS[:n_etapas] if n_etapas <= len(ETAPAS) else [f"Etapa {i + 1}" for i in range(n_etapas)]
+    db.insert("etapas", [{"obra_id": obra_id, "nome": e} for e in etapas])
+    servs = db.insert("servicos", [{"obra_id": obra_id, "etapa": e, "nome": f"Serviço {j + 1:02d}"} for e in etapas for j in range(servicos_por_etapa)])
+    casas = []
+    for i in range(0, n_casas, bloco):
+        casas += db.insert("casas", [{"obra_id": obra_id, "lote": f"QD {k // 30 + 1} LT {k % 30 + 1}",
+                                      "cod_tipologia": TIPOLOGIAS[k % 3][0], "tipologia": TIPOLOGIAS[k % 3][1]}
+                                     for k in range(i, min(i + bloco, n_casas))])
+    casa_ids = np.array([c["id"] for c in casas])
+
+    inicio = datetime.utcnow() - timedelta(days=90)
+    ativacoes, estados, lancs = [], [], []
+
+    def _descarregar(final=False):
+        for tabela, linhas, conflito in (("casa_ativacoes", ativacoes, "casa_id,etapa"), ("estado_servicos", estados, "casa_id,servico_id"), ("lancamentos", lancs, None)):
+            if linhas and (final or len(linhas) >= bloco):
+                if conflito:
+                    db.upsert(tabela, linhas, on_conflict=conflito)
+                else:
+                    db.insert(tabela, linhas)
+                linhas.clear()
+
+    for etapa in etapas:
+        sv = [s["id"] for s in servs if s["etapa"] == etapa]
+        ativas = casa_ids[rng.random(len(casa_ids)) < frac_ativas]
+        for cid in ativas.tolist():
+            quando = inicio + timedelta(seconds=float(rng.uniform(0, 80 * 86400)))
+            ativacoes.append({"casa_id": cid, "etapa": etapa, "ativa": True, "ativa_em": quando.isoformat(), "ativa_por": "bench"})
+            status = rng.choice(3, size=len(sv), p=[0.3, 0.2, 0.5])
+            for sid, s in zip(sv, status.tolist()):
+                t_ini = quando + timedelta(hours=float(rng.uniform(1, 240)))
+                t_fim = t_ini + timedelta(hours=float(rng.uniform(4, 120)))
+                est = {"casa_id": cid, "servico_id": sid, "status": "Não iniciado", "executor": "", "data_inicio": None, "data_fim": None, "updated_at": quando.isoformat()}
+                if s >= 1:
+                    est.update(status="Em execução", executor=f"Equipe {sid % 7 + 1}", data_inicio=t_ini.date().isoformat(), updated_at=t_ini.isoformat())
+                    lancs.append(_lancamento(rng, obra_id, cid, sid, "Em execução", t_ini, frac_obs, frac_anulados, data_inicio=t_ini.date().isoformat()))
+                if s == 2:
+                    est.update(status="Concluído", data_fim=t_fim.date().isoformat(), updated_at=t_fim.isoformat())
+                    lancs.append(_lancamento(rng, obra_id, cid, sid, "Concluído", t_fim, frac_obs, frac_anulados, data_conclusao=t_fim.date().isoformat()))
+                estados.append(est)
+            _descarregar()
+    _descarregar(final=True)
+    return obra_id
+
+
+def _lancamento(rng, obra_id, casa_id, servico_id, status, quando, frac_obs, frac_anulados, **datas):
+    obs = f"Observação de campo {int(rng.integers(1, 10**6))}: conferir prumo e acabamento." if rng.random() < frac_obs else ""
+    return {"obra_id": obra_id, "casa_id": casa_id, "servico_id": servico_id, "responsavel": "bench", "executor": "",
+            "status": status, "observacoes": obs, "created_at": quando.isoformat(), "anulado": bool(rng.random() < frac_anulados), **datas}
+
+
+def banco(escala, args):
+    # um arquivo por combinação de parâmetros; com --dados é reaproveitado entre rodadas
+    nome = f"bench_{escala}x_{args.etapas}e_{args.servicos}s_{args.seed}.sqlite3"
+    path = os.path.join(args.dados, nome)
+    novo = not os.path.exists(path)
+    db = SqliteBackend(path, uploads_dir=args.dados)
+    if novo:
+        t0 = time.perf_counter()
+        gerar_obra(db, "Obra sintética", BERLIN_CASAS * escala, args.etapas, args.servicos, seed=args.seed)
+        print(f"  dados gerados em {time.perf_counter() - t0:.1f}s ({path})")
+    obra_id = db.select("obras", select="id", filters={"nome": "Obra sintética"})[0]["id"]
+    return db, obra_id
+
+
+# -------------------- caminhos do app --------------------
+# As telas usam as mesmas funções (consultas, resumo, lotes, importacao,
+# relatorio); aqui só muda o acesso ao banco: db.select direto, sem o cache
+# de referência nem o traço do app.py (que depende do Streamlit).
+def ref(db, q, filters=None, limit=None):
+    # o que ref_df monta na primeira leitura de uma versão do cache
+    rows = ler_paginado(db.select, q.tabela, q.select, filters=filters, order=q.ordem) if limit is None else \
+        db.select(q.tabela, select=q.select, filters=filters, order=q.ordem, limit=limit)
+    return compactar(rows, list(q.colunas))
+
+
+def consulta_df(db, q, filters=None):
+    # como sb_consulta_df: sempre com as colunas da projeção
+    return pd.DataFrame(db.select(q.tabela, select=q.select, filters=filters, order=q.ordem), columns=list(q.colunas))
+
+
+def indice(db, casas, etapa=None):
+    # como indice_ativacoes: só as casas da obra, em páginas
+    return IndiceAtivacoes(ativacoes_obra(db.select, casas["id"], etapa))
+
+
+def carregar_resumo(db, r):
+    # carga agregada no banco (r novo) ou reagregação das casas do delta, como resumo_obra
+    return r.atualizar(lambda p: db.rpc("dashboard_resumo", p), db.select)
+
+
+def carga_resumo(db, obra_id):
+    r = ResumoIncremental(obra_id, db.select(SERVICOS.tabela, select=SERVICOS.select, filters={"obra_id": obra_id}))
+    carregar_resumo(db, r)
+    return r
+
+
+def dashboard(db, obra_id, r, etapa=None):
+    casas = ref(db, CASAS, {"obra_id": obra_id})
+    return r.resumo(casas, indice(db, casas, etapa).mascara(casas["id"], etapa), etapa)
+
+
+def lancamentos(db, obra_id, etapa, casa_id):
+    casas = ref(db, CASAS, {"obra_id": obra_id})
+    ativas = casas[indice(db, casas, etapa).mascara(casas["id"], etapa)]
+    servs = ref(db, SERVICOS, {"obra_id": obra_id, "etapa": etapa})
+    return len(ativas), sugestoes(servs, consulta_df(db, ESTADO_CASA, {"casa_id": casa_id}))
+
+
+def correcoes(db, obra_id, casa_id):
+    casas = ref(db, CASAS, {"obra_id": obra_id})
+    lotes = casas_com_lancamentos(consulta_df(db, LANC_CASAS, {"obra_id": obra_id, "anulado": False}), casas)
+    det = consulta_df(db, LANC_CORRECAO, {"obra_id": obra_id, "casa_id": casa_id, "anulado": False})
+    return len(lotes), lancamentos_servico(det, ref(db, SERVICOS, {"obra_id": obra_id}))
+
+
+def observacoes_csv(db, obra_id, casa_id):
+    lanc = consulta_df(db, LANC_OBSERVACOES, {"obra_id": obra_id, "casa_id": casa_id, "anulado": False, "observacoes": ("neq", "")})
+    return tabela_observacoes(lanc, ref(db, SERVICOS, {"obra_id": obra_id})).to_csv(index=False).encode("utf-8-sig")
+
+
+def previsto_xlsx(db, obra_id):
+    casas = ref(db, CASAS, {"obra_id": obra_id})
+    servicos = ref(db, SERVICOS, {"obra_id": obra_id})
+    filtros = {"servico_id": ("in", servicos["id"].astype(int).tolist())}
+    estados = pd.DataFrame([e for rows in paginar(db.select, ESTADO_RESUMO.tabela, ESTADO_RESUMO.select, filters=filtros) for e in rows],
+                           columns=list(ESTADO_RESUMO.colunas))
+    return exportar_xlsx(previsto_executado(casas, servicos, estados), titulo="bench")
+
+
+def planilha_casas(n):
+    linhas = [f"{k // 30 + 1},{k % 30 + 1},{TIPOLOGIAS[k % 3][0]},{TIPOLOGIAS[k % 3][1]}" for k in range(n)]
+    return ("quadra,lote,cod_tipologia,tipologia\n" + "\n".join(linhas)).encode("utf-8")
+
+
+def planilha_servicos(n, etapas):
+    linhas = [f"{etapas[k % len(etapas)]},Serviço importado {k + 1:05d}" for k in range(n)]
+    return ("etapa,servico\n" + "\n".join(linhas)).encode("utf-8")
+
+
+def importar(db, tabela, conteudo, esquema, obrigatorios, preparar, conflito):
+    # upload (CSV) -> validação -> upsert em blocos no pool, como na Base de Dados
+    df = ler_planilha(io.BytesIO(conteudo), "bench.csv", esquema, obrigatorios=obrigatorios)
+    validos, _ = preparar(df)
+    return upsert_em_lotes(lambda bloco: db.upsert(tabela, bloco, on_conflict=conflito), registros(validos))
+
+
+# -------------------- medição --------------------
+def medir(fn, repeticoes, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+    return min(tempos), statistics.median(tempos)
+
+
+# módulos que o app.py importa na partida (um import pesado novo aqui aparece no caso "partida")
+MODULOS_APP = ("streamlit", "pandas", "arquivo", "auditoria", "backend", "consultas", "desempenho", "fila", "fotos",
+               "importacao", "indices", "lotes", "relatorio", "resumo", "snapshot")
+
+
+def partida():
+    # imports do app num interpretador novo (o que o primeiro acesso paga)
+    subprocess.run([sys.executable, "-c", "import " + ", ".join(MODULOS_APP)], cwd=RAIZ, check=True, timeout=120)
+
+
+def casos(db, obra_id, escala, args):
+    rng = np.random.default_rng(args.seed)
+    etapa = db.select("etapas", select="nome", filters={"obra_id": obra_id}, order="nome")[0]["nome"]
+    ativos = db.select("casa_ativacoes", select="casa_id", filters={"etapa": etapa, "ativa": True})
+    casa_id = int(rng.choice([a["casa_id"] for a in ativos]))
+    r = carga_resumo(db, obra_id)
+    n_casas = len(db.select("casas", select="id", filters={"obra_id": obra_id}))
+    etapas = [e["nome"] for e in db.select("etapas", select="nome", filters={"obra_id": obra_id})]
+    imp = {}
+
+    def tocar():
+        # 1% dos estados muda "agora": é o que o delta precisa trazer
+        ids = [e["id"] for e in db.select("estado_servicos", select="id", filters={"casa_id": ("in", [a["casa_id"] for a in ativos[:max(1, len(ativos) // 100)]])})]
+        if ids:
+            db.update("estado_servicos", {"updated_at": datetime.utcnow().isoformat()}, {"id": ("in", ids)})
+
+    def obra_importacao():
+        for o in db.select("obras", select="id", filters={"nome": "Importação bench"}):
+            db.delete("obras", {"id": o["id"]})
+        imp["obra"] = db.insert("obras", [{"nome": "Importação bench"}])[0]["id"]
+
+    conteudo_casas = planilha_casas(n_casas)
+    conteudo_servs = planilha_servicos(args.servicos * len(etapas) * escala, etapas)
+    yield "partida", partida, None
+    yield "dashboard_carga", (lambda: dashboard(db, obra_id, carga_resumo(db, obra_id))), None
+    def dashboard_delta():
+        carregar_resumo(db, r)
+        return dashboard(db, obra_id, r)
+
+    yield "dashboard_delta", dashboard_delta, tocar
+    yield "lancamentos", (lambda: lancamentos(db, obra_id, etapa, casa_id)), None
+    yield "correcoes", (lambda: correcoes(db, obra_id, casa_id)), None
+    yield "observacoes_csv", (lambda: observacoes_csv(db, obra_id, casa_id)), None
+    yield "previsto_xlsx", (lambda: previsto_xlsx(db, obra_id)), None
+    yield "importar_casas", (lambda: importar(db, "casas", conteudo_casas, ESQUEMA_CASAS, ["lote"],
+                                              lambda df: preparar_casas(df, imp["obra"]), "obra_id,lote")), obra_importacao
+    yield "importar_servicos", (lambda: importar(db, "servicos", conteudo_servs, ESQUEMA_SERVICOS, ["servico"],
+                                                 lambda df: preparar_servicos(df, imp["obra"], etapas[0]), "nome,etapa,obra_id")), obra_importacao
+
+
+# -------------------- histórico --------------------
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def ler_historico(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+
+def referencia(historico, r, ultimas=5):
+    # mediana do melhor tempo nas últimas rodadas com os mesmos parâmetros
+    mesmos = [h["melhor_s"] for h in historico
+              if (h["caso"], h["escala"], h["etapas"], h["servicos"], h["seed"]) == (r["caso"], r["escala"], r["etapas"], r["servicos"], r["seed"])]
+    return statistics.median(mesmos[-ultimas:]) if mesmos else None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--escalas", default="1,10,100", help="múltiplos da obra Berlin (599 lotes × 15 serviços)")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--etapas", type=int, default=1)
+    ap.add_argument("--servicos", type=int, default=BERLIN_SERVICOS, help="serviços por etapa")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--casos", default="", help="só estes casos (separados por vírgula)")
+    ap.add_argument("--dados", default=None, help="pasta para guardar/reaproveitar os bancos gerados (padrão: temporária)")
+    ap.add_argument("--historico", default=str(RAIZ / "bench" / "historico.jsonl"))
+    ap.add_argument("--tolerancia", type=float, default=0.25, help="regressão se passar a referência em mais que isso (0.25 = 25%%)")
+    ap.add_argument("--minimo", type=float, default=0.01, help="diferenças menores que isso (s) não contam como regressão")
+    ap.add_argument("--falhar", action="store_true", help="sai com código 1 se houver regressão")
+    args = ap.parse_args()
+    args.dados = args.dados or tempfile.mkdtemp(prefix="bench_obra_")
+    os.makedirs(args.dados, exist_ok=True)
+    so = {c.strip() for c in args.casos.split(",") if c.strip()}
+
+    historico = ler_historico(args.historico)
+    rodada = {"quando": datetime.now().isoformat(timespec="seconds"), "commit": commit_atual()}
+    novos, regressoes = [], []
+    print(f"{'escala':>6} {'caso':<18} {'melhor (s)':>11} {'mediana (s)':>12} {'ref. (s)':>10} {'Δ':>8}")
+    for escala in [int(x) for x in args.escalas.split(",")]:
+        db, obra_id = banco(escala, args)
+        for caso, fn, preparar in casos(db, obra_id, escala, args):
+            if so and caso not in so:
+                continue
+            melhor, mediana = medir(fn, args.repeticoes, preparar)
+            r = {**rodada, "escala": escala, "casas": BERLIN_CASAS * escala, "etapas": args.etapas, "servicos": args.servicos,
+                 "seed": args.seed, "caso": caso, "melhor_s": round(melhor, 5), "mediana_s": round(mediana, 5)}
+            ref_s = referencia(historico, r)
+            delta = (melhor / ref_s - 1) if ref_s else None
+            marca = ""
+            if delta is not None and delta > args.tolerancia and melhor - ref_s > args.minimo:
+                marca = "  REGRESSÃO"
+                regressoes.append(r)
+            print(f"{escala:>5}× {caso:<18} {melhor:>11.4f} {mediana:>12.4f} {'—' if ref_s is None else f'{ref_s:.4f}':>10} "
+                  f"{'' if delta is None else f'{delta:+.0%}':>8}{marca}")
+            novos.append(r)
+
+    with open(args.historico, "a", encoding="utf-8") as f:
+        for r in novos:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    print(f"{len(novos)} resultado(s) em {args.historico}; {len(regressoes)} regressão(ões) acima de {args.tolerancia:.0%}.")
+    if regressoes and args.falhar:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Micro-benchmark: casas ativas por etapa (apply por casa × IndiceAtivacoes).
+
+Uso: python bench/bench_ativacoes.py [--tamanhos 600,6000,60000] [--repeticoes 5]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from indices import IndiceAtivacoes  # noqa: E402
+
+ETAPAS = ["Reboco", "Pintura", "Revestimento"]
+
+
+def gerar(n_casas, seed=42):
+    rng = np.random.default_rng(seed)
+    casas = pd.DataFrame({"id": np.arange(1, n_casas + 1), "lote": [f"QD {i // 30 + 1} LT {i % 30 + 1}" for i in range(n_casas)]})
+    partes = []
+    for etapa in ETAPAS:
+        ids = rng.choice(casas["id"].to_numpy(), size=n_casas // 2, replace=False)
+        partes.append(pd.DataFrame({"casa_id": ids, "etapa": etapa, "ativa": rng.random(len(ids)) < 0.8}))
+    return casas, pd.concat(partes, ignore_index=True)
+
+
+def antigo(casas, ativacoes):
+    # como era em Lançamentos: varre as ativações da etapa para cada casa
+    return casas["id"].apply(lambda cid: bool((ativacoes[ativacoes["casa_id"]==cid]["ativa"]==True).any()))
+
+
+def melhor_tempo(fn, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        out = fn()
+        melhor = min(melhor, time.perf_counter() - t0)
+    return melhor, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tamanhos", default="600,6000,60000")
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--amostra", type=int, default=2000, help="acima disso o método antigo é medido numa amostra e extrapolado")
+    args = ap.parse_args()
+
+    etapa = "Reboco"
+    print(f"{'casas':>8} {'ativações':>10} {'apply (s)':>12} {'índice (s)':>11} {'máscara (s)':>12} {'speedup':>9}")
+    for n in [int(x) for x in args.tamanhos.split(",")]:
+        casas, ativacoes = gerar(n)
+        ativ_etapa = ativacoes[ativacoes["etapa"] == etapa]
+
+        t_idx, idx = melhor_tempo(lambda: IndiceAtivacoes(ativ_etapa), args.repeticoes)
+        t_mask, novo = melhor_tempo(lambda: idx.mascara(casas["id"], etapa), args.repeticoes)
+
+        amostra = casas if n <= args.amostra else casas.head(args.amostra)
+        t_old, velho = melhor_tempo(lambda: antigo(amostra, ativ_etapa), 1 if n > args.amostra else args.repeticoes)
+        estimado = n > args.amostra
+        if estimado:
+            t_old *= n / len(amostra)
+        assert velho.tolist() == novo.head(len(amostra)).tolist(), "resultados divergentes"
+
+        speedup = t_old / (t_idx + t_mask)
+        print(f"{n:>8} {len(ativ_etapa):>10} {t_old:>11.4f}{'*' if estimado else ' '} {t_idx:>11.5f} {t_mask:>12.5f} {speedup:>8.0f}x")
+    print("* extrapolado linearmente a partir da amostra")
+
+
+if __name__ == "__main__":
+    main()
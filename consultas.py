@@ -0,0 +1,159 @@
+import json
+import threading
+from typing import NamedTuple
+
+
+class Consulta(NamedTuple):
+    # Projeção de uma tela: tabela, só as colunas que ela usa e a ordem.
+    # As tabelas de referência têm uma projeção compartilhada pelas telas,
+    # para cair na mesma entrada do cache.
+    tabela: str
+    colunas: tuple
+    ordem: str | None = None
+
+    @property
+    def select(self):
+        return ",".join(self.colunas)
+
+
+# -------------------- referência (cache por processo) --------------------
+OBRAS = Consulta("obras", ("id", "nome"), "nome")
+ETAPAS = Consulta("etapas", ("id", "nome"), "nome")
+SERVICOS = Consulta("servicos", ("id", "nome", "etapa"), "nome")
+CASAS = Consulta("casas", ("id", "lote"), "lote")
+CASAS_CADASTRO = Consulta("casas", ("id", "lote", "tipologia", "ativa", "ativa_em", "ativa_por"), "lote")
+ATIVACOES = Consulta("casa_ativacoes", ("casa_id", "etapa", "ativa"))
+ATIVACAO_CASA = Consulta("casa_ativacoes", ("ativa", "ativa_em", "ativa_por"))
+
+# -------------------- por tela --------------------
+ESTADO_CASA = Consulta("estado_servicos", ("casa_id", "servico_id", "status", "executor", "data_inicio", "data_fim", "updated_at"))
+ESTADO_AJUSTE = Consulta("estado_servicos", ("status", "executor", "data_inicio", "data_fim"))
+ESTADO_RESUMO = Consulta("estado_servicos", ("casa_id", "servico_id", "status", "updated_at"))
+# Dashboard: só as casas alteradas desde a marca d'água (reagregadas no banco)
+ESTADO_ALTERADAS = Consulta("estado_servicos", ("casa_id", "updated_at"))
+# Correções: lista de lotes só com casa_id; o detalhe só da casa escolhida
+LANC_CASAS = Consulta("lancamentos", ("casa_id",))
+LANC_CORRECAO = Consulta("lancamentos", ("id", "servico_id", "status", "responsavel", "executor", "data_inicio", "data_conclusao", "observacoes", "created_at"))
+LANC_OBSERVACOES = Consulta("lancamentos", ("servico_id", "status", "executor", "data_inicio", "data_conclusao", "observacoes", "responsavel", "created_at", "foto_path"))
+# Logs: filtros "Usuário"/"Ação" pela tabela de facetas (sql/auditoria_facetas.sql)
+AUDITORIA_FACETAS = Consulta("auditoria_facetas", ("campo", "valor", "n"), "valor")
+# busca sem sql/busca_observacoes.sql: observações da obra inteira, filtradas no app
+LANC_BUSCA = Consulta("lancamentos", ("id", "casa_id", "servico_id", "status", "executor", "responsavel", "created_at", "observacoes", "foto_path"))
+USUARIOS = Consulta("usuarios", ("id", "username", "nome", "role", "ativo", "permissoes"), "username")
+
+
+# -------------------- montagem das telas --------------------
+def sugestoes(servs, estado):
+    # Lançamentos: serviços da etapa com o status atual na casa (sem estado = "Não iniciado")
+    sugest = servs[["id", "nome"]].merge(estado[["servico_id", "status"]], left_on="id", right_on="servico_id", how="left")
+    sugest["status"] = sugest["status"].fillna("Não iniciado")
+    return sugest
+
+
+def casas_com_lancamentos(lanc, casas):
+    # Correções: casas (id, lote) que têm lançamento ativo, por lote
+    return lanc.drop_duplicates("casa_id").merge(casas[["id", "lote"]], left_on="casa_id", right_on="id", how="inner").sort_values("lote")
+
+
+def lancamentos_servico(lanc, servs):
+    # lançamentos (LANC_CORRECAO/LANC_OBSERVACOES) com nome e etapa do serviço
+    return lanc.merge(servs[["id", "nome", "etapa"]], left_on="servico_id", right_on="id", how="left", suffixes=("", "_srv"))
+
+
+def tabela_observacoes(lanc, servs):
+    # Observações de uma casa: a tabela da tela e do CSV
+    lanc = lanc[lanc["observacoes"].fillna("").str.strip() != ""]
+    df = lancamentos_servico(lanc, servs).rename(columns={"created_at": "data", "nome": "servico", "foto_path": "foto"})
+    return df[["data", "etapa", "servico", "status", "executor", "data_inicio", "data_conclusao", "observacoes", "responsavel", "foto"]]
+
+
+def paginar(select, tabela, colunas="*", filters=None, key="id", desc=False, chunk=1000, max_rows=None):
+    # Paginação por chave (key > último visto; key < em ordem decrescente): cada
+    # página é uma consulta indexada sem OFFSET e nunca passa do max-rows do
+    # PostgREST. Só para quando vier uma página vazia, para não confundir o
+    # corte do servidor com o fim da tabela. select(tabela, colunas, filters=,
+    # order=, limit=, desc=) é o select do backend ou um envoltório dele.
+    if colunas != "*" and key not in [c.strip() for c in colunas.split(",")]:
+        colunas = f"{colunas},{key}"
+    last = None
+    restantes = max_rows
+    while restantes is None or restantes > 0:
+        n = chunk if restantes is None else min(chunk, restantes)
+        f = dict(filters or {})
+        if last is not None:
+            f[key] = ("lt", last) if desc else ("gt", last)
+        rows = select(tabela, colunas, filters=f, order=key, limit=n, desc=desc)
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][key]
+        if restantes is not None:
+            restantes -= len(rows)
+
+
+def ler_paginado(select, tabela, colunas="*", filters=None, order=None, desc=False, chunk=1000):
+    # Todas as linhas, em páginas por id (paginar), na ordem pedida. A ordem é
+    # aplicada depois de juntar as páginas, com os nulos no fim (como no
+    # Postgres); textos seguem a ordem de código, não a colação do banco.
+    rows = [r for pagina in paginar(select, tabela, colunas, filters=filters, chunk=chunk) for r in pagina]
+    if order:
+        cols = list(order) if isinstance(order, (list, tuple)) else [order]
+        rows.sort(key=lambda r: tuple((r.get(c) is None, r.get(c)) for c in cols), reverse=desc)
+    return rows
+
+
+def faixas(ids, salto=1000):
+    # ids em faixas [início, fim) de ids próximos; um buraco de `salto` ids ou
+    # mais (casas de outras obras) abre outra faixa
+    out = []
+    for i in sorted({int(x) for x in ids}):
+        if out and i - out[-1][1] < salto:
+            out[-1][1] = i + 1
+        else:
+            out.append([i, i + 1])
+    return [tuple(f) for f in out]
+
+
+def ativacoes_obra(select, casa_ids, etapa=None, chunk=1000):
+    # ATIVACOES só das casas de uma obra (casa_ativacoes não tem obra_id), em
+    # páginas por id. Faixas de casa_id em vez de um IN com os ids (URL do
+    # PostgREST, limite de variáveis do SQLite); linhas de casas de outras
+    # obras que caiam dentro de uma faixa ficam de fora.
+    ids = {int(c) for c in casa_ids}
+    out = []
+    for ini, fim in faixas(ids, chunk):
+        f = {"casa_id": ("entre", (ini, fim))}
+        if etapa is not None:
+            f["etapa"] = etapa
+        for rows in paginar(select, ATIVACOES.tabela, ATIVACOES.select, filters=f, chunk=chunk):
+            out += [r for r in rows if int(r["casa_id"]) in ids]
+    return out
+
+
+def tamanho_json(rows):
+    # bytes do corpo JSON equivalente (o que o PostgREST manda pela rede)
+    return len(json.dumps(rows, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8"))
+
+
+class MedidorBytes:
+    # Acumula, por (tabela, select), chamadas, linhas e bytes lidos do banco
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_consulta = {}
+
+    def registrar(self, tabela, select, rows):
+        n = tamanho_json(rows)
+        with self._lock:
+            c = self._por_consulta.setdefault((tabela, select), [0, 0, 0])
+            c[0] += 1
+            c[1] += len(rows)
+            c[2] += n
+        return n
+
+    def stats(self):
+        with self._lock:
+            itens = [(k, list(v)) for k, v in self._por_consulta.items()]
+        return sorted(
+            ({"tabela": t, "select": s, "chamadas": c, "linhas": l, "bytes": b, "bytes_por_chamada": b // c} for (t, s), (c, l, b) in itens),
+            key=lambda r: -r["bytes"],
+        )
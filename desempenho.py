@@ -0,0 +1,111 @@
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+FORA_DE_TELA = "(segundo plano)"
+
+
+def _resumir_filtros(filters):
+    # listas de "in" podem ter milhares de ids: guarda só o tamanho
+    out = {}
+    for k, v in (filters or {}).items():
+        if isinstance(v, tuple) and len(v) == 2 and v[0] == "in":
+            out[k] = f"in ({len(v[1])})"
+        elif isinstance(v, tuple) and len(v) == 2:
+            out[k] = f"{v[0]} {v[1]}"
+        else:
+            out[k] = v
+    return out
+
+
+class Rastreador:
+    # Traço das chamadas ao banco (sb_*): uma linha por chamada com o rerun,
+    # a tela, a operação, a tabela, os filtros, as linhas e o tempo. Guarda as
+    # últimas `maximo` chamadas do processo; a tela/rerun de cada thread do
+    # script fica num threading.local (threads de fundo aparecem como
+    # FORA_DE_TELA).
+
+    def __init__(self, maximo=20000):
+        self._eventos = deque(maxlen=maximo)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reruns = itertools.count(1)
+
+    def novo_rerun(self, pagina=None):
+        self._local.ctx = (next(self._reruns), pagina)
+
+    def pagina(self, pagina):
+        rerun, _ = self.contexto()
+        self._local.ctx = (rerun, pagina)
+
+    def contexto(self):
+        return getattr(self._local, "ctx", (None, FORA_DE_TELA))
+
+    def usar(self, ctx):
+        # para threads de trabalho disparadas pelo script (ex.: pool de upserts)
+        self._local.ctx = ctx
+
+    @contextmanager
+    def medir(self, op, tabela, filters=None):
+        rerun, pagina = self.contexto()
+        ev = {"ts": time.time(), "rerun": rerun, "pagina": pagina, "op": op, "tabela": tabela,
+              "filtros": _resumir_filtros(filters), "linhas": 0, "ms": 0.0}
+        t0 = time.perf_counter()
+        try:
+            yield ev
+        except Exception as e:
+            ev["erro"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            ev["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            with self._lock:
+                self._eventos.append(ev)
+
+    def eventos(self):
+        with self._lock:
+            return list(self._eventos)
+
+    def limpar(self):
+        with self._lock:
+            self._eventos.clear()
+
+
+def por_tabela(eventos):
+    # latência p50/p95 e linhas por chamada, por (tabela, operação)
+    df = pd.DataFrame(eventos, columns=["tabela", "op", "ms", "linhas"])
+    if df.empty:
+        return pd.DataFrame(columns=["tabela", "op", "chamadas", "p50_ms", "p95_ms", "total_ms", "linhas_por_chamada"])
+    g = df.groupby(["tabela", "op"], sort=False)
+    out = pd.DataFrame({
+        "chamadas": g.size(),
+        "p50_ms": g["ms"].quantile(0.5).round(1),
+        "p95_ms": g["ms"].quantile(0.95).round(1),
+        "total_ms": g["ms"].sum().round(1),
+        "linhas_por_chamada": g["linhas"].mean().round(1),
+    })
+    return out.reset_index().sort_values("total_ms", ascending=False, ignore_index=True)
+
+
+def por_rerun(eventos):
+    # uma linha por execução do script: tela, chamadas, linhas e tempo no banco
+    df = pd.DataFrame([e for e in eventos if e["rerun"] is not None], columns=["rerun", "pagina", "ts", "ms", "linhas"])
+    if df.empty:
+        return pd.DataFrame(columns=["rerun", "pagina", "inicio", "chamadas", "banco_ms", "linhas"])
+    g = df.groupby("rerun", sort=True)
+    out = pd.DataFrame({
+        "pagina": g["pagina"].last(),
+        "inicio": pd.to_datetime(g["ts"].min(), unit="s"),
+        "chamadas": g.size(),
+        "banco_ms": g["ms"].sum().round(1),
+        "linhas": g["linhas"].sum(),
+    })
+    return out.reset_index().sort_values("rerun", ascending=False, ignore_index=True)
+
+
+def jsonl(eventos):
+    return "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in eventos).encode("utf-8")
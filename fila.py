@@ -0,0 +1,168 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class Adiar(Exception):
+    # levantada pelo sincronizador: o item ainda não pode subir (espera outro
+    # item da fila). Tratada como falha transitória: não conta tentativa.
+    pass
+
+
+class FilaEscrita:
+    # Fila local (SQLite) de gravações feitas no campo. enfileirar() grava no
+    # disco e retorna na hora; uma thread de fundo envia os itens em lotes,
+    # na ordem, quando houver conexão.
+    #
+    # sincronizar: {tipo: fn(lista_de_payloads)}; fn levanta exceção em falha.
+    # transitorio(e): True para falhas de rede (não contam tentativa; Adiar
+    # também não). Falhas
+    # definitivas são isoladas item a item e, após `max_tentativas`, o item
+    # sai da fila ativa (status "erro") para não travar os demais.
+
+    def __init__(self, path, sincronizar, transitorio=lambda e: False, lote=100, intervalo=5.0,
+                 espera_max=120.0, max_tentativas=5):
+        self.path = path
+        self.sincronizar = sincronizar
+        self.transitorio = transitorio
+        self.lote = lote
+        self.intervalo = intervalo
+        self.espera_max = espera_max
+        self.max_tentativas = max_tentativas
+        self._local = threading.local()
+        self._acordar = threading.Event()
+        self._espera = 0.0
+        self._proxima_tentativa = 0.0
+        self.ultima_sync = None
+        self.ultimo_erro = None
+        con = self._con()
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS fila ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " tipo TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " criado_em REAL NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pendente',"
+            " tentativas INTEGER NOT NULL DEFAULT 0,"
+            " ultimo_erro TEXT)"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS ix_fila_status ON fila(status, id)")
+        con.commit()
+        self._thread = threading.Thread(target=self._loop, name="fila-escrita", daemon=True)
+        self._thread.start()
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30)
+            con.execute("PRAGMA synchronous=FULL")
+            self._local.con = con
+        return con
+
+    def enfileirar(self, tipo, payload):
+        con = self._con()
+        with con:
+            cur = con.execute(
+                "INSERT INTO fila (tipo, payload, criado_em) VALUES (?, ?, ?)",
+                (tipo, json.dumps(payload, ensure_ascii=False, default=str), time.time()),
+            )
+        self._acordar.set()
+        return cur.lastrowid
+
+    def pendentes(self, tipo=None):
+        sql = "SELECT payload FROM fila WHERE status = 'pendente'"
+        args = ()
+        if tipo:
+            sql += " AND tipo = ?"
+            args = (tipo,)
+        return [json.loads(p) for (p,) in self._con().execute(sql + " ORDER BY id", args)]
+
+    def stats(self):
+        con = self._con()
+        n, mais_antigo = con.execute("SELECT COUNT(*), MIN(criado_em) FROM fila WHERE status = 'pendente'").fetchone()
+        (erros,) = con.execute("SELECT COUNT(*) FROM fila WHERE status = 'erro'").fetchone()
+        return {
+            "profundidade": n,
+            "atraso_s": (time.time() - mais_antigo) if mais_antigo else 0.0,
+            "erros": erros,
+            "ultima_sync": self.ultima_sync,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+    def sincronizar_agora(self):
+        self._proxima_tentativa = 0.0
+        self._acordar.set()
+
+    # ---- thread de fundo ----
+    def _loop(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            if time.monotonic() < self._proxima_tentativa:
+                continue
+            try:
+                while self._ciclo():
+                    pass
+            except Exception as e:  # nunca deixa a thread morrer
+                self.ultimo_erro = f"{type(e).__name__}: {e}"
+
+    def _ciclo(self):
+        # envia um lote; True se há mais a enviar
+        con = self._con()
+        rows = con.execute(
+            "SELECT id, tipo, payload FROM fila WHERE status = 'pendente' ORDER BY id LIMIT ?", (self.lote,)
+        ).fetchall()
+        if not rows:
+            return False
+        # grupos consecutivos do mesmo tipo, preservando a ordem
+        grupos = []
+        for r in rows:
+            if grupos and grupos[-1][0] == r[1]:
+                grupos[-1][1].append(r)
+            else:
+                grupos.append((r[1], [r]))
+        for tipo, itens in grupos:
+            if not self._enviar(tipo, itens):
+                return False
+        # houve falha definitiva: espera o backoff antes do próximo lote
+        return len(rows) == self.lote and time.monotonic() >= self._proxima_tentativa
+
+    def _enviar(self, tipo, itens):
+        fn = self.sincronizar.get(tipo)
+        try:
+            if fn is None:
+                raise KeyError(f"tipo sem sincronizador: {tipo}")
+            fn([json.loads(p) for _, _, p in itens])
+        except Exception as e:
+            self.ultimo_erro = f"{type(e).__name__}: {e}"
+            if isinstance(e, Adiar) or self.transitorio(e):
+                self._adiar()
+                return False
+            if len(itens) > 1:
+                # isola o item problemático reenviando um a um
+                return all(self._enviar(tipo, [it]) for it in itens)
+            self._falhou(itens[0][0], self.ultimo_erro)
+            return True
+        con = self._con()
+        with con:
+            con.executemany("DELETE FROM fila WHERE id = ?", [(i,) for i, _, _ in itens])
+        self.ultima_sync = time.time()
+        self.ultimo_erro = None
+        self._espera = 0.0
+        return True
+
+    def _falhou(self, item_id, erro):
+        con = self._con()
+        with con:
+            con.execute(
+                "UPDATE fila SET tentativas = tentativas + 1, ultimo_erro = ?,"
+                " status = CASE WHEN tentativas + 1 >= ? THEN 'erro' ELSE status END WHERE id = ?",
+                (erro, self.max_tentativas, item_id),
+            )
+        self._adiar()
+
+    def _adiar(self):
+        self._espera = min(self.espera_max, max(1.0, self._espera * 2))
+        self._proxima_tentativa = time.monotonic() + self._espera
@@ -0,0 +1,69 @@
+import hashlib
+import io
+import os
+import re
+
+from PIL import Image, ImageOps
+
+_NOME = re.compile(r"([0-9a-f]{64})\.jpg(?=$|\?)")
+
+
+def hash_foto(dados):
+    return hashlib.sha256(dados).hexdigest()
+
+
+def caminhos(h):
+    # nome pelo conteúdo: a mesma foto vai sempre para o mesmo lugar no bucket
+    # (reenviar sobrescreve, não duplica) -> (foto, miniatura)
+    base = f"fotos/{h[:2]}/{h}"
+    return f"{base}.jpg", f"{base}_min.jpg"
+
+
+def hash_da_url(url):
+    # hash da foto na URL (nome pelo conteúdo); None para fotos antigas ou sem foto
+    m = _NOME.search(url) if isinstance(url, str) else None
+    return m.group(1) if m else None
+
+
+def url_miniatura(url):
+    # fotos antigas (nome com timestamp) não têm miniatura: usa a própria foto
+    if not url or not isinstance(url, str):
+        return None
+    return _NOME.sub(r"\1_min.jpg", url)
+
+
+def _jpeg(img, lado, qualidade):
+    img = img.copy()
+    img.thumbnail((lado, lado), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=qualidade, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def reduzir(dados, max_lado=1600, qualidade=80, lado_miniatura=320):
+    # -> (foto, miniatura) em JPEG, no máximo max_lado/lado_miniatura px no
+    # maior lado. Aplica a rotação do EXIF (foto de celular) e descarta os
+    # metadados (inclusive GPS).
+    with Image.open(io.BytesIO(dados)) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        return _jpeg(img, max_lado, qualidade), _jpeg(img, lado_miniatura, qualidade)
+
+
+def original(pasta, h):
+    return os.path.join(pasta, f"{h}.orig")
+
+
+def guardar_original(pasta, h, dados):
+    # Original no spool local até a fila subir; False se já estava lá (a mesma
+    # foto em mais de um rerun/lançamento entra na fila uma vez só).
+    os.makedirs(pasta, exist_ok=True)
+    destino = original(pasta, h)
+    if os.path.exists(destino):
+        return False
+    tmp = f"{destino}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(dados)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, destino)
+    return True
@@ -0,0 +1,98 @@
+import unicodedata
+
+import pandas as pd
+
+# campo -> nomes aceitos no cabeçalho (já normalizados por normaliza_coluna)
+ESQUEMA_CASAS = {
+    "quadra": ["quadra", "qd", "q"],
+    "lote": ["lote", "lt", "l"],
+    "cod_tipologia": ["cod_tipologia", "codigo_tipologia", "cod_tip"],
+    "tipologia": ["tipologia"],
+}
+ESQUEMA_SERVICOS = {
+    "servico": ["servico", "servicos"],
+    "etapa": ["etapa"],
+}
+
+
+def normaliza_coluna(nome):
+    # " Código Tipologia " -> "codigo_tipologia"
+    s = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode("ascii")
+    return "_".join(s.strip().lower().replace(".", " ").split())
+
+
+def mapear_colunas(colunas, esquema):
+    normalizadas = {normaliza_coluna(c): c for c in colunas}
+    mapa = {}
+    for campo, sinonimos in esquema.items():
+        orig = next((normalizadas[s] for s in sinonimos if s in normalizadas), None)
+        if orig is not None:
+            mapa[campo] = orig
+    return mapa
+
+
+def _ler(arquivo, nome, **kw):
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)
+    if str(nome).lower().endswith(".csv"):
+        return pd.read_csv(arquivo, **kw)
+    return pd.read_excel(arquivo, **kw)
+
+
+def ler_planilha(arquivo, nome, esquema, obrigatorios):
+    # Lê só o cabeçalho, valida o mapeamento e depois carrega apenas as colunas
+    # usadas, tudo como texto (quadra 3 não vira "3.0").
+    mapa = mapear_colunas(_ler(arquivo, nome, nrows=0).columns, esquema)
+    faltando = [c for c in obrigatorios if c not in mapa]
+    if faltando:
+        aceitos = "; ".join(f"{c}: {', '.join(esquema[c])}" for c in faltando)
+        raise ValueError(f"Coluna(s) obrigatória(s) ausente(s) — {aceitos}.")
+    df = _ler(arquivo, nome, usecols=list(mapa.values()), dtype=str)
+    return df.rename(columns={v: k for k, v in mapa.items()})[list(mapa)]
+
+
+def _texto(df, campo):
+    if campo not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[campo].fillna("").astype(str).str.strip().str.replace(r"^(\d+)\.0+$", r"\1", regex=True)
+
+
+def _separa(df, motivo, chave):
+    # separa as linhas com motivo e remove duplicados (fica a última ocorrência, como num upsert)
+    invalido = motivo != ""
+    dup = df[~invalido].duplicated(subset=chave, keep="last").reindex(df.index, fill_value=False)
+    motivo = motivo.mask(dup, "duplicado (mantida a última ocorrência)")
+    ruins = invalido | dup
+    linhas = df.index[ruins] + 2  # linha na planilha (cabeçalho = 1)
+    invalidos = pd.DataFrame({"linha": linhas, "motivo": motivo[ruins].to_numpy()})
+    return df[~ruins].reset_index(drop=True), invalidos
+
+
+def preparar_casas(df, obra_id):
+    # -> (registros válidos [obra_id, lote, cod_tipologia, tipologia], linhas inválidas [linha, motivo])
+    lote = _texto(df, "lote")
+    motivo = pd.Series("", index=df.index, dtype=object)
+    if "quadra" in df.columns:
+        quadra = _texto(df, "quadra")
+        motivo = motivo.mask(quadra == "", "quadra vazia")
+        lote_final = "QD " + quadra + " LT " + lote
+    else:
+        lote_final = lote
+    motivo = motivo.mask(lote == "", "lote vazio")
+    out = pd.DataFrame({"obra_id": obra_id, "lote": lote_final}, index=df.index)
+    for campo in ("cod_tipologia", "tipologia"):
+        out[campo] = _texto(df, campo) if campo in df.columns else None
+    return _separa(out, motivo, ["obra_id", "lote"])
+
+
+def preparar_servicos(df, obra_id, etapa_padrao):
+    # -> (registros válidos [nome, etapa, obra_id], linhas inválidas [linha, motivo])
+    nome = _texto(df, "servico")
+    etapa = _texto(df, "etapa").replace("", etapa_padrao)
+    motivo = pd.Series("", index=df.index, dtype=object).mask(nome == "", "serviço vazio")
+    out = pd.DataFrame({"nome": nome, "etapa": etapa, "obra_id": obra_id}, index=df.index)
+    return _separa(out, motivo, ["nome", "etapa", "obra_id"])
+
+
+def registros(df):
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
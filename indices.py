@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+
+class IndiceAtivacoes:
+    # Pares (casa_id, etapa) ativos de casa_ativacoes, montados uma vez por
+    # versão dos dados. Consulta pontual O(1) e máscara vetorizada por casas.
+    __slots__ = ("pares", "_por_etapa", "_todas", "_casas")
+
+    def __init__(self, ativacoes):
+        df = ativacoes if isinstance(ativacoes, pd.DataFrame) else pd.DataFrame(ativacoes)
+        if df.empty or "casa_id" not in df.columns:
+            self.pares = frozenset()
+            self._por_etapa = {}
+            self._todas = np.array([], dtype=np.int64)
+            self._casas = frozenset()
+            return
+        ativa = df["ativa"].eq(True) if "ativa" in df.columns else pd.Series(True, index=df.index)
+        ativos = df.loc[ativa]
+        casa_ids = ativos["casa_id"].astype(np.int64)
+        if "etapa" in ativos.columns:
+            etapas = ativos["etapa"]
+        else:
+            etapas = pd.Series(None, index=ativos.index, dtype=object)
+        self.pares = frozenset(zip(casa_ids.tolist(), etapas.tolist()))
+        self._por_etapa = {e: np.unique(g.to_numpy()) for e, g in casa_ids.groupby(etapas.to_numpy(), sort=False)}
+        self._todas = np.unique(casa_ids.to_numpy())
+        self._casas = frozenset(self._todas.tolist())
+
+    def __len__(self):
+        return len(self.pares)
+
+    def ativa(self, casa_id, etapa=None):
+        if etapa is None:
+            return int(casa_id) in self._casas
+        return (int(casa_id), etapa) in self.pares
+
+    def casas_ativas(self, etapa=None):
+        if etapa is None:
+            return self._todas
+        return self._por_etapa.get(etapa, np.array([], dtype=np.int64))
+
+    def mascara(self, casa_ids, etapa=None):
+        # equivale ao antigo casas["id"].apply(lambda cid: ...any()), sem varrer
+        # as ativações para cada casa
+        ids = casa_ids if isinstance(casa_ids, pd.Series) else pd.Series(casa_ids)
+        return ids.isin(self.casas_ativas(etapa))
+
+
+class Rotulos:
+    # id -> texto exibido de uma tabela de referência, montado uma vez por
+    # versão dos dados. Os selectbox trabalham com ids (format_func=rotulos):
+    # resolução O(1) e nomes repetidos (mesmo serviço em duas etapas) não se
+    # confundem. coluna pode ser uma tupla: ("nome", "etapa") -> "Pintura (Fase 1)".
+    __slots__ = ("ids", "_texto")
+
+    def __init__(self, rows, coluna="nome", id_col="id"):
+        if isinstance(coluna, str):
+            texto = (str(r.get(coluna) or "") for r in rows)
+        else:
+            principal, *extras = coluna
+            texto = (f"{r.get(principal) or ''} ({', '.join(str(r.get(c) or '') for c in extras)})" for r in rows)
+        self._texto = dict(zip((int(r[id_col]) for r in rows), texto))
+        self.ids = list(self._texto)
+
+    def __call__(self, id_):
+        return self._texto.get(int(id_), str(id_))
+
+    def __contains__(self, id_):
+        return int(id_) in self._texto
+
+    def __len__(self):
+        return len(self._texto)
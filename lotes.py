@@ -0,0 +1,71 @@
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+WORKERS = 4
+MAX_BYTES = 512 * 1024
+
+
+def blocos_por_tamanho(registros, max_linhas, max_bytes):
+    # blocos de até max_linhas, fechando antes se o JSON passar de max_bytes
+    bloco, tam = [], 0
+    for r in registros:
+        n = len(json.dumps(r, default=str)) + 1
+        if bloco and (len(bloco) >= max_linhas or tam + n > max_bytes):
+            yield bloco
+            bloco, tam = [], 0
+        bloco.append(r)
+        tam += n
+    if bloco:
+        yield bloco
+
+
+def erro_transitorio(e):
+    # rede, timeout de statement/pool, conflito de serialização, deadlock.
+    # httpx só está carregado se o Supabase estiver em uso
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(e, httpx.TransportError):
+        return True
+    return getattr(e, "code", None) in ("57014", "PGRST003", "40001", "40P01")
+
+
+def _com_retry(upsert, bloco, tentativas=4, espera=0.5):
+    for i in range(tentativas):
+        try:
+            upsert(bloco)
+            return len(bloco)
+        except Exception as e:
+            if i == tentativas - 1 or not erro_transitorio(e):
+                raise
+            time.sleep(espera * (2 ** i) * (1 + random.random()))
+
+
+def upsert_em_lotes(upsert, registros, chunk=500, progresso=None, workers=WORKERS, max_bytes=MAX_BYTES, initializer=None, initargs=()):
+    # Upsert em blocos enviados por um pool limitado de threads, com retry e
+    # backoff em erros transitórios; upsert(bloco) grava um bloco. progresso
+    # (feitos, total) é chamado na thread de quem chamou, nunca nas workers.
+    # Os blocos não podem repetir a chave de conflito entre si (deduplique antes).
+    blocos = list(blocos_por_tamanho(registros, chunk, max_bytes))
+    if not blocos:
+        return 0
+    total = len(registros)
+    feitos = 0
+    erros = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(blocos))), initializer=initializer, initargs=initargs) as ex:
+        futuros = [ex.submit(_com_retry, upsert, b) for b in blocos]
+        for f in as_completed(futuros):
+            if f.cancelled():
+                continue
+            try:
+                feitos += f.result()
+            except Exception as e:
+                erros.append(e)
+                for pendente in futuros:
+                    pendente.cancel()
+            if progresso:
+                progresso(feitos, total)
+    if erros:
+        raise RuntimeError(f"{feitos} de {total} linhas gravadas; falha em {len(erros)} bloco(s): {erros[0]}")
+    return feitos
@@ -0,0 +1,121 @@
+import re
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+STATUS = ["Não iniciado", "Em execução", "Concluído"]
+CORES = {"Não iniciado": "EDEDED", "Em execução": "FFE699", "Concluído": "A9D08E"}
+
+
+def matriz_status(casas, servicos, estados):
+    # Lote × serviço com o status de cada célula. casas [id, lote],
+    # servicos [id, nome], estados [casa_id, servico_id, status]; o que não
+    # tem estado é "Não iniciado". Preenche uma matriz de códigos pelas
+    # posições (get_indexer), sem laço por célula.
+    codigos = np.zeros((len(casas), len(servicos)), dtype=np.int8)
+    if len(estados):
+        i = pd.Index(casas["id"]).get_indexer(estados["casa_id"])
+        j = pd.Index(servicos["id"]).get_indexer(estados["servico_id"])
+        s = pd.Categorical(estados["status"], categories=STATUS).codes
+        ok = (i >= 0) & (j >= 0) & (s >= 0)
+        codigos[i[ok], j[ok]] = s[ok]
+    matriz = pd.DataFrame(
+        {nome: pd.Categorical.from_codes(codigos[:, k], STATUS) for k, nome in enumerate(servicos["nome"])},
+        index=pd.Index(casas["lote"], name="Lote"),
+    )
+    concluidos = (codigos == STATUS.index("Concluído")).sum(axis=1)
+    matriz["Concluídos"] = concluidos
+    matriz["% executado"] = np.round(concluidos / len(servicos) * 100, 1) if len(servicos) else 0.0
+    return matriz
+
+
+def previsto_executado(casas, servicos, estados):
+    # {etapa: matriz} para todas as etapas da obra; casas por lote, serviços por nome
+    casas = casas.sort_values("lote", kind="stable")
+    servicos = servicos.sort_values(["etapa", "nome"], kind="stable")
+    if len(estados):
+        por_etapa = estados.merge(servicos[["id", "etapa"]], left_on="servico_id", right_on="id", how="inner")
+        grupos = dict(tuple(por_etapa.groupby("etapa", sort=False, observed=True)))
+    else:
+        grupos = {}
+    vazio = pd.DataFrame(columns=["casa_id", "servico_id", "status"])
+    return {etapa: matriz_status(casas, sv, grupos.get(etapa, vazio)) for etapa, sv in servicos.groupby("etapa", sort=True, observed=True)}
+
+
+def resumo_etapas(matrizes):
+    linhas = []
+    for etapa, m in matrizes.items():
+        cel = m.drop(columns=["Concluídos", "% executado"])
+        total = cel.size
+        concl = int(m["Concluídos"].sum())
+        em_exec = int((cel == "Em execução").to_numpy().sum())
+        linhas.append({
+            "Etapa": etapa, "Casas": len(m), "Serviços": cel.shape[1], "Previsto": total,
+            "Concluído": concl, "Em execução": em_exec,
+            "% executado": round(concl / total * 100, 1) if total else 0.0,
+        })
+    return pd.DataFrame(linhas, columns=["Etapa", "Casas", "Serviços", "Previsto", "Concluído", "Em execução", "% executado"])
+
+
+def _nome_aba(nome, usados):
+    # Excel: até 31 caracteres, sem []:*?/\ e sem repetir
+    base = re.sub(r"[\[\]:*?/\\]", "-", str(nome)).strip() or "Etapa"
+    base = base[:31]
+    nome, n = base, 2
+    while nome.lower() in usados:
+        sufixo = f" ({n})"
+        nome = base[:31 - len(sufixo)] + sufixo
+        n += 1
+    usados.add(nome.lower())
+    return nome
+
+
+def exportar_xlsx(matrizes, titulo=None):
+    # Planilha em modo write-only (linhas vão direto para o arquivo, memória
+    # constante): aba "Resumo" + uma aba por etapa com as células de status
+    # coloridas por formatação condicional (uma regra por status, não estilo
+    # por célula). O openpyxl (~0,1 s de import) só é carregado aqui.
+    from openpyxl import Workbook
+    from openpyxl.formatting.rule import CellIsRule
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    negrito = Font(bold=True)
+    usados = set()
+
+    ws = wb.create_sheet(_nome_aba("Resumo", usados))
+    if titulo:
+        ws.append([titulo])
+    resumo = resumo_etapas(matrizes)
+    ws.append(list(resumo.columns))
+    for linha in resumo.itertuples(index=False, name=None):
+        ws.append(list(linha))
+    ws.column_dimensions["A"].width = 24
+
+    for etapa, m in matrizes.items():
+        ws = wb.create_sheet(_nome_aba(etapa, usados))
+        n_serv = m.shape[1] - 2
+        ws.freeze_panes = "B2"
+        ws.column_dimensions["A"].width = 18
+        for k in range(2, n_serv + 2):
+            ws.column_dimensions[get_column_letter(k)].width = 14
+        ws.append(["Lote", *m.columns])
+        valores = m.astype(object).to_numpy().tolist()
+        for lote, linha in zip(m.index.tolist(), valores):
+            ws.append([lote, *linha])
+        if n_serv and len(m):
+            faixa = f"B2:{get_column_letter(n_serv + 1)}{len(m) + 1}"
+            for status, cor in CORES.items():
+                ws.conditional_formatting.add(
+                    faixa, CellIsRule(operator="equal", formula=[f'"{status}"'], fill=PatternFill("solid", start_color=cor, end_color=cor))
+                )
+            ws.conditional_formatting.add(
+                f"{get_column_letter(n_serv + 3)}2:{get_column_letter(n_serv + 3)}{len(m) + 1}",
+                CellIsRule(operator="equal", formula=["100"], font=negrito, fill=PatternFill("solid", start_color=CORES["Concluído"], end_color=CORES["Concluído"])),
+            )
+
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+
+import pandas as pd
+
+from consultas import ESTADO_ALTERADAS, paginar
+
+STATUS_CONTADOS = {"Concluído": 0, "Em execução": 1}
+MARGEM_S = 120  # sobreposição padrão da marca d'água nos deltas
+
+
+def ts_utc(v):
+    # updated_at vem como texto (com ou sem fuso); compara tudo em UTC
+    t = pd.Timestamp(v)
+    return t.tz_convert("UTC").tz_localize(None) if t.tzinfo else t
+
+
+def agregar(estados, etapa_de, casas):
+    # O que dashboard_resumo devolve, calculado no app (sem sql/dashboard_resumo.sql):
+    # uma linha por casa de `casas` com {etapa: [concluidos, em_exec]} e o
+    # updated_at mais novo. Linhas de outras casas ou serviços são ignoradas.
+    out = {int(c): {"casa_id": int(c), "contagens": {}, "atualizado": None} for c in casas}
+    for r in estados:
+        a = out.get(int(r["casa_id"]))
+        etapa = etapa_de.get(int(r["servico_id"]), False)
+        if a is None or etapa is False:
+            continue
+        cont = a["contagens"].setdefault(etapa, [0, 0])
+        i = STATUS_CONTADOS.get(r.get("status"))
+        if i is not None:
+            cont[i] += 1
+        if r.get("updated_at"):
+            t = ts_utc(r["updated_at"])
+            if a["atualizado"] is None or t > a["atualizado"]:
+                a["atualizado"] = t
+    return list(out.values())
+
+
+def paginas_agregado(rpc, obra_id, casas=None, chunk=1000):
+    # dashboard_resumo em páginas de até `chunk` casas, por casa_id (o max-rows
+    # do PostgREST também corta a resposta de uma RPC); casas=None é a obra toda
+    depois = 0
+    while True:
+        rows = rpc({"p_obra_id": obra_id, "p_casas": casas, "p_depois": depois, "p_limite": chunk})
+        if not rows:
+            return
+        yield rows
+        depois = max(int(r["casa_id"]) for r in rows)
+
+
+class ResumoIncremental:
+    # Resumo do dashboard de uma obra mantido em memória: contagens por casa e
+    # etapa, agregadas no banco (dashboard_resumo, uma linha por casa). A
+    # carga inicial agrega a obra inteira; depois, só as casas com linhas de
+    # estado_servicos acima da marca d'água (ou avisadas pelo feed de
+    # alterações) são reagregadas, e as contagens delas trocadas inteiras.
+    # Reagregar a mesma casa de novo não muda nada, então a ordem não importa.
+
+    def __init__(self, obra_id, servicos):
+        self.obra_id = obra_id
+        self.etapa_de = {int(s["id"]): s.get("etapa") for s in servicos}
+        self.contagens = {}  # casa_id -> {etapa: [concluidos, em_exec]}
+        self.marca = None
+        self.carregado = False
+        self.sujas = set()  # casas avisadas pelo feed, reagregadas na próxima atualização
+        self.criado_em = time.time()
+        self.ultimo_delta = 0
+        self.consultado_em = None
+        self.obsoleto = False  # feed avisou de algo que não dá para localizar (ex.: DELETE sem a linha)
+        self.lock = threading.Lock()
+
+    def mesmos_servicos(self, servicos):
+        return {int(s["id"]): s.get("etapa") for s in servicos} == self.etapa_de
+
+    def substituir(self, agregados):
+        # linhas do dashboard_resumo; devolve quantas casas vieram
+        n = 0
+        for a in agregados:
+            cont = a.get("contagens") or {}
+            if isinstance(cont, str):  # o SQLite devolve o JSON como texto
+                cont = json.loads(cont)
+            self.contagens[int(a["casa_id"])] = {e: [int(v[0]), int(v[1])] for e, v in cont.items()}
+            if a.get("atualizado") is not None:
+                t = ts_utc(a["atualizado"])
+                if self.marca is None or t > self.marca:
+                    self.marca = t
+            n += 1
+        return n
+
+    def marcar(self, casa_id):
+        self.sujas.add(int(casa_id))
+
+    def filtros(self, margem_s=MARGEM_S):
+        # estado_servicos alterado desde a marca d'água (menos a margem, para
+        # relógios e gravações fora de ordem); sem marca, tudo
+        f = {"servico_id": ("in", sorted(self.etapa_de))}
+        if self.marca is not None:
+            f["updated_at"] = ("gte", (self.marca - pd.Timedelta(seconds=margem_s)).isoformat())
+        return f
+
+    def atualizar(self, rpc, select, margem_s=MARGEM_S, delta=True, chunk=1000):
+        # rpc(params) chama dashboard_resumo; select é o do backend (ver
+        # consultas.paginar). Na primeira vez, a obra inteira; depois, as casas
+        # do delta (com delta=False, só as avisadas pelo feed). Devolve quantas
+        # casas foram (re)agregadas.
+        if not self.carregado:
+            n = sum(self.substituir(rows) for rows in paginas_agregado(rpc, self.obra_id, chunk=chunk))
+            self.carregado = True
+            return n
+        casas = set(self.sujas)
+        if delta:
+            for rows in paginar(select, ESTADO_ALTERADAS.tabela, ESTADO_ALTERADAS.select, filters=self.filtros(margem_s), chunk=chunk):
+                casas.update(int(r["casa_id"]) for r in rows)
+        if not casas:
+            return 0
+        n = sum(self.substituir(rows) for rows in paginas_agregado(rpc, self.obra_id, sorted(casas), chunk))
+        self.sujas -= casas
+        return n
+
+    def resumo(self, casas, ativa_etapa, etapa=None):
+        # casas: DataFrame [id, lote]; ativa_etapa: máscara alinhada com casas
+        cont = pd.DataFrame(
+            [(c, sum(n[0] for e, n in por.items() if etapa is None or e == etapa), sum(n[1] for e, n in por.items() if etapa is None or e == etapa))
+             for c, por in self.contagens.items()],
+            columns=["casa_id", "concluidos", "em_exec"],
+        ).astype("int64").set_index("casa_id")
+        resumo = casas[["id", "lote"]].rename(columns={"id": "casa_id"}).assign(ativa_etapa=ativa_etapa.to_numpy())
+        resumo = resumo.merge(cont, left_on="casa_id", right_index=True, how="left")
+        resumo["concluidos"] = resumo["concluidos"].fillna(0).astype(int)
+        resumo["em_exec"] = resumo["em_exec"].fillna(0).astype(int)
+        resumo["total_serv"] = sum(1 for e in self.etapa_de.values() if etapa is None or e == etapa)
+        return resumo.to_dict(orient="records")
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+# colunas de texto com poucos valores distintos repetidos em muitas linhas
+CATEGORICAS = ("etapa", "status", "lote", "tipologia", "cod_tipologia")
+_INT32_MAX = np.iinfo(np.int32).max
+
+
+def compactar(rows, columns=None):
+    # DataFrame enxuto de uma tabela de referência: ids em int32 (Int32 se
+    # houver nulos) e textos repetitivos como category. Montado uma vez por
+    # versão do cache e compartilhado entre as sessões.
+    df = pd.DataFrame(rows, columns=columns)
+    for c in df.columns:
+        col = df[c]
+        if c == "id" or c.endswith("_id"):
+            if not pd.api.types.is_numeric_dtype(col) or (col.notna().any() and col.max() > _INT32_MAX):
+                continue
+            df[c] = col.astype(np.int32) if col.notna().all() else col.astype("Int32")
+        elif c in CATEGORICAS and col.dtype == object:
+            df[c] = col.astype("category")
+    return df
+
+
+def memoria(df):
+    return int(df.memory_usage(deep=True, index=True).sum())
@@ -0,0 +1,48 @@
+-- Facetas da auditoria: usuários e ações distintos, com a contagem de
+-- registros, mantidos por trigger a cada insert. A tela Logs monta os filtros
+-- "Usuário" e "Ação" a partir desta tabela (dezenas de linhas) em vez de ler
+-- a coluna inteira da auditoria. Sem ela, o app volta a ler as colunas.
+-- As contagens só crescem: apagar/arquivar registros da auditoria não tira
+-- o usuário/ação dos filtros.
+-- Executar uma vez no SQL Editor do Supabase.
+
+create table if not exists public.auditoria_facetas (
+    campo text not null,
+    valor text not null,
+    n bigint not null default 0,
+    primary key (campo, valor)
+);
+
+-- carga inicial com o que já está na auditoria
+insert into public.auditoria_facetas (campo, valor, n)
+select 'usuario', usuario, count(*) from public.auditoria where usuario is not null group by usuario
+union all
+select 'acao', acao, count(*) from public.auditoria group by acao
+on conflict (campo, valor) do update set n = excluded.n;
+
+-- por comando (não por linha): o AuditWriter grava em lotes
+create or replace function public.tr_auditoria_facetas()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.auditoria_facetas as f (campo, valor, n)
+    select 'usuario', usuario, count(*) from novos where usuario is not null group by usuario
+    union all
+    select 'acao', acao, count(*) from novos group by acao
+    on conflict (campo, valor) do update set n = f.n + excluded.n;
+    return null;
+end;
+$$;
+
+drop trigger if exists tr_auditoria_facetas on public.auditoria;
+create trigger tr_auditoria_facetas
+after insert on public.auditoria
+referencing new table as novos
+for each statement execute function public.tr_auditoria_facetas();
+
+-- filtros da tela Logs no servidor (usuario/acao já têm índice)
+create index if not exists ix_auditoria_timestamp on public.auditoria (timestamp);
+create index if not exists ix_auditoria_obra on public.auditoria (obra_id);
+
+grant select on public.auditoria_facetas to anon, authenticated;
@@ -0,0 +1,58 @@
+-- Busca textual nas observações dos lançamentos de uma obra (todas as casas).
+-- Índice GIN sobre um tsvector em português (com radicais: "infiltração"
+-- também acha "infiltrações"), resultado ordenado por relevância, com lote,
+-- serviço, etapa e o trecho da observação com os termos marcados.
+-- Usada pela tela Observações; sem ela, o app filtra as observações da obra
+-- em memória. Executar uma vez no SQL Editor do Supabase.
+
+alter table public.lancamentos
+    add column if not exists observacoes_tsv tsvector
+    generated always as (to_tsvector('portuguese', coalesce(observacoes, ''))) stored;
+
+create index if not exists ix_lancamentos_observacoes_tsv on public.lancamentos using gin (observacoes_tsv);
+
+create or replace function public.buscar_observacoes(p_obra_id bigint, p_termos text, p_limite integer default 50, p_offset integer default 0)
+returns table (
+    lancamento_id bigint,
+    casa_id bigint,
+    lote text,
+    servico_id bigint,
+    servico text,
+    etapa text,
+    status text,
+    executor text,
+    responsavel text,
+    created_at text,
+    observacoes text,
+    foto_path text,
+    trecho text,
+    relevancia real,
+    total bigint
+)
+language sql
+stable
+as $$
+    with q as (
+        select websearch_to_tsquery('portuguese', p_termos) as tsq
+    ),
+    achados as (
+        select l.*, ts_rank(l.observacoes_tsv, q.tsq) as relevancia, count(*) over () as total
+        from lancamentos l, q
+        where l.obra_id = p_obra_id
+          and not l.anulado
+          and l.observacoes_tsv @@ q.tsq
+        order by relevancia desc, l.created_at desc
+        limit p_limite offset p_offset
+    )
+    select a.id::bigint, a.casa_id::bigint, c.lote, a.servico_id::bigint, s.nome, s.etapa,
+           a.status, a.executor, a.responsavel, a.created_at::text, a.observacoes, a.foto_path,
+           ts_headline('portuguese', a.observacoes, q.tsq, 'StartSel=«, StopSel=», MaxWords=25, MinWords=8'),
+           a.relevancia, a.total
+    from achados a
+    cross join q
+    left join casas c on c.id = a.casa_id
+    left join servicos s on s.id = a.servico_id
+    order by a.relevancia desc, a.created_at desc;
+$$;
+
+grant execute on function public.buscar_observacoes(bigint, text, integer, integer) to anon, authenticated;
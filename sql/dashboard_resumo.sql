@@ -0,0 +1,55 @@
+-- Resumo por casa do Dashboard, agregado no banco.
+-- Uma linha por casa da obra: contagens {etapa: [concluídos, em execução]}
+-- e o updated_at mais novo das linhas de estado_servicos dela. O app usa a
+-- função para a carga do resumo em memória (resumo.py) e, entre as cargas,
+-- para reagregar só as casas alteradas (p_casas). Em páginas de p_limite
+-- casas a partir de casa_id > p_depois: o max-rows do PostgREST também vale
+-- para RPCs. Sem ela, o app agrega as linhas de estado_servicos ele mesmo.
+-- Executar uma vez no SQL Editor do Supabase.
+
+drop function if exists public.dashboard_resumo(bigint, text);
+
+create or replace function public.dashboard_resumo(p_obra_id bigint, p_casas bigint[] default null, p_depois bigint default 0, p_limite integer default 1000)
+returns table (
+    casa_id bigint,
+    contagens jsonb,
+    atualizado text
+)
+language sql
+stable
+as $$
+    with cs as (
+        select c.id
+        from casas c
+        where c.obra_id = p_obra_id
+          and c.id > p_depois
+          and (p_casas is null or c.id = any(p_casas))
+        order by c.id
+        limit p_limite
+    ),
+    por_etapa as (
+        select e.casa_id,
+               s.etapa,
+               count(*) filter (where e.status = 'Concluído') as concluidos,
+               count(*) filter (where e.status = 'Em execução') as em_exec,
+               max(e.updated_at) as atualizado
+        from cs
+        join estado_servicos e on e.casa_id = cs.id
+        join servicos s on s.id = e.servico_id and s.obra_id = p_obra_id
+        group by e.casa_id, s.etapa
+    )
+    select cs.id::bigint,
+           coalesce(jsonb_object_agg(p.etapa, jsonb_build_array(p.concluidos, p.em_exec)) filter (where p.etapa is not null), '{}'::jsonb),
+           max(p.atualizado)::text
+    from cs
+    left join por_etapa p on p.casa_id = cs.id
+    group by cs.id
+    order by cs.id;
+$$;
+
+create index if not exists ix_estado_servicos_casa on estado_servicos (casa_id);
+create index if not exists ix_estado_servicos_servico on estado_servicos (servico_id);
+create index if not exists ix_estado_servicos_servico_updated on estado_servicos (servico_id, updated_at);
+create index if not exists ix_casas_obra on casas (obra_id);
+
+grant execute on function public.dashboard_resumo(bigint, bigint[], bigint, integer) to anon, authenticated;
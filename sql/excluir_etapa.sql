@@ -0,0 +1,32 @@
+-- Exclui uma etapa da obra com tudo que depende dela, numa transação só:
+-- serviços da etapa (estados e lançamentos saem via ON DELETE CASCADE),
+-- ativações das casas da obra nessa etapa e o registro da etapa.
+-- Usada por excluir_etapa() em app.py. Executar uma vez no SQL Editor do Supabase.
+
+create or replace function public.excluir_etapa(p_obra_id bigint, p_etapa text)
+returns table (servicos integer, ativacoes integer, etapas integer)
+language plpgsql
+as $$
+declare
+    n_serv integer;
+    n_ativ integer;
+    n_etap integer;
+begin
+    delete from servicos s
+    where s.obra_id = p_obra_id and s.etapa = p_etapa;
+    get diagnostics n_serv = row_count;
+
+    delete from casa_ativacoes a
+    using casas c
+    where a.casa_id = c.id and c.obra_id = p_obra_id and a.etapa = p_etapa;
+    get diagnostics n_ativ = row_count;
+
+    delete from etapas e
+    where e.obra_id = p_obra_id and e.nome = p_etapa;
+    get diagnostics n_etap = row_count;
+
+    return query select n_serv, n_ativ, n_etap;
+end;
+$$;
+
+grant execute on function public.excluir_etapa(bigint, text) to anon, authenticated;
@@ -0,0 +1,11 @@
+-- Feed de alterações do Dashboard "ao vivo" (Supabase Realtime).
+-- Publica estado_servicos e casa_ativacoes no canal postgres_changes e grava
+-- a linha antiga completa nos DELETEs, para o app descontar do resumo sem
+-- recarregar a obra. Depois de executar, ligue DASH_TEMPO_REAL = true nos
+-- secrets do app.
+-- Executar uma vez no SQL Editor do Supabase.
+
+alter publication supabase_realtime add table public.estado_servicos, public.casa_ativacoes;
+
+alter table public.estado_servicos replica identity full;
+alter table public.casa_ativacoes replica identity full;
@@ -0,0 +1,35 @@
+-- Grava em uma única transação o estado dos serviços (upsert em
+-- estado_servicos) e os lançamentos correspondentes (insert em lancamentos).
+-- Usada por registrar_lancamentos() em app.py; sem ela o app faz 1 upsert + 1 insert.
+-- Colunas de data ausentes no JSON mantêm o valor atual do estado.
+-- Executar uma vez no SQL Editor do Supabase.
+
+create or replace function public.registrar_lancamentos(p_estados jsonb, p_lancamentos jsonb)
+returns table (servico_id bigint, lancamento_id bigint)
+language plpgsql
+as $$
+-- servico_id também é coluna de saída (returns table): sem isto o
+-- "on conflict (casa_id, servico_id)" falha com 42702 (referência ambígua)
+#variable_conflict use_column
+begin
+    insert into estado_servicos as es (casa_id, servico_id, status, executor, data_inicio, data_fim, updated_at)
+    select r.casa_id, r.servico_id, r.status, r.executor, r.data_inicio, r.data_fim, r.updated_at
+    from jsonb_populate_recordset(null::estado_servicos, p_estados) r
+    on conflict (casa_id, servico_id) do update set
+        status = excluded.status,
+        executor = excluded.executor,
+        data_inicio = coalesce(excluded.data_inicio, es.data_inicio),
+        data_fim = coalesce(excluded.data_fim, es.data_fim),
+        updated_at = excluded.updated_at;
+
+    return query
+    insert into lancamentos as l (obra_id, casa_id, servico_id, responsavel, executor, status,
+                                  data_inicio, data_conclusao, observacoes, foto_path, created_at)
+    select r.obra_id, r.casa_id, r.servico_id, r.responsavel, r.executor, r.status,
+           r.data_inicio, r.data_conclusao, r.observacoes, r.foto_path, r.created_at
+    from jsonb_populate_recordset(null::lancamentos, p_lancamentos) r
+    returning l.servico_id::bigint, l.id::bigint;
+end;
+$$;
+
+grant execute on function public.registrar_lancamentos(jsonb, jsonb) to anon, authenticated;